@@ -16,6 +16,9 @@ from datetime import datetime, timedelta
 import threading
 import numpy as np
 
+from canonical import canonicalize
+from metrics import timed
+
 #-------------------------------------------------------------------------#
 # Configuration
 #-------------------------------------------------------------------------#
@@ -49,6 +52,9 @@ _file_lock = threading.Lock()
 _analytics_data: Dict[str, List] = {"searches": []}
 _loaded = False
 
+# Bumped on every logged search so HTTP caches know trending may have changed
+_generation = 0
+
 
 def _load_analytics():
     """Load analytics data from file."""
@@ -100,31 +106,20 @@ def _encode_query(query: str) -> Optional[List[float]]:
     """
     try:
         # Import here to avoid circular dependency
-        from search import _model, _tokenizer, device
+        import encoder
+        from search import encode_query
         
-        if _model is None or _tokenizer is None:
+        if not encoder.is_ready():
             return None
         
-        # Tokenize and encode
-        import torch
-        inputs = _tokenizer(
-            [query],
-            return_tensors="pt",
-            padding=True,
-            truncation=True,
-            max_length=77
-        ).to(device)
-        
-        with torch.no_grad():
-            embedding = _model(**inputs).text_embeds[0]
-            # Normalize
-            embedding = embedding / embedding.norm()
-            return embedding.cpu().tolist()
+        # Usually a cache hit: the search that's being logged just encoded it
+        return encode_query(query).tolist()
     except Exception as e:
         print(f"Failed to encode query '{query}': {e}")
         return None
 
 
+@timed("analytics")
 def log_search(query: str, user: Optional[str] = None, result_count: int = 0):
     """
     Log a search query with cached embedding for semantic clustering.
@@ -135,9 +130,11 @@ def log_search(query: str, user: Optional[str] = None, result_count: int = 0):
         user: The user's netid (optional, None for anonymous)
         result_count: Number of results returned
     """
+    global _generation
+    
     _load_analytics()
     
-    normalized_query = query.strip().lower()
+    normalized_query = canonicalize(query) or query.strip().lower()
     
     # Encode query for semantic similarity (cached for trending clustering)
     embedding = _encode_query(query)
@@ -157,6 +154,7 @@ def log_search(query: str, user: Optional[str] = None, result_count: int = 0):
         entry["embedding"] = embedding
     
     _analytics_data["searches"].append(entry)
+    _generation += 1
     
     # Periodically save (every 10 searches)
     if len(_analytics_data["searches"]) % 10 == 0:
@@ -232,6 +230,7 @@ def _cluster_similar_queries(
     return clusters
 
 
+@timed("trending")
 def get_trending_searches(
     period: str = "week",
     limit: int = 10,
@@ -342,6 +341,11 @@ def get_search_stats() -> Dict[str, Any]:
     }
 
 
+def get_generation() -> int:
+    """Get a counter that changes whenever a search is logged."""
+    return _generation
+
+
 def flush():
     """Force save analytics data to disk."""
     _save_analytics()
@@ -0,0 +1,209 @@
+"""
+Attribute Scores
+Precomputed person x attribute similarity columns for a vocabulary of
+common attribute prompts ("glasses", "curly hair", "smiling").
+
+An offline job (tools/build_attributes.py) encodes the vocabulary once and
+stores, for every person, their similarity to each prompt. With the table
+loaded, search.py scores any query made only of vocabulary prompts (including
+weighted ones like "curly hair + glasses*2") from these columns without
+running the encoder or scanning the embedding matrix, and the `attributes`
+search filter keeps the people scoring in the top of each attribute's
+column.
+
+The table is tied to the embeddings file (by fingerprint) and the model it
+was built with; a table built for other data is ignored.
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from canonical import canonicalize
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+PERSISTENT_DIR = Path(__file__).parent / "persistent"
+
+ATTRIBUTE_SCORES_PATH = os.environ.get("ATTRIBUTE_SCORES_PATH", str(PERSISTENT_DIR / "attributes.npz"))
+
+# Optional JSON list of attribute prompts replacing DEFAULT_VOCABULARY
+ATTRIBUTE_VOCABULARY_PATH = os.environ.get("ATTRIBUTE_VOCABULARY_PATH")
+
+# A person "has" an attribute when they score at or above this percentile of its column
+ATTRIBUTE_PERCENTILE = float(os.environ.get("ATTRIBUTE_PERCENTILE", "80"))
+
+DEFAULT_VOCABULARY = [
+    "glasses", "sunglasses", "smiling", "serious expression",
+    "curly hair", "straight hair", "wavy hair", "long hair", "short hair",
+    "blonde hair", "red hair", "dark hair", "gray hair", "bald",
+    "braids", "ponytail", "bangs", "beard", "mustache", "freckles",
+    "earrings", "hat", "headscarf", "makeup",
+]
+
+
+def load_vocabulary() -> List[str]:
+    """The configured attribute prompts, canonicalized and deduplicated."""
+    vocabulary = DEFAULT_VOCABULARY
+    if ATTRIBUTE_VOCABULARY_PATH:
+        with open(ATTRIBUTE_VOCABULARY_PATH) as f:
+            vocabulary = json.load(f)
+    return list(dict.fromkeys(canonicalize(prompt) for prompt in vocabulary if canonicalize(prompt)))
+
+
+def normalize_names(names: Sequence[str]) -> Tuple[str, ...]:
+    """Canonical, sorted, deduplicated attribute names (for cache keys)."""
+    return tuple(sorted({canonicalize(name) for name in names if canonicalize(name)}))
+
+
+#-------------------------------------------------------------------------#
+# Table
+#-------------------------------------------------------------------------#
+
+class AttributeTable:
+    """
+    Score columns for one set of embeddings.
+    
+    scores is (attributes, people): each attribute's column is one
+    contiguous row, so using it is a single slice.
+    """
+    
+    __slots__ = ("names", "vectors", "scores", "thresholds", "meta", "_positions")
+
+    def __init__(self, names: List[str], vectors: np.ndarray, scores: np.ndarray,
+                 thresholds: np.ndarray, meta: Dict[str, object]):
+        self.names = names
+        self.vectors = vectors
+        self.scores = scores
+        self.thresholds = thresholds
+        self.meta = meta
+        self._positions = {name: i for i, name in enumerate(names)}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._positions
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def tag(self) -> str:
+        """Identifies this build, for keys of rankings that used it."""
+        return str(self.meta.get("built_at", 0))
+
+    def vector(self, name: str) -> np.ndarray:
+        """The stored normalized prompt embedding."""
+        return self.vectors[self._positions[name]]
+
+    def similarities(self, prompts: List[Tuple[str, float]]) -> np.ndarray:
+        """
+        Similarity of every person to a weighted sum of vocabulary prompts.
+        
+        Equal to scoring the normalized combined prompt vector against the
+        embedding matrix, since the dot product is linear.
+        """
+        if len(prompts) == 1 and prompts[0][1] > 0:
+            return self.scores[self._positions[prompts[0][0]]]
+        
+        rows = [self._positions[text] for text, _ in prompts]
+        weights = np.array([weight for _, weight in prompts], dtype=np.float32)
+        norm = np.linalg.norm(weights @ self.vectors[rows])
+        combined = weights @ self.scores[rows]
+        return combined / norm if norm > 0 else combined
+
+    def mask(self, names: Sequence[str]) -> np.ndarray:
+        """People at or above the threshold of every named attribute (unknown names match nobody)."""
+        mask = np.ones(self.scores.shape[1], dtype=bool)
+        for name in names:
+            position = self._positions.get(name)
+            if position is None:
+                return np.zeros(self.scores.shape[1], dtype=bool)
+            mask &= self.scores[position] >= self.thresholds[position]
+        return mask
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "attributes": len(self.names),
+            "bytes": int(self.scores.nbytes + self.vectors.nbytes),
+            "percentile": self.meta.get("percentile"),
+            "built_at": self.meta.get("built_at"),
+        }
+
+
+def build(embeddings_normalized: np.ndarray, vocabulary: List[str], encode_texts,
+          percentile: float = ATTRIBUTE_PERCENTILE, fingerprint: Optional[str] = None,
+          model: Optional[str] = None) -> AttributeTable:
+    """
+    Encode a vocabulary and score every person against it.
+    
+    Args:
+        embeddings_normalized: The index's normalized embedding matrix
+        vocabulary: Canonical attribute prompts
+        encode_texts: Function returning normalized embeddings for texts
+        percentile: Column percentile a person must reach to "have" an attribute
+        fingerprint, model: What the table is valid for (checked on load)
+    """
+    vectors = np.asarray(encode_texts(vocabulary), dtype=np.float32)
+    scores = np.ascontiguousarray((embeddings_normalized @ vectors.T).T, dtype=np.float32)
+    thresholds = np.percentile(scores, percentile, axis=1).astype(np.float32)
+    meta = {
+        "fingerprint": fingerprint,
+        "model": model,
+        "people": int(embeddings_normalized.shape[0]),
+        "percentile": percentile,
+        "built_at": int(time.time()),
+    }
+    return AttributeTable(list(vocabulary), vectors, scores, thresholds, meta)
+
+
+def save(table: AttributeTable, path: str = ATTRIBUTE_SCORES_PATH):
+    """Write a table atomically (readers never see a partial file)."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    temp_path = f"{path}.tmp.npz"
+    np.savez(
+        temp_path,
+        names=np.array(table.names),
+        vectors=table.vectors,
+        scores=table.scores,
+        thresholds=table.thresholds,
+        meta=np.array(json.dumps(table.meta))
+    )
+    os.replace(temp_path, path)
+
+
+def load(fingerprint: Optional[str], model: Optional[str], people: int,
+         path: str = ATTRIBUTE_SCORES_PATH) -> Optional[AttributeTable]:
+    """
+    Load the stored table if it was built for this data and model.
+    
+    Returns:
+        The table, or None if there is none or it is stale
+    """
+    if not os.path.exists(path):
+        return None
+    
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if (meta.get("fingerprint") != fingerprint or meta.get("model") != model
+                    or meta.get("people") != people):
+                print(f"Ignoring {path}: built for other embeddings or model "
+                      f"(rerun tools/build_attributes.py)")
+                return None
+            table = AttributeTable(
+                [str(name) for name in data["names"]],
+                data["vectors"],
+                data["scores"],
+                data["thresholds"],
+                meta
+            )
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Failed to load attribute scores from {path}: {e}")
+        return None
+    
+    print(f"Loaded {len(table)} attribute score columns")
+    return table
@@ -3,20 +3,36 @@ Yale CAS Authentication Module
 """
 
 import os
-from typing import Optional
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+from xml.etree import ElementTree
 from fastapi import HTTPException, Request
+import httpx
 import jwt
 from datetime import datetime, timedelta
 
+from metrics import timed, record_cache
+
 # CAS Configuration
-CAS_SERVER = "https://secure.its.yale.edu/cas"
+CAS_SERVER = os.environ.get("CAS_SERVER", "https://secure.its.yale.edu/cas")
 CAS_VERSION = 3
+CAS_TIMEOUT_SECONDS = float(os.environ.get("CAS_TIMEOUT_SECONDS", "10"))
+# Ticket validations in flight at once; more wait their turn
+CAS_MAX_CONCURRENCY = int(os.environ.get("CAS_MAX_CONCURRENCY", "20"))
+CAS_NAMESPACE = "{http://www.yale.edu/tp/cas}"
 
 # JWT Configuration
 JWT_SECRET = os.environ.get("JWT_SECRET", "dev-secret-change-in-production")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Verified tokens remembered so repeat requests skip the HMAC check
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "4096"))
+
 # Application URLs (will be set from environment)
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:3000")
 BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8000")
@@ -24,6 +40,13 @@ BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8000")
 # Development mode (bypasses CAS authentication)
 DEV_MODE = os.environ.get("DEV_MODE", "true").lower() == "true"
 
+# NetIDs allowed to use admin endpoints (comma-separated)
+ADMIN_NETIDS = {
+    netid.strip()
+    for netid in os.environ.get("ADMIN_NETIDS", "").split(",")
+    if netid.strip()
+}
+
 
 def create_access_token(netid: str) -> str:
     """Create a JWT token for authenticated user."""
@@ -36,20 +59,76 @@ def create_access_token(netid: str) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
-def verify_token(token: str) -> Optional[str]:
-    """Verify JWT token and return netid if valid."""
+#-------------------------------------------------------------------------#
+# Token Verification
+#-------------------------------------------------------------------------#
+
+# Token digest -> (netid, exp timestamp), least recently used first
+_token_cache: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+
+def _decode_token(token: str) -> Optional[Tuple[str, float]]:
+    """Fully verify a JWT. Returns (netid, exp) or None if invalid or expired."""
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        netid: str = payload.get("sub")
-        return netid
     except jwt.ExpiredSignatureError:
         return None
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
+        return None
+    
+    netid = payload.get("sub")
+    if not netid:
+        return None
+    return netid, float(payload.get("exp", 0))
+
+
+def verify_token(token: str) -> Optional[str]:
+    """
+    Verify JWT token and return netid if valid.
+    
+    Tokens that verified before are looked up by digest (raw tokens are not
+    kept) and only re-checked against their expiry. Invalid tokens are never
+    cached, so they always get the full check.
+    """
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    
+    with _token_cache_lock:
+        cached = _token_cache.get(digest)
+        if cached is not None:
+            if cached[1] > time.time():
+                _token_cache.move_to_end(digest)
+                record_cache("token", True)
+                return cached[0]
+            del _token_cache[digest]
+    
+    record_cache("token", False)
+    verified = _decode_token(token)
+    if verified is None:
         return None
+    
+    if TOKEN_CACHE_SIZE > 0:
+        with _token_cache_lock:
+            _token_cache[digest] = verified
+            while len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    
+    return verified[0]
 
 
-def get_current_user(request: Request) -> str:
-    """Get current authenticated user from request."""
+def clear_token_cache():
+    """Forget all verified tokens."""
+    with _token_cache_lock:
+        _token_cache.clear()
+
+
+async def get_current_user(request: Request) -> str:
+    """
+    Get current authenticated user from request.
+    
+    Async so FastAPI calls it inline instead of handing it to the thread
+    pool; verification is cached and never blocks.
+    """
     # DEV MODE: Skip authentication for testing
     if DEV_MODE:
         return "dev_user"
@@ -64,13 +143,107 @@ def get_current_user(request: Request) -> str:
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    netid = verify_token(token)
+    with timed("auth"):
+        netid = verify_token(token)
     if not netid:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
     return netid
 
 
+async def get_admin_user(request: Request) -> str:
+    """Get current user and require them to be an admin."""
+    netid = await get_current_user(request)
+    
+    # DEV MODE: Every request is an admin
+    if DEV_MODE:
+        return netid
+    
+    if netid not in ADMIN_NETIDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return netid
+
+
+#-------------------------------------------------------------------------#
+# CAS Ticket Validation
+#-------------------------------------------------------------------------#
+
+_cas_client: Optional[httpx.AsyncClient] = None
+_cas_semaphore: Optional[asyncio.Semaphore] = None
+
+
+async def start_cas_client(transport: Optional[httpx.AsyncBaseTransport] = None):
+    """
+    Open the pooled HTTP client used for ticket validation.
+    
+    Called from the app lifespan. `transport` lets tests point the client at
+    an in-process stub CAS app (see tools/stub_cas.py).
+    """
+    global _cas_client, _cas_semaphore
+    
+    await close_cas_client()
+    _cas_client = httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(CAS_TIMEOUT_SECONDS, connect=min(CAS_TIMEOUT_SECONDS, 3.0)),
+        limits=httpx.Limits(
+            max_connections=CAS_MAX_CONCURRENCY,
+            max_keepalive_connections=CAS_MAX_CONCURRENCY
+        )
+    )
+    _cas_semaphore = asyncio.Semaphore(CAS_MAX_CONCURRENCY)
+
+
+async def close_cas_client():
+    """Close the ticket validation client (app shutdown)."""
+    global _cas_client
+    
+    if _cas_client is not None:
+        await _cas_client.aclose()
+        _cas_client = None
+
+
+def parse_cas_response(body: bytes) -> Optional[str]:
+    """
+    Extract the netid from a CAS serviceValidate response.
+    
+    Returns None for authenticationFailure or anything unparseable.
+    """
+    try:
+        root = ElementTree.fromstring(body)
+    except ElementTree.ParseError:
+        return None
+    
+    user = root.find(f"{CAS_NAMESPACE}authenticationSuccess/{CAS_NAMESPACE}user")
+    if user is None or not (user.text or "").strip():
+        return None
+    return user.text.strip()
+
+
+async def validate_cas_ticket(ticket: str, service_url: str) -> Optional[str]:
+    """
+    Validate a CAS service ticket without blocking the event loop.
+    
+    Returns:
+        The netid, or None if CAS rejected the ticket
+    
+    Raises:
+        httpx.HTTPError: If CAS could not be reached or returned an error status
+    """
+    if _cas_client is None:
+        await start_cas_client()
+    
+    async with _cas_semaphore:
+        with timed("cas"):
+            response = await _cas_client.get(
+                f"{CAS_SERVER}/serviceValidate",
+                params={"ticket": ticket, "service": service_url}
+            )
+    response.raise_for_status()
+    
+    return parse_cas_response(response.content)
+
+
 def get_cas_login_url(service_url: str) -> str:
     """Generate CAS login URL."""
     return f"{CAS_SERVER}/login?service={service_url}"
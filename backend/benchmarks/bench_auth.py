@@ -0,0 +1,91 @@
+"""
+Auth Benchmark
+Per-request cost of authenticating a token: full JWT verification versus the
+verified-token cache, and a sync dependency run through the thread pool (as
+FastAPI does for `def` dependencies) versus an async one called inline.
+
+Usage (from backend/):
+    python benchmarks/bench_auth.py [--repeat 20000]
+
+Prints one JSON object per benchmark with microseconds per call.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["DEV_MODE"] = "false"
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+import auth
+
+
+def per_call_us(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+async def per_await_us(make_awaitable, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await make_awaitable()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def make_request(token: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/search",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    })
+
+
+async def bench_dependency(token: str, repeat: int) -> dict:
+    request = make_request(token)
+    
+    def sync_dependency():
+        # The pre-cache dependency: full verification, run in the thread pool
+        return auth._decode_token(token)
+    
+    threadpool_us = await per_await_us(lambda: run_in_threadpool(sync_dependency), repeat)
+    inline_us = await per_await_us(lambda: auth.get_current_user(request), repeat)
+    return {
+        "benchmark": "auth_dependency",
+        "sync_threadpool_uncached_us": round(threadpool_us, 2),
+        "async_inline_cached_us": round(inline_us, 2),
+        "saving_us": round(threadpool_us - inline_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+    
+    token = auth.create_access_token("abc123")
+    assert auth.verify_token(token) == "abc123"
+    
+    decode_us = per_call_us(lambda: auth._decode_token(token), args.repeat)
+    cached_us = per_call_us(lambda: auth.verify_token(token), args.repeat)
+    print(json.dumps({
+        "benchmark": "verify_token",
+        "jwt_decode_us": round(decode_us, 2),
+        "cached_us": round(cached_us, 2),
+        "speedup": round(decode_us / cached_us, 1),
+    }))
+    
+    print(json.dumps(asyncio.run(bench_dependency(token, args.repeat // 4))))
+
+
+if __name__ == "__main__":
+    main()
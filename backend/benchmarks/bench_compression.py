@@ -0,0 +1,78 @@
+"""
+Compression Benchmark
+Measures response size and compression CPU per request for search-sized
+bodies, and compares compressing on every request with serving a payload
+that was precompressed once.
+
+Usage (from backend/):
+    python benchmarks/bench_compression.py [--people 6000] [--repeat 200]
+
+Prints one JSON object per (payload, encoding).
+"""
+
+import os
+import sys
+import json
+import timeit
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serialization import make_people
+from responses import render_object
+from compression import COMPRESSION_ENCODINGS, compress, precompress
+
+
+def search_body(people, k: int) -> bytes:
+    rng = np.random.default_rng(k)
+    indices = rng.choice(len(people), size=k, replace=False).tolist()
+    scores = rng.random(k).astype(np.float32).tolist()
+    return render_object(
+        {"query": "curly hair and glasses", "count": k, "search_type": "text",
+         "filters": {"college": None, "year": None, "major": None}},
+        raw={"results": people.results_json(indices, scores)}
+    )
+
+
+def bench(name: str, body: bytes, repeat: int) -> list:
+    rows = []
+    for encoding in COMPRESSION_ENCODINGS:
+        per_request = min(timeit.repeat(lambda: compress(body, encoding),
+                                        number=repeat, repeat=5)) / repeat
+        variants = precompress(body)
+        cached = min(timeit.repeat(lambda: variants.get(encoding),
+                                   number=repeat, repeat=5)) / repeat
+        compressed = compress(body, encoding)
+        rows.append({
+            "benchmark": "compression",
+            "payload": name,
+            "encoding": encoding,
+            "raw_bytes": len(body),
+            "compressed_bytes": len(compressed),
+            "ratio": round(len(body) / len(compressed), 2),
+            "compress_us_per_request": round(per_request * 1e6, 2),
+            "precompressed_us_per_request": round(cached * 1e6, 3),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--people", type=int, default=6000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    
+    people = make_people(args.people)
+    payloads = {
+        "search_k20": search_body(people, 20),
+        "search_k50": search_body(people, 50),
+        "filters": json.dumps(people.filter_options()).encode(),
+    }
+    for name, body in payloads.items():
+        for row in bench(name, body, args.repeat):
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Search Benchmark
+Micro-benchmarks for the search path on synthetic directories: text search
+(cached and uncached), name lookups, attribute-column queries, find_similar,
+filtering, top-k selection, the result cache and trending-query clustering.
+
+Usage (from backend/):
+    python benchmarks/bench_search.py [--people 10000 100000] [--repeat 50]
+
+Prints one JSON object per (benchmark, people) with latency percentiles in
+microseconds, so runs can be saved and diffed across changes.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import DEFAULT_DIM, StubEncoder, install, make_queries
+
+
+def measure(fn, repeat: int, warmup: int = 3) -> dict:
+    """Run fn repeatedly and summarize per-call latency in microseconds."""
+    for _ in range(warmup):
+        fn()
+    
+    samples = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples[i] = time.perf_counter() - start
+    
+    samples *= 1e6
+    return {
+        "repeat": repeat,
+        "mean_us": round(float(samples.mean()), 2),
+        "p50_us": round(float(np.percentile(samples, 50)), 2),
+        "p95_us": round(float(np.percentile(samples, 95)), 2),
+        "p99_us": round(float(np.percentile(samples, 99)), 2),
+    }
+
+
+def run(n: int, dim: int, repeat: int) -> list:
+    import search
+    import analytics
+    import attributes
+    
+    people = install(n, dim)
+    index = search._get_index()
+    queries = make_queries(repeat, seed=n)
+    person_ids = [people.ids[i] for i in np.random.default_rng(n).integers(n, size=repeat)]
+    names = [f"{people.first_name[i]} {people.last_name[i]}"
+             for i in np.random.default_rng(n + 1).integers(n, size=repeat)]
+    # Last name still being typed
+    partial_names = [name[:name.index(" ") + 4] for name in names]
+    college = people.colleges[0]
+    year = int(people.years[0])
+    
+    counter = {"i": 0}
+    
+    def next_item(items):
+        counter["i"] += 1
+        return items[counter["i"] % len(items)]
+    
+    similarities = np.dot(index.embeddings_normalized, index.embeddings_normalized[0])
+    candidates = search._top_candidates(similarities, search.CANDIDATE_POOL_SIZE)
+    cache_keys = [f"bench-{i}" for i in range(search.CACHE_MAX_SIZE * 2)]
+    
+    # Trending clustering works on a few hundred distinct recent queries
+    encoder = StubEncoder(dim)
+    distinct = sorted(set(make_queries(2000, seed=1, distinct=300)))
+    embeddings = [(v / np.linalg.norm(v)).tolist() for v in map(encoder, distinct)]
+    counts = {q: 1 + i % 7 for i, q in enumerate(distinct)}
+    
+    benchmarks = {
+        "search_uncached": lambda: search.search_hits(next_item(queries), k=20, use_cache=False),
+        "search_cached": lambda: search.search_hits(queries[0], k=20),
+        "search_filtered_uncached": lambda: search.search_hits(
+            next_item(queries), k=20, college=college, year=year, use_cache=False),
+        "search_to_json": lambda: search.search_hits(queries[0], k=20).to_json(),
+        "range_search": lambda: search.range_search_hits(next_item(queries), 0.0, limit=200),
+        "range_search_full_scan": lambda: search.range_search_hits(next_item(queries), 0.9, limit=200),
+        "search_name_uncached": lambda: search.search_hits(next_item(names), k=20, use_cache=False),
+        "lexical_lookup": lambda: index.lexical.lookup(next_item(names)),
+        "lexical_prefix_lookup": lambda: index.lexical.lookup(next_item(partial_names)),
+        "find_similar": lambda: search.find_similar_hits(next_item(person_ids), k=10),
+        "filter_mask": lambda: people.filter_mask(college, year, None),
+        "facet_counts": lambda: people.facet_counts(np.flatnonzero(similarities >= 0)),
+        "search_facets_uncached": lambda: search.search_hits(
+            next_item(queries), k=20, facet_min_score=0.1, use_cache=False),
+        "top_candidates": lambda: search._top_candidates(similarities, search.CANDIDATE_POOL_SIZE),
+        "cache_set": lambda: search._set_cache(next_item(cache_keys), candidates, index.generation),
+        "cache_get": lambda: search._get_from_cache(next_item(cache_keys), index.generation),
+        "cluster_similar_queries": lambda: analytics._cluster_similar_queries(
+            distinct, embeddings, counts),
+    }
+    
+    rows = []
+    for name, fn in benchmarks.items():
+        result = measure(fn, repeat if name != "cluster_similar_queries" else max(3, repeat // 10))
+        rows.append(dict({"benchmark": name, "people": n, "dim": dim}, **result))
+    
+    # Attribute-composed queries served from precomputed score columns
+    index.attributes = attributes.build(index.embeddings_normalized, attributes.DEFAULT_VOCABULARY,
+                                        search.encoder.encode_texts)
+    attribute_queries = ["glasses", "curly hair + glasses*2", "smiling - beard", "long hair + earrings"]
+    result = measure(lambda: search.search_hits(next_item(attribute_queries), k=20, use_cache=False), repeat)
+    rows.append(dict({"benchmark": "search_attribute_uncached", "people": n, "dim": dim}, **result))
+    index.attributes = None
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--people", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    
+    for n in args.people:
+        # Keep stdout machine-readable; module logging goes to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            rows = run(n, args.dim, args.repeat)
+        for row in rows:
+            print(json.dumps(row), flush=True)
+
+
+if __name__ == "__main__":
+    main()
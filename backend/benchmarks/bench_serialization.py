@@ -0,0 +1,101 @@
+"""
+Serialization Benchmark
+Compares the cost of building a search response body the old way (result
+dicts encoded by FastAPI's JSONResponse) with splicing pre-serialized person
+fragments into the envelope.
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py [--people 6000] [--repeat 2000]
+
+Prints one JSON object per k with microseconds per response.
+"""
+
+import os
+import sys
+import json
+import timeit
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from people import PersonTable
+from responses import render_object, orjson
+
+
+def make_people(n: int, seed: int = 0) -> PersonTable:
+    """Synthetic directory records with realistic field shapes."""
+    rng = np.random.default_rng(seed)
+    colleges = ["Berkeley", "Branford", "Davenport", "Ezra Stiles", "Grace Hopper",
+                "Jonathan Edwards", "Morse", "Pauli Murray", "Pierson", "Saybrook"]
+    majors = ["Computer Science", "Economics", "History", "Molecular Biology", None]
+    records = []
+    for i in range(n):
+        records.append({
+            "id": 100000 + i,
+            "first_name": f"First{i}",
+            "last_name": f"Last{i}",
+            "image": f"https://yalies.io/api/image/{rng.integers(1 << 40):x}.jpg",
+            "college": colleges[i % len(colleges)],
+            "year": 2025 + i % 4,
+            "major": majors[i % len(majors)],
+            "email": f"first.last{i}@yale.edu",
+        })
+    return PersonTable.from_records(records)
+
+
+def bench(people: PersonTable, k: int, repeat: int) -> dict:
+    rng = np.random.default_rng(k)
+    indices = rng.choice(len(people), size=k, replace=False).tolist()
+    scores = rng.random(k).astype(np.float32).tolist()
+    envelope = {
+        "query": "curly hair and glasses",
+        "count": k,
+        "search_type": "text",
+        "filters": {"college": None, "year": None, "major": None},
+    }
+
+    def dict_path():
+        results = people.rows(indices)
+        for row, score in zip(results, scores):
+            row["score"] = score
+        JSONResponse(jsonable_encoder(dict(envelope, results=results))).body
+
+    def fragment_path():
+        render_object(envelope, raw={"results": people.results_json(indices, scores)})
+    
+    # Both paths must produce the same document
+    body = dict(envelope, results=people.rows(indices))
+    for row, score in zip(body["results"], scores):
+        row["score"] = score
+    spliced = render_object(envelope, raw={"results": people.results_json(indices, scores)})
+    assert json.loads(spliced) == body
+    
+    dict_us = min(timeit.repeat(dict_path, number=repeat, repeat=5)) / repeat * 1e6
+    fragment_us = min(timeit.repeat(fragment_path, number=repeat, repeat=5)) / repeat * 1e6
+    return {
+        "benchmark": "serialization",
+        "k": k,
+        "dict_jsonresponse_us": round(dict_us, 2),
+        "fragment_splice_us": round(fragment_us, 2),
+        "speedup": round(dict_us / fragment_us, 2),
+        "bytes": len(spliced),
+        "orjson": orjson is not None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--people", type=int, default=6000)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    
+    people = make_people(args.people)
+    for k in (10, 20, 50):
+        print(json.dumps(bench(people, k, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
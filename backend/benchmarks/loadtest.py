@@ -0,0 +1,161 @@
+"""
+Load Test
+Drives the FastAPI app in-process with concurrent clients against a
+synthetic directory and reports throughput and latency percentiles.
+
+Requests go through the full ASGI stack (middleware, auth, moderation,
+serialization) via httpx's ASGI transport, with CAS and moderation in dev
+mode and the stub encoder in place of CLIP.
+
+Usage (from backend/):
+    python benchmarks/loadtest.py [--people 10000] [--concurrency 16]
+        [--requests 2000] [--encoder-ms 30] [--mix search=8,similar=1,filters=1]
+
+Prints one JSON object with the run parameters, overall and per-endpoint
+latency percentiles in milliseconds, and mean time per search stage.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Must be set before the app modules read their configuration
+os.environ.setdefault("DEV_MODE", "true")
+os.environ.setdefault("DISABLE_MODERATION", "true")
+# Every dev-mode request is the same user, so per-user limits would throttle the run
+os.environ.setdefault("SEARCH_RATE_PER_MINUTE", "0")
+os.environ.setdefault("SIMILAR_RATE_PER_MINUTE", "0")
+
+import httpx
+
+from synthetic import DEFAULT_DIM, install, make_queries
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 2),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def make_requests(count: int, mix: dict, people, seed: int = 0) -> list:
+    """Build the (endpoint, path, params) sequence clients will replay."""
+    rng = np.random.default_rng(seed)
+    names = list(mix)
+    weights = np.array([mix[name] for name in names])
+    queries = make_queries(count, seed)
+    requests = []
+    for i, pick in enumerate(rng.choice(len(names), size=count, p=weights / weights.sum())):
+        name = names[pick]
+        if name == "search":
+            requests.append((name, "/api/search", {"q": queries[i], "k": 20, "anonymous": "true"}))
+        elif name == "similar":
+            person_id = people.ids[int(rng.integers(len(people)))]
+            requests.append((name, f"/api/similar/{person_id}", {"k": 10}))
+        elif name == "filters":
+            requests.append((name, "/api/filters", {}))
+        elif name == "trending":
+            requests.append((name, "/api/trending", {}))
+        else:
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+    return requests
+
+
+async def run(args) -> dict:
+    people = install(args.people, args.dim, delay_ms=args.encoder_ms)
+    
+    # Imported after the synthetic index is installed so startup never loads CLIP
+    import main
+    from metrics import STAGE_SECONDS
+    
+    requests = make_requests(args.requests, parse_mix(args.mix), people)
+    latencies = {}
+    statuses = {}
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        async def worker():
+            while not queue.empty():
+                name, path, params = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.get(path, params=params)
+                elapsed = time.perf_counter() - start
+                latencies.setdefault(name, []).append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        duration = time.perf_counter() - start
+    
+    all_latencies = [value for values in latencies.values() for value in values]
+    stages = {
+        labels[0]: round(values[-1] / sum(values[:-1]) * 1000, 3)
+        for labels, values in sorted(STAGE_SECONDS._values.items())
+        if sum(values[:-1])
+    }
+    return {
+        "benchmark": "loadtest",
+        "people": args.people,
+        "dim": args.dim,
+        "concurrency": args.concurrency,
+        "encoder_ms": args.encoder_ms,
+        "mix": args.mix,
+        "requests": len(all_latencies),
+        "seconds": round(duration, 3),
+        "throughput_rps": round(len(all_latencies) / duration, 1),
+        "status": {str(code): count for code, count in sorted(statuses.items())},
+        "latency": percentiles(all_latencies),
+        "endpoints": {name: percentiles(values) for name, values in sorted(latencies.items())},
+        "stage_mean_ms": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--people", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--encoder-ms", type=float, default=30.0,
+                        help="Simulated encoder latency per uncached query")
+    parser.add_argument("--mix", default="search=8,similar=1,filters=1",
+                        help="Endpoint weights: search, similar, filters, trending")
+    parser.add_argument("--out", help="Also write the result to this file")
+    args = parser.parse_args()
+    
+    # Keep stdout machine-readable; the app's request logging goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        result = asyncio.run(run(args))
+    print(json.dumps(result))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Synthetic Directory
+Generates embedding matrices, embeddings files and a stub text encoder so the
+benchmarks and load tests run without the real directory or CLIP weights.
+
+Embeddings are drawn around a few hundred cluster centres so similarity
+scores have a realistic spread, and the stub encoder maps each query word to
+a fixed random vector, so queries sharing words land close together (which
+matters for trending-query clustering).
+
+Usage (from backend/):
+    python benchmarks/synthetic.py data/synthetic.json --people 10000
+
+Writes an embeddings file in the same format as yalie_embedding.json.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serialization import make_people
+
+# CLIP ViT-L/14 projection size
+DEFAULT_DIM = 768
+
+QUERY_WORDS = [
+    "curly", "straight", "red", "blonde", "dark", "long", "short", "hair",
+    "glasses", "smile", "beard", "tall", "athletic", "freckles", "earrings",
+    "looks", "like", "friendly", "serious", "artistic", "person", "guy", "girl",
+    "with", "and", "big", "bright", "eyes", "style", "vibes", "crew", "library",
+]
+
+
+def make_embeddings(n: int, dim: int = DEFAULT_DIM, seed: int = 0,
+                    clusters: int = 256, chunk: int = 65536) -> np.ndarray:
+    """
+    Clustered float32 embeddings (not normalized).
+    
+    Built in chunks so 1M x 768 never needs a float64 temporary.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    embeddings = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        assignment = rng.integers(clusters, size=stop - start)
+        noise = rng.standard_normal((stop - start, dim), dtype=np.float32)
+        embeddings[start:stop] = centres[assignment] + 0.8 * noise
+    return embeddings
+
+
+def write_embeddings_file(path: str, n: int, dim: int = DEFAULT_DIM, seed: int = 0):
+    """Write an embeddings JSON file, streaming one record at a time."""
+    embeddings = make_embeddings(n, dim, seed)
+    people = make_people(n, seed)
+    with open(path, "w") as f:
+        f.write("[")
+        for i in range(n):
+            record = people.row(i)
+            record["embedding"] = [round(float(x), 5) for x in embeddings[i]]
+            f.write(("," if i else "") + json.dumps(record))
+        f.write("]")
+
+
+class StubEncoder:
+    """
+    Deterministic stand-in for the CLIP text encoder.
+    
+    Args:
+        dim: Output dimension (must match the embeddings)
+        delay_ms: Simulated encoder latency; CLIP on CPU is tens of milliseconds
+    """
+
+    def __init__(self, dim: int = DEFAULT_DIM, delay_ms: float = 0.0):
+        self.dim = dim
+        self.delay = delay_ms / 1000.0
+        self._words = {}
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._words.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.md5(word.encode()).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            self._words[word] = vector
+        return vector
+
+    def __call__(self, query: str) -> np.ndarray:
+        if self.delay:
+            time.sleep(self.delay)
+        words = query.lower().split() or [""]
+        return np.sum([self._word_vector(word) for word in words], axis=0)
+
+
+def make_queries(count: int, seed: int = 0, distinct: int = 200) -> list:
+    """
+    A query stream with a Zipf-like popularity skew.
+    
+    `distinct` different queries are generated; a few popular ones repeat
+    often, like real trending searches, so caches see realistic hit rates.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = [
+        " ".join(rng.choice(QUERY_WORDS, size=rng.integers(1, 5), replace=False))
+        for _ in range(distinct)
+    ]
+    weights = 1.0 / np.arange(1, distinct + 1)
+    picks = rng.choice(distinct, size=count, p=weights / weights.sum())
+    return [vocabulary[i] for i in picks]
+
+
+def install(n: int, dim: int = DEFAULT_DIM, seed: int = 0, delay_ms: float = 0.0):
+    """
+    Load a synthetic directory and the stub encoder into the search module.
+    
+    Returns:
+        The installed PersonTable
+    """
+    import search
+    
+    people = make_people(n, seed)
+    search.set_text_encoder(StubEncoder(dim, delay_ms))
+    search.load_index(make_embeddings(n, dim, seed), people, source_path=f"<synthetic {n}>")
+    return people
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("path")
+    parser.add_argument("--people", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    start = time.time()
+    write_embeddings_file(args.path, args.people, args.dim, args.seed)
+    print(json.dumps({
+        "path": args.path,
+        "people": args.people,
+        "dim": args.dim,
+        "bytes": os.path.getsize(args.path),
+        "seconds": round(time.time() - start, 2),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+"""
+Cache Backends
+Key/value stores behind the search and moderation caches, so a result cached
+by one worker can serve every worker.
+
+Values are bytes with a TTL. Three implementations:
+    memory://                    per-process LRU (the default; nothing shared)
+    sqlite:////path/to/cache.db  one file shared by the workers on a host
+    redis://[:password@]host:port/db
+                                 any Redis-protocol server, for several hosts
+
+Set SHARED_CACHE_URL to pick one. tools/fake_redis.py is a small in-process
+Redis stand-in for trying the redis backend locally.
+
+Backend failures are logged and treated as misses; a cache outage never fails
+a request.
+"""
+
+import os
+import time
+import socket
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, unquote
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+SHARED_CACHE_URL = os.environ.get("SHARED_CACHE_URL", "memory://")
+
+# Entries kept by the sqlite backend (Redis uses its own maxmemory policy)
+SHARED_CACHE_MAX_ENTRIES = int(os.environ.get("SHARED_CACHE_MAX_ENTRIES", "50000"))
+
+# Seconds to wait on the redis server before treating a call as a miss
+SHARED_CACHE_TIMEOUT = float(os.environ.get("SHARED_CACHE_TIMEOUT", "0.25"))
+
+# Keys are prefixed so several apps can share one server
+KEY_PREFIX = os.environ.get("SHARED_CACHE_PREFIX", "yaliesearch:")
+
+
+#-------------------------------------------------------------------------#
+# Interface
+#-------------------------------------------------------------------------#
+
+class CacheBackend(ABC):
+    """
+    Bytes key/value store with per-entry TTL.
+    
+    `shared` is True when entries are visible to other worker processes.
+    """
+    
+    shared = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """The stored value, or None if missing, expired or unreachable."""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float):
+        """Store a value for ttl seconds."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove one entry."""
+
+    @abstractmethod
+    def clear(self):
+        """Delete every entry this app stored."""
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": type(self).__name__, "shared": self.shared}
+
+
+#-------------------------------------------------------------------------#
+# In-Process
+#-------------------------------------------------------------------------#
+
+class MemoryCache(CacheBackend):
+    """Per-process LRU with expiry."""
+
+    def __init__(self, max_entries: int = SHARED_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, object]:
+        return {**super().stats(), "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+#-------------------------------------------------------------------------#
+# SQLite (one host)
+#-------------------------------------------------------------------------#
+
+class SQLiteCache(CacheBackend):
+    """
+    Entries in a SQLite file (WAL mode) that every worker on the host opens.
+    
+    Reads don't write: hits are remembered in memory and their `used` time
+    (for LRU pruning) is written in batches, so reads from several workers
+    don't queue on the writer lock.
+    """
+    
+    shared = True
+    
+    # Writes between size checks
+    PRUNE_EVERY = 500
+    
+    # Read hits buffered before their recency is written, and the longest they wait
+    TOUCH_BATCH = 64
+    TOUCH_FLUSH_SECONDS = 30.0
+
+    def __init__(self, path: str, max_entries: int = SHARED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._touched: Dict[str, float] = {}
+        self._touch_lock = threading.Lock()
+        self._last_flush = time.time()
+        
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires REAL NOT NULL,
+                used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_used ON entries(used)")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get a thread-local database connection."""
+        if getattr(self._local, "connection", None) is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.connection = conn
+        return self._local.connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires >= ?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        
+        with self._touch_lock:
+            self._touched[key] = now
+            due = len(self._touched) >= self.TOUCH_BATCH or now - self._last_flush >= self.TOUCH_FLUSH_SECONDS
+        if due:
+            try:
+                self._write_touches(conn)
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Shared cache write failed: {e}")
+        return row[0]
+
+    def _write_touches(self, conn: sqlite3.Connection):
+        """Write buffered hit times (the caller commits)."""
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+            self._last_flush = time.time()
+        if touched:
+            conn.executemany("UPDATE entries SET used = ? WHERE key = ?",
+                             [(used, key) for key, used in touched.items()])
+
+    def set(self, key: str, value: bytes, ttl: float):
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires, used) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            self._write_touches(conn)
+            self._writes += 1
+            if self._writes >= self.PRUNE_EVERY:
+                self._writes = 0
+                self._prune(conn, now)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Shared cache write failed: {e}")
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then the least recently used beyond max_entries."""
+        conn.execute("DELETE FROM entries WHERE expires < ?", (now,))
+        conn.execute("""
+            DELETE FROM entries WHERE rowid IN (
+                SELECT rowid FROM entries ORDER BY used DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def delete(self, key: str):
+        try:
+            conn = self._connection()
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Shared cache write failed: {e}")
+
+    def clear(self):
+        try:
+            conn = self._connection()
+            conn.execute("DELETE FROM entries")
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Shared cache clear failed: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        try:
+            entries = self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error as e:
+            return {**super().stats(), "error": str(e)}
+        return {**super().stats(), "path": self.path, "entries": entries, "max_entries": self.max_entries}
+
+
+#-------------------------------------------------------------------------#
+# Redis Protocol (several hosts)
+#-------------------------------------------------------------------------#
+
+class RedisError(Exception):
+    """Error reply from the server, or a broken connection."""
+
+
+class _RedisConnection:
+    """One socket speaking RESP2."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def command(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self.sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise RedisError("Connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            if count < 0:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(CacheBackend):
+    """
+    Minimal client for any Redis-protocol server (Redis, Valkey, KeyDB, ...).
+    
+    Keeps a small pool of connections; a connection that errors is dropped
+    and the call counts as a miss.
+    """
+    
+    shared = True
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, timeout: float = SHARED_CACHE_TIMEOUT,
+                 prefix: str = KEY_PREFIX):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.prefix = prefix
+        self._pool: List[_RedisConnection] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisCache":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        password = unquote(parsed.password) if parsed.password else None
+        return cls(parsed.hostname or "localhost", parsed.port or 6379, db, password, **kwargs)
+
+    def _connect(self) -> _RedisConnection:
+        conn = _RedisConnection(self.host, self.port, self.timeout)
+        if self.password:
+            conn.command("AUTH", self.password)
+        if self.db:
+            conn.command("SELECT", self.db)
+        return conn
+
+    def _call(self, *args):
+        """Run one command on a pooled connection. Raises RedisError or OSError."""
+        with self._lock:
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = self._connect()
+        
+        try:
+            reply = conn.command(*args)
+        except (OSError, RedisError):
+            conn.close()
+            raise
+        
+        with self._lock:
+            self._pool.append(conn)
+        return reply
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self._call("GET", self.prefix + key)
+        except (OSError, RedisError) as e:
+            print(f"Shared cache read failed: {e}")
+            return None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        try:
+            self._call("SET", self.prefix + key, value, "PX", max(1, int(ttl * 1000)))
+        except (OSError, RedisError) as e:
+            print(f"Shared cache write failed: {e}")
+
+    def delete(self, key: str):
+        try:
+            self._call("DEL", self.prefix + key)
+        except (OSError, RedisError) as e:
+            print(f"Shared cache write failed: {e}")
+
+    def clear(self):
+        cursor = b"0"
+        try:
+            while True:
+                cursor, keys = self._call("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 500)
+                if keys:
+                    self._call("DEL", *keys)
+                if cursor in (b"0", "0"):
+                    break
+        except (OSError, RedisError) as e:
+            print(f"Shared cache clear failed: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        stats = {**super().stats(), "server": f"{self.host}:{self.port}/{self.db}"}
+        try:
+            stats["keys"] = self._call("DBSIZE")
+        except (OSError, RedisError) as e:
+            stats["error"] = str(e)
+        return stats
+
+
+#-------------------------------------------------------------------------#
+# Selection
+#-------------------------------------------------------------------------#
+
+def from_url(url: str) -> CacheBackend:
+    """Build a backend from a memory://, sqlite:/// or redis:// URL."""
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryCache()
+    if scheme == "sqlite":
+        # sqlite:///relative/path or sqlite:////absolute/path
+        return SQLiteCache(url[len("sqlite:///"):])
+    if scheme in ("redis", "rediss"):
+        if scheme == "rediss":
+            raise ValueError("TLS Redis URLs are not supported; use a local TLS proxy")
+        return RedisCache.from_url(url)
+    raise ValueError(f"Unknown cache backend URL: {url}")
+
+
+_backend: Optional[CacheBackend] = None
+_local_caches: Dict[str, MemoryCache] = {}
+_backend_lock = threading.Lock()
+
+
+def set_backend(backend: Optional[CacheBackend]):
+    """Use a different shared backend (None to go back to SHARED_CACHE_URL)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+        _local_caches.clear()
+
+
+def _configured() -> CacheBackend:
+    """The backend from set_backend() or SHARED_CACHE_URL (caller holds _backend_lock)."""
+    global _backend
+    if _backend is None:
+        _backend = from_url(SHARED_CACHE_URL)
+        print(f"Cache backend: {type(_backend).__name__}")
+    return _backend
+
+
+def get_shared_backend() -> Optional[CacheBackend]:
+    """The backend shared between workers, or None if caches are per-process."""
+    with _backend_lock:
+        backend = _configured()
+    return backend if backend.shared else None
+
+
+def get_backend(name: str, max_entries: int = SHARED_CACHE_MAX_ENTRIES) -> CacheBackend:
+    """
+    Backend for one cache (e.g. "moderation").
+    
+    Returns the shared backend when one is configured. Otherwise each name
+    gets its own in-process MemoryCache of `max_entries`.
+    """
+    with _backend_lock:
+        backend = _configured()
+        if backend.shared:
+            return backend
+        
+        cache = _local_caches.get(name)
+        if cache is None:
+            cache = _local_caches[name] = MemoryCache(max_entries)
+        return cache
+
+
+def get_stats() -> Dict[str, object]:
+    backend = _backend
+    if backend is None or not backend.shared:
+        return {"backend": "MemoryCache", "shared": False,
+                "caches": {name: cache.stats() for name, cache in _local_caches.items()}}
+    return backend.stats()
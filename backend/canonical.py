@@ -0,0 +1,122 @@
+"""
+Query Canonicalizer
+One normal form for search queries, shared by every cache keyed on query text.
+
+Search results, prompt embeddings, moderation verdicts, analytics and the
+leaderboard all key on canonicalize(query), so trivially different spellings
+("Curly  hair!", "curly hair", "Curly Hair pls") hit the same entries.
+
+The prompt syntax from search.parse_prompts (" + ", " - ", "*2") survives
+canonicalization.
+"""
+
+import os
+import re
+import json
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+# Rewrite common spelling variants to one form (off by default: changes what is encoded)
+QUERY_SYNONYMS = os.environ.get("QUERY_SYNONYMS", "false").lower() == "true"
+# Optional JSON file of extra {"variant": "canonical"} word rewrites
+QUERY_SYNONYMS_PATH = os.environ.get("QUERY_SYNONYMS_PATH")
+
+# Filler at the end of a query that doesn't change what it means
+TRAILING_NOISE = {
+    "please", "pls", "plz", "thanks", "thx", "ty", "lol", "lmao", "haha", "pleaseee",
+}
+
+DEFAULT_SYNONYMS = {
+    "blond": "blonde",
+    "grey": "gray",
+    "specs": "glasses",
+    "eyeglasses": "glasses",
+    "spectacles": "glasses",
+    "doppelganger": "lookalike",
+    "look-alike": "lookalike",
+    "colour": "color",
+    "colourful": "colorful",
+}
+
+
+def _load_synonyms() -> Dict[str, str]:
+    synonyms = dict(DEFAULT_SYNONYMS)
+    if QUERY_SYNONYMS_PATH:
+        with open(QUERY_SYNONYMS_PATH) as f:
+            synonyms.update({k.lower(): v.lower() for k, v in json.load(f).items()})
+    return synonyms
+
+
+SYNONYMS = _load_synonyms() if QUERY_SYNONYMS else {}
+
+#-------------------------------------------------------------------------#
+# Canonicalization
+#-------------------------------------------------------------------------#
+
+# Apostrophes join their word ("they're" -> "theyre")
+_APOSTROPHES = re.compile(r"['‘’`]")
+# Everything but letters, digits, whitespace and the prompt operators + - * .
+_PUNCTUATION = re.compile(r"[^\w\s+\-*.]|_")
+# A "." that doesn't start a number's fraction (weights like *0.5 or *.5 keep theirs)
+_STRAY_DOTS = re.compile(r"\.(?!\d)")
+# Runs of letters and digits
+_WORD = re.compile(r"[^\W_]+")
+
+
+def _fold(text: str) -> str:
+    """Unicode compatibility fold, accents stripped, case folded."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.casefold()
+
+
+@lru_cache(maxsize=4096)
+def canonicalize(query: str, synonyms: bool = True) -> str:
+    """
+    Canonical form of a query.
+    
+    Folds Unicode and case, strips punctuation, collapses whitespace, drops
+    trailing filler words and, if QUERY_SYNONYMS is on, rewrites spelling
+    variants. Idempotent.
+    
+    Args:
+        query: Raw query text
+        synonyms: Apply the synonym table (when enabled)
+    
+    Returns:
+        The canonical query (may be empty for all-punctuation input)
+    """
+    text = _fold(query)
+    text = _APOSTROPHES.sub("", text)
+    text = _PUNCTUATION.sub(" ", text)
+    text = _STRAY_DOTS.sub(" ", text)
+    
+    words = text.split()
+    while words and words[-1] in TRAILING_NOISE:
+        words.pop()
+    # Operators left dangling at either end (e.g. "glasses -") mean nothing
+    while words and words[-1] in ("+", "-", "*"):
+        words.pop()
+    while words and words[0] in ("+", "*"):
+        words.pop(0)
+    
+    if synonyms and SYNONYMS:
+        words = [SYNONYMS.get(word, word) for word in words]
+    
+    return " ".join(words)
+
+
+def words(text: str) -> List[str]:
+    """
+    Folded words of a text, as matched by the lexical index.
+    
+    Same Unicode and case folding as canonicalize(), apostrophes joined
+    ("O'Brien" -> "obrien"), and everything but letters and digits splits
+    ("Smith-Jones" -> "smith", "jones").
+    """
+    return _WORD.findall(_APOSTROPHES.sub("", _fold(text)))
@@ -0,0 +1,161 @@
+"""
+Response Compression
+gzip/brotli compression middleware with a minimum-size threshold.
+
+Responses that already carry a Content-Encoding (e.g. precompressed bodies
+served from the HTTP cache) and streaming responses are passed through
+untouched. Brotli is used when the `brotli` package is installed and the
+client accepts it.
+"""
+
+import os
+import gzip
+from typing import Dict, List, Optional
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+
+# Encodings we offer, in order of preference
+COMPRESSION_ENCODINGS = [
+    encoding.strip()
+    for encoding in os.environ.get("COMPRESSION_ENCODINGS", "br,gzip").split(",")
+    if encoding.strip() in ("br", "gzip") and (encoding.strip() != "br" or brotli is not None)
+]
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+#-------------------------------------------------------------------------#
+# Helpers
+#-------------------------------------------------------------------------#
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the best encoding we support from an Accept-Encoding header.
+    
+    Returns None when the client accepts none of them (identity).
+    """
+    if not accept_encoding:
+        return None
+    
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    
+    for encoding in COMPRESSION_ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a body with the given encoding ("br" or "gzip")."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def precompress(body: bytes) -> Dict[str, bytes]:
+    """
+    Compress a body with every offered encoding.
+    
+    Used for rarely-changing payloads that are cached and served many times.
+    Returns an empty dict for bodies below the size threshold.
+    """
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return {}
+    return {encoding: compress(body, encoding) for encoding in COMPRESSION_ENCODINGS}
+
+
+def _is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+#-------------------------------------------------------------------------#
+# Middleware
+#-------------------------------------------------------------------------#
+
+class CompressionMiddleware:
+    """ASGI middleware compressing buffered responses above a size threshold."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENCODINGS:
+            await self.app(scope, receive, send)
+            return
+        
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start: Dict = {}
+        chunks: List[bytes] = []
+        passthrough = False
+        
+        async def wrapped_send(message):
+            nonlocal passthrough
+            
+            if message["type"] == "http.response.start":
+                start.update(message)
+                headers = Headers(raw=message["headers"])
+                if not _is_compressible(headers):
+                    passthrough = True
+                    await send(message)
+                return
+            
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            
+            if message.get("more_body", False) and not chunks:
+                # Streaming response - send it as-is so events aren't held back
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=list(start["headers"]))
+            headers.add_vary_header("Accept-Encoding")
+            
+            if len(body) >= self.minimum_size:
+                body = compress(body, encoding)
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+            
+            start["headers"] = headers.raw
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+        
+        await self.app(scope, receive, wrapped_send)
@@ -0,0 +1,325 @@
+"""
+Disk Cache Module
+Restart-surviving second tier for query embeddings and ranked search results.
+
+The in-memory caches start empty after every deploy or restart; this SQLite
+file under persistent/ keeps what they held so the first searches after a
+restart are lookups instead of encoder passes. Embeddings are keyed by model
+and canonical prompt, results by the fingerprint of the embeddings data they
+were ranked against, so a new data file never serves stale rankings.
+
+Uses SQLite with WAL mode so several workers can share one file. Reads don't
+write: the recency used for pruning is recorded in memory and flushed in
+batches, so cache hits don't queue on the writer lock.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from metrics import record_cache
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+PERSISTENT_DIR = Path(__file__).parent / "persistent"
+
+DISK_CACHE_ENABLED = os.environ.get("DISK_CACHE_ENABLED", "true").lower() == "true"
+DISK_CACHE_PATH = os.environ.get("DISK_CACHE_PATH", str(PERSISTENT_DIR / "search_cache.db"))
+
+# Rows kept per table; the least recently used are pruned past this
+DISK_CACHE_MAX_EMBEDDINGS = int(os.environ.get("DISK_CACHE_MAX_EMBEDDINGS", "20000"))
+DISK_CACHE_MAX_RESULTS = int(os.environ.get("DISK_CACHE_MAX_RESULTS", "20000"))
+
+# Writes between size checks
+PRUNE_EVERY = 500
+
+# Read hits whose recency is buffered before being written, and the longest
+# they wait
+TOUCH_BATCH = 64
+TOUCH_FLUSH_SECONDS = 30.0
+
+# Thread-local storage for database connections
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+_writes = 0
+
+# Pending recency updates per table: (model, prompt) or (namespace, key) -> last hit
+_touch_lock = threading.Lock()
+_touched: Dict[str, Dict[Tuple[str, str], float]] = {"embeddings": {}, "results": {}}
+_last_flush = time.time()
+
+
+def is_enabled() -> bool:
+    return DISK_CACHE_ENABLED
+
+
+#-------------------------------------------------------------------------#
+# Database Setup
+#-------------------------------------------------------------------------#
+
+def _get_connection() -> sqlite3.Connection:
+    """Get a thread-local database connection, creating the schema on first use."""
+    global _schema_ready
+    
+    if getattr(_local, "connection", None) is None:
+        Path(DISK_CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DISK_CACHE_PATH, timeout=30.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.connection = conn
+    
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                _create_schema(_local.connection)
+                _schema_ready = True
+    return _local.connection
+
+
+def _create_schema(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            used REAL NOT NULL,
+            PRIMARY KEY (model, prompt)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            indices BLOB NOT NULL,
+            scores BLOB NOT NULL,
+            used REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_used ON embeddings(used)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_results_used ON results(used)")
+    conn.commit()
+
+
+def _prune(conn: sqlite3.Connection):
+    """Drop the least recently used rows beyond each table's limit."""
+    for table, limit in (("embeddings", DISK_CACHE_MAX_EMBEDDINGS),
+                         ("results", DISK_CACHE_MAX_RESULTS)):
+        conn.execute(f"""
+            DELETE FROM {table} WHERE rowid IN (
+                SELECT rowid FROM {table} ORDER BY used DESC LIMIT -1 OFFSET ?
+            )
+        """, (limit,))
+
+
+def _after_write(conn: sqlite3.Connection, count: int):
+    global _writes
+    _write_touches(conn)
+    _writes += count
+    if _writes >= PRUNE_EVERY:
+        _writes = 0
+        _prune(conn)
+    conn.commit()
+
+
+def _write_touches(conn: sqlite3.Connection):
+    """Write buffered recency updates (the caller commits)."""
+    global _last_flush
+    with _touch_lock:
+        embeddings, results = _touched["embeddings"], _touched["results"]
+        _touched["embeddings"], _touched["results"] = {}, {}
+        _last_flush = time.time()
+    
+    if embeddings:
+        conn.executemany(
+            "UPDATE embeddings SET used = ? WHERE model = ? AND prompt = ?",
+            [(used, model, prompt) for (model, prompt), used in embeddings.items()]
+        )
+    if results:
+        conn.executemany(
+            "UPDATE results SET used = ? WHERE namespace = ? AND key = ?",
+            [(used, namespace, key) for (namespace, key), used in results.items()]
+        )
+
+
+def _touch(table: str, keys: List[Tuple[str, str]]):
+    """Record read hits in a table, writing them out once enough have built up."""
+    now = time.time()
+    with _touch_lock:
+        for key in keys:
+            _touched[table][key] = now
+        pending = len(_touched["embeddings"]) + len(_touched["results"])
+        due = pending >= TOUCH_BATCH or now - _last_flush >= TOUCH_FLUSH_SECONDS
+    if due:
+        try:
+            conn = _get_connection()
+            _write_touches(conn)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Disk cache write failed: {e}")
+
+
+#-------------------------------------------------------------------------#
+# Embeddings
+#-------------------------------------------------------------------------#
+
+def get_embeddings(model: str, prompts: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Stored normalized embeddings for the prompts that have one.
+    
+    Returns:
+        Dict of prompt -> read-only float32 vector (missing prompts are absent)
+    """
+    if not DISK_CACHE_ENABLED or not prompts:
+        return {}
+    
+    try:
+        conn = _get_connection()
+        placeholders = ",".join("?" * len(prompts))
+        rows = conn.execute(
+            f"SELECT prompt, vector FROM embeddings WHERE model = ? AND prompt IN ({placeholders})",
+            [model, *prompts]
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Disk cache read failed: {e}")
+        return {}
+    
+    if rows:
+        _touch("embeddings", [(model, prompt) for prompt, _ in rows])
+    found = {prompt: np.frombuffer(vector, dtype=np.float32) for prompt, vector in rows}
+    for prompt in prompts:
+        record_cache("disk_embeddings", prompt in found)
+    return found
+
+
+def set_embeddings(model: str, vectors: Dict[str, np.ndarray]):
+    """Store normalized embeddings by prompt."""
+    if not DISK_CACHE_ENABLED or not vectors:
+        return
+    
+    now = time.time()
+    try:
+        conn = _get_connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, prompt, vector, used) VALUES (?, ?, ?, ?)",
+            [(model, prompt, np.asarray(vector, dtype=np.float32).tobytes(), now)
+             for prompt, vector in vectors.items()]
+        )
+        _after_write(conn, len(vectors))
+    except sqlite3.Error as e:
+        print(f"Disk cache write failed: {e}")
+
+
+#-------------------------------------------------------------------------#
+# Results
+#-------------------------------------------------------------------------#
+
+def get_results(namespace: str, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Stored ranking for a cache key.
+    
+    Returns:
+        (int32 row numbers, float32 scores), or None if not stored
+    """
+    if not DISK_CACHE_ENABLED:
+        return None
+    
+    try:
+        conn = _get_connection()
+        row = conn.execute(
+            "SELECT indices, scores FROM results WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Disk cache read failed: {e}")
+        return None
+    
+    record_cache("disk_results", row is not None)
+    if row is None:
+        return None
+    _touch("results", [(namespace, key)])
+    return np.frombuffer(row[0], dtype=np.int32), np.frombuffer(row[1], dtype=np.float32)
+
+
+def set_results(namespace: str, key: str, indices: np.ndarray, scores: np.ndarray):
+    """Store a ranking for a cache key."""
+    if not DISK_CACHE_ENABLED:
+        return
+    
+    try:
+        conn = _get_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (namespace, key, indices, scores, used) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key,
+             np.asarray(indices, dtype=np.int32).tobytes(),
+             np.asarray(scores, dtype=np.float32).tobytes(),
+             time.time())
+        )
+        _after_write(conn, 1)
+    except sqlite3.Error as e:
+        print(f"Disk cache write failed: {e}")
+
+
+def drop_namespace(namespace: str) -> int:
+    """
+    Delete the results stored under one namespace (e.g. the data a reload
+    replaced).
+    
+    Returns:
+        Number of rows deleted
+    """
+    if not DISK_CACHE_ENABLED:
+        return 0
+    
+    try:
+        conn = _get_connection()
+        deleted = conn.execute("DELETE FROM results WHERE namespace = ?", (namespace,)).rowcount
+        conn.commit()
+        return deleted
+    except sqlite3.Error as e:
+        print(f"Disk cache cleanup failed: {e}")
+        return 0
+
+
+#-------------------------------------------------------------------------#
+# Stats
+#-------------------------------------------------------------------------#
+
+def get_stats() -> Dict[str, object]:
+    if not DISK_CACHE_ENABLED:
+        return {"enabled": False}
+    
+    try:
+        conn = _get_connection()
+        embeddings = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        results = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    except sqlite3.Error as e:
+        return {"enabled": True, "error": str(e)}
+    
+    return {
+        "enabled": True,
+        "path": DISK_CACHE_PATH,
+        "embeddings": embeddings,
+        "max_embeddings": DISK_CACHE_MAX_EMBEDDINGS,
+        "results": results,
+        "max_results": DISK_CACHE_MAX_RESULTS
+    }
+
+
+def clear():
+    """Delete everything in the disk cache."""
+    if not DISK_CACHE_ENABLED:
+        return
+    
+    conn = _get_connection()
+    conn.execute("DELETE FROM embeddings")
+    conn.execute("DELETE FROM results")
+    conn.commit()
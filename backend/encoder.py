@@ -0,0 +1,293 @@
+"""
+Text Encoder
+CLIP text model loading and batched, cached text encoding.
+
+Every text embedding (search queries, the parts of multi-prompt queries,
+analytics) goes through encode_texts(), which encodes all uncached texts in
+one forward pass and keeps the normalized embeddings in an LRU.
+
+Texts missing from that LRU are looked up in the disk cache (see
+disk_cache), then tokenized once per canonical form: token IDs
+(truncated to CLIP's 77-token context) are kept in a larger, cheaper LRU and
+packed into padded tensors for each batch.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import torch
+from transformers import AutoTokenizer, CLIPTextModelWithProjection
+
+import disk_cache
+from canonical import canonicalize
+from metrics import Counter, timed, record_cache
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+MODEL_NAME = "openai/clip-vit-large-patch14"
+
+# CLIP's context length; longer prompts are truncated
+MAX_TOKENS = 77
+
+# Normalized text embeddings kept in memory
+PROMPT_CACHE_SIZE = int(os.environ.get("PROMPT_CACHE_SIZE", "2048"))
+
+# Token ID lists kept in memory (a few hundred bytes each)
+TOKENIZER_CACHE_SIZE = int(os.environ.get("TOKENIZER_CACHE_SIZE", "16384"))
+
+TOKENIZER_FAILURES = Counter(
+    "yaliesearch_tokenizer_failures_total",
+    "Batches the tokenizer raised on"
+)
+TRUNCATED_PROMPTS = Counter(
+    "yaliesearch_truncated_prompts_total",
+    "Prompts cut off at the encoder's token limit"
+)
+
+#-------------------------------------------------------------------------#
+# Device Setup
+#-------------------------------------------------------------------------#
+
+if torch.backends.mps.is_available():
+    device = "mps"
+elif torch.cuda.is_available():
+    device = "cuda"
+else:
+    device = "cpu"
+
+print(f"Text encoder using device: {device}")
+
+#-------------------------------------------------------------------------#
+# Model
+#-------------------------------------------------------------------------#
+
+_model = None
+_tokenizer = None
+_load_lock = threading.Lock()
+
+# Replacement for the CLIP text encoder (see set_text_encoder)
+_text_encoder: Optional[Callable[[str], np.ndarray]] = None
+
+_prompt_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_prompt_cache_lock = threading.Lock()
+
+_token_cache: "OrderedDict[str, List[int]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+
+def load_model():
+    """Load the CLIP text model and tokenizer (no-op if loaded or replaced)."""
+    global _model, _tokenizer
+    
+    with _load_lock:
+        if _model is not None or _text_encoder is not None:
+            return
+        
+        print("Loading CLIP text model...")
+        model = CLIPTextModelWithProjection.from_pretrained(MODEL_NAME)
+        
+        if device in ("mps", "cuda"):
+            model = model.half()
+        
+        model = model.to(device)
+        model.eval()
+        
+        _tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+        _model = model
+        print("Model loaded!")
+
+
+def is_ready() -> bool:
+    """Whether texts can be encoded right now."""
+    return _text_encoder is not None or (_model is not None and _tokenizer is not None)
+
+
+def model_id() -> Optional[str]:
+    """Name of the model embeddings come from, or None for a replacement encoder."""
+    return MODEL_NAME if _text_encoder is None else None
+
+
+def set_text_encoder(encoder: Optional[Callable[[str], np.ndarray]]):
+    """
+    Replace the CLIP text encoder with a function mapping a text to a vector.
+    
+    Used by the benchmarks and load tests to run without downloading CLIP.
+    When set before load_model(), the model is never loaded. Pass None to go
+    back to CLIP.
+    """
+    global _text_encoder
+    _text_encoder = encoder
+    clear_prompt_cache()
+    clear_token_cache()
+
+
+#-------------------------------------------------------------------------#
+# Encoding
+#-------------------------------------------------------------------------#
+
+def _prompt_key(text: str) -> str:
+    # Texts are encoded in this form, so equivalent spellings share an embedding
+    return canonicalize(text) or text.strip()
+
+
+def tokenize(texts: List[str]) -> List[List[int]]:
+    """
+    Token IDs for each text, truncated to MAX_TOKENS.
+    
+    Cached texts are looked up; the rest are tokenized in one call to the
+    fast tokenizer and cached. Texts should already be in prompt-key form.
+    """
+    ids: List[Optional[List[int]]] = [None] * len(texts)
+    missing = OrderedDict()
+    
+    with _token_cache_lock:
+        for i, text in enumerate(texts):
+            cached = _token_cache.get(text)
+            if cached is not None:
+                _token_cache.move_to_end(text)
+                ids[i] = cached
+            else:
+                missing.setdefault(text, []).append(i)
+    
+    for i in range(len(texts)):
+        record_cache("tokens", ids[i] is not None)
+    
+    if missing:
+        try:
+            encoded = _tokenizer(list(missing), truncation=True, max_length=MAX_TOKENS)["input_ids"]
+            # A full-length row may have fit exactly; retokenize just those to tell
+            full = [text for text, row in zip(missing, encoded) if len(row) >= MAX_TOKENS]
+            if full:
+                lengths = [len(row) for row in _tokenizer(full, truncation=False)["input_ids"]]
+                TRUNCATED_PROMPTS.inc(sum(1 for length in lengths if length > MAX_TOKENS))
+        except Exception:
+            TOKENIZER_FAILURES.inc()
+            raise
+        
+        with _token_cache_lock:
+            for (text, positions), row in zip(missing.items(), encoded):
+                row = list(row)
+                for i in positions:
+                    ids[i] = row
+                if TOKENIZER_CACHE_SIZE > 0:
+                    _token_cache[text] = row
+            while len(_token_cache) > TOKENIZER_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    
+    return ids
+
+
+def _pack(ids: List[List[int]]) -> Dict[str, torch.Tensor]:
+    """Right-pad token ID lists into input_ids/attention_mask tensors on the device."""
+    width = max(len(row) for row in ids)
+    input_ids = np.full((len(ids), width), _tokenizer.pad_token_id or 0, dtype=np.int64)
+    attention_mask = np.zeros((len(ids), width), dtype=np.int64)
+    for i, row in enumerate(ids):
+        input_ids[i, :len(row)] = row
+        attention_mask[i, :len(row)] = 1
+    
+    return {
+        "input_ids": torch.from_numpy(input_ids).to(device),
+        "attention_mask": torch.from_numpy(attention_mask).to(device),
+    }
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    """Encode texts in one forward pass. Returns unnormalized (n, dim) float32."""
+    if _text_encoder is not None:
+        with timed("encoder"):
+            return np.stack([np.asarray(_text_encoder(text), dtype=np.float32) for text in texts])
+    
+    # Shard nodes start without the model; load it if one is asked for text anyway
+    if _model is None:
+        load_model()
+    
+    with timed("tokenization"):
+        inputs = _pack(tokenize(texts))
+    
+    with timed("encoder"), torch.inference_mode():
+        outputs = _model(**inputs)
+        return outputs.text_embeds.float().cpu().numpy()
+
+
+def _encode_missing(keys: List[str]) -> Dict[str, np.ndarray]:
+    """Normalized embeddings for prompt keys, from the disk cache or the encoder."""
+    model = model_id()
+    found = disk_cache.get_embeddings(model, keys) if model else {}
+    
+    to_encode = [key for key in keys if key not in found]
+    if to_encode:
+        batch = _encode_batch(to_encode)
+        batch /= np.linalg.norm(batch, axis=1, keepdims=True)
+        # Rows are shared through the cache
+        batch.setflags(write=False)
+        
+        encoded = dict(zip(to_encode, batch))
+        if model:
+            disk_cache.set_embeddings(model, encoded)
+        found.update(encoded)
+    
+    return found
+
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """
+    Get normalized embeddings for texts, shape (len(texts), dim).
+    
+    Cached texts are looked up (in memory, then on disk); the rest are
+    encoded together in a single batch and cached.
+    """
+    keys = [_prompt_key(text) for text in texts]
+    vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+    missing = OrderedDict()
+    
+    with _prompt_cache_lock:
+        for i, key in enumerate(keys):
+            vector = _prompt_cache.get(key)
+            if vector is not None:
+                _prompt_cache.move_to_end(key)
+                vectors[i] = vector
+            else:
+                missing.setdefault(key, []).append(i)
+    
+    for i in range(len(texts)):
+        record_cache("prompt", vectors[i] is not None)
+    
+    if missing:
+        found = _encode_missing(list(missing))
+        
+        with _prompt_cache_lock:
+            for key, positions in missing.items():
+                vector = found[key]
+                for i in positions:
+                    vectors[i] = vector
+                if PROMPT_CACHE_SIZE > 0:
+                    _prompt_cache[key] = vector
+            while len(_prompt_cache) > PROMPT_CACHE_SIZE:
+                _prompt_cache.popitem(last=False)
+    
+    return np.stack(vectors)
+
+
+def clear_prompt_cache():
+    """Forget all cached text embeddings."""
+    with _prompt_cache_lock:
+        _prompt_cache.clear()
+
+
+def clear_token_cache():
+    """Forget all cached token IDs."""
+    with _token_cache_lock:
+        _token_cache.clear()
+
+
+def get_prompt_cache_stats() -> dict:
+    return {"size": len(_prompt_cache), "max_size": PROMPT_CACHE_SIZE}
+
+
+def get_token_cache_stats() -> dict:
+    return {"size": len(_token_cache), "max_size": TOKENIZER_CACHE_SIZE}
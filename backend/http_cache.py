@@ -0,0 +1,295 @@
+"""
+HTTP Caching Middleware
+ETags, 304s and an in-process cache of rendered responses for read-mostly
+endpoints. Cached responses are stored precompressed so they are not
+compressed again on every request.
+
+Each cached route declares a generation function that changes whenever the
+data behind it changes (e.g. the embeddings generation for /api/filters).
+The ETag is derived from that generation, so validating a request is a
+counter lookup - the endpoint only runs when the data actually changed.
+"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from starlette.requests import Request
+from starlette.datastructures import Headers
+
+from compression import choose_encoding, precompress
+from metrics import record_cache
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+HTTP_CACHE_MAX_ENTRIES = int(os.environ.get("HTTP_CACHE_MAX_ENTRIES", "256"))
+HTTP_CACHE_MAX_BYTES = int(os.environ.get("HTTP_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+
+class CacheRule:
+    """
+    Caching policy for one route.
+    
+    Args:
+        path: Regex matched against the full request path
+        generation: Returns a value that changes whenever the response would change
+        cache_control: Cache-Control header value to send
+        authenticate: Optional async check run before serving a 304 or a
+            cached response; it should raise if the request is not allowed to
+            see the response (or is over a rate limit). Routes whose
+            dependencies do more than authenticate must do the same work here
+    """
+
+    def __init__(self, path: str, generation: Callable[[], Any], cache_control: str,
+                 authenticate: Optional[Callable[[Request], Awaitable[Any]]] = None):
+        self.pattern = re.compile(path + "$")
+        self.generation = generation
+        self.cache_control = cache_control
+        self.authenticate = authenticate
+
+
+def time_bucket(seconds: int) -> int:
+    """Generation component that changes every `seconds` (for time-windowed data)."""
+    return int(time.time() // seconds)
+
+
+def throttle(generation: Callable[[], Any], seconds: float) -> Callable[[], Any]:
+    """
+    Wrap a generation function so its value is re-read at most every `seconds`.
+    
+    For fast-moving counters (like logged searches) where serving a response
+    up to `seconds` old is fine and re-rendering on every change is not.
+    """
+    state = {"value": None, "checked": 0.0}
+    
+    def throttled():
+        now = time.time()
+        if now - state["checked"] >= seconds:
+            state["value"] = generation()
+            state["checked"] = now
+        return state["value"]
+    
+    return throttled
+
+
+#-------------------------------------------------------------------------#
+# Rendered Response Store
+#-------------------------------------------------------------------------#
+
+class _ResponseStore:
+    """LRU of rendered responses bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: str, etag: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["etag"] != etag:
+                self.misses += 1
+                record_cache("http", False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            record_cache("http", True)
+            return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._remove(key)
+            size = entry["size"]
+            while self._entries and (
+                    len(self._entries) >= self.max_entries or
+                    self._bytes + size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+            self._entries[key] = entry
+            self._bytes += size
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+_store = _ResponseStore(HTTP_CACHE_MAX_ENTRIES, HTTP_CACHE_MAX_BYTES)
+
+
+def get_http_cache_stats() -> Dict[str, Any]:
+    """Get rendered-response cache statistics."""
+    return _store.stats()
+
+
+def clear_http_cache():
+    """Drop all rendered responses."""
+    _store.clear()
+
+
+#-------------------------------------------------------------------------#
+# Middleware
+#-------------------------------------------------------------------------#
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison is fine for If-None-Match
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+class HTTPCacheMiddleware:
+    """
+    ASGI middleware adding ETag/Cache-Control, 304s and response caching.
+    
+    Only GET/HEAD requests to paths matching a rule are touched; everything
+    else passes straight through.
+    """
+
+    def __init__(self, app, rules: List[CacheRule]):
+        self.app = app
+        self.rules = rules
+
+    def _match(self, path: str) -> Optional[CacheRule]:
+        for rule in self.rules:
+            if rule.pattern.match(path):
+                return rule
+        return None
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        
+        rule = self._match(scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+        
+        if rule.authenticate is not None:
+            try:
+                await rule.authenticate(Request(scope))
+            except Exception:
+                # Let the endpoint produce the proper 401/403
+                await self.app(scope, receive, send)
+                return
+        
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding"))
+        
+        key = scope["path"] + "?" + scope.get("query_string", b"").decode("latin-1")
+        generation = repr(rule.generation())
+        # Each encoding is a different representation, so it gets its own ETag
+        etag_source = f"{key}|{generation}|{encoding or 'identity'}"
+        etag = '"' + hashlib.sha1(etag_source.encode()).hexdigest()[:20] + '"'
+        headers = [
+            (b"etag", etag.encode()),
+            (b"cache-control", rule.cache_control.encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        
+        if _etag_matches(request_headers.get("if-none-match"), etag):
+            _store.not_modified += 1
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        
+        # Stored under the identity ETag; variants cover the encodings
+        base_etag = f"{key}|{generation}"
+        cached = _store.get(key, base_etag)
+        if cached is not None:
+            await self._send(scope, send, cached, encoding, headers)
+            return
+        
+        await self._render_and_store(scope, receive, send, key, base_etag, encoding, headers)
+    
+    async def _send(self, scope, send, entry: Dict[str, Any], encoding: Optional[str],
+                    extra_headers: List[Tuple[bytes, bytes]]):
+        """Send a stored response, picking the precompressed variant if there is one."""
+        body = entry["body"]
+        headers = list(entry["headers"]) + extra_headers
+        
+        variant = entry["variants"].get(encoding) if encoding else None
+        if variant is not None:
+            body = variant
+            headers.append((b"content-encoding", encoding.encode()))
+        headers.append((b"content-length", str(len(body)).encode()))
+        
+        await send({
+            "type": "http.response.start",
+            "status": entry["status"],
+            "headers": headers,
+        })
+        await send({
+            "type": "http.response.body",
+            "body": b"" if scope["method"] == "HEAD" else body,
+        })
+    
+    async def _render_and_store(self, scope, receive, send, key: str, base_etag: str,
+                                encoding: Optional[str],
+                                extra_headers: List[Tuple[bytes, bytes]]):
+        """Run the endpoint, buffer its response, cache it if it's a 200."""
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+        
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+        
+        await self.app(scope, receive, capture)
+        
+        body = b"".join(chunks)
+        status = start.get("status", 500)
+        headers = list(start.get("headers", []))
+        
+        if status != 200:
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+        
+        headers = [
+            h for h in headers
+            if h[0].lower() not in (b"etag", b"cache-control", b"vary", b"content-length")
+        ]
+        entry = {
+            "etag": base_etag,
+            "status": status,
+            "headers": headers,
+            "body": body,
+            # Compressed once here rather than on every request
+            "variants": precompress(body),
+        }
+        entry["size"] = len(body) + sum(len(v) for v in entry["variants"].values())
+        _store.put(key, entry)
+        
+        await self._send(scope, send, entry, encoding, extra_headers)
@@ -12,6 +12,8 @@ import threading
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
+from canonical import canonicalize
+
 #-------------------------------------------------------------------------#
 # Configuration
 #-------------------------------------------------------------------------#
@@ -77,7 +79,7 @@ def initialize_db():
 
 def _normalize_query(query: str) -> str:
     """Normalize a query for deduplication."""
-    return query.lower().strip()
+    return canonicalize(query) or query.lower().strip()
 
 
 def _hash_query(query: str) -> str:
@@ -0,0 +1,164 @@
+"""
+Lexical Index
+In-memory inverted index over first names, last names and majors, used
+alongside the embeddings for hybrid search.
+
+CLIP embeddings describe faces, not names: "smith" or "computer science"
+encode to vectors that say little about who is called Smith or studies
+computer science. This index finds those people directly. Each distinct word
+(term) maps to the sorted rows containing it, and the terms are kept sorted,
+so the terms starting with a prefix are one bisected range. A lookup only
+touches the matching terms' postings, so it costs microseconds.
+
+A query matches the people who have each of its words as a whole name or
+major word. The last word may instead be the start of one ("john smi",
+"computer sci"), but only after words that matched exactly: a lone word has
+to match whole, because descriptive words are often the start of someone's
+name ("hat" and Hatch, "bald" and Baldwin) and those queries must stay
+purely semantic. Typo matching is not done for the same reason.
+
+search.py fuses the matches with the vector ranking by weighted reciprocal
+rank fusion (RRF). tools/fusion_check.py compares rankings with and without
+fusion.
+"""
+
+import os
+import bisect
+from collections import defaultdict
+from functools import reduce
+from typing import Dict, List
+import numpy as np
+
+from canonical import words
+from people import PersonTable
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+LEXICAL_SEARCH = os.environ.get("LEXICAL_SEARCH", "true").lower() == "true"
+
+# Weight of the lexical ranking relative to the vector ranking in fusion
+LEXICAL_WEIGHT = float(os.environ.get("LEXICAL_WEIGHT", "2.0"))
+
+# RRF constant: larger values flatten the difference between ranks
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+# Shortest last word completed as a prefix, and most terms one prefix expands to
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_TERMS = 64
+
+
+def fusion_tag() -> str:
+    """Part of the persisted results namespace that changes with the fusion setup."""
+    if not LEXICAL_SEARCH:
+        return "vector"
+    return f"prefix-rrf{RRF_K}:{LEXICAL_WEIGHT:g}"
+
+
+class LexicalIndex:
+    """Immutable word -> rows index over one PersonTable."""
+    
+    __slots__ = ("terms", "postings", "_term_ids")
+
+    def __init__(self, people: PersonTable):
+        rows_by_term: Dict[str, List[np.ndarray]] = defaultdict(list)
+        
+        names: Dict[str, List[int]] = defaultdict(list)
+        for row, (first, last) in enumerate(zip(people.first_name, people.last_name)):
+            for term in words(f"{first or ''} {last or ''}"):
+                names[term].append(row)
+        for term, rows in names.items():
+            rows_by_term[term].append(np.array(rows, dtype=np.int32))
+        
+        # Majors are coded, so each major's rows come from one comparison
+        for code, major in enumerate(people.majors):
+            rows = np.flatnonzero(people.major_codes == code).astype(np.int32)
+            for term in words(major):
+                rows_by_term[term].append(rows)
+        
+        self.terms = sorted(rows_by_term)
+        self.postings = [np.unique(np.concatenate(rows_by_term[term])) for term in self.terms]
+        self._term_ids = {term: i for i, term in enumerate(self.terms)}
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def _prefix_rows(self, prefix: str) -> np.ndarray:
+        """Sorted rows of the (first MAX_PREFIX_TERMS) terms starting with a prefix."""
+        start = bisect.bisect_left(self.terms, prefix)
+        stop = bisect.bisect_left(self.terms, prefix + "\U0010ffff", start)
+        stop = min(stop, start + MAX_PREFIX_TERMS)
+        if start == stop:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(self.postings[start:stop]))
+
+    def lookup(self, query: str) -> np.ndarray:
+        """
+        People matching every word of a query.
+        
+        Words match whole names or major words. After at least one word that
+        matched, a last word with no whole match is completed as a prefix.
+        
+        Returns:
+            Sorted rows; empty if any word matches nobody
+        """
+        query_words = list(dict.fromkeys(words(query)))
+        if not query_words:
+            return np.empty(0, dtype=np.int32)
+        
+        matched = []
+        for position, word in enumerate(query_words):
+            term_id = self._term_ids.get(word)
+            if term_id is not None:
+                matched.append(self.postings[term_id])
+            elif position > 0 and position == len(query_words) - 1 and len(word) >= MIN_PREFIX_LENGTH:
+                matched.append(self._prefix_rows(word))
+            else:
+                return np.empty(0, dtype=np.int32)
+        
+        return reduce(lambda rows, other: np.intersect1d(rows, other, assume_unique=True),
+                      matched[1:], matched[0])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "terms": len(self.terms),
+            "postings": int(sum(len(rows) for rows in self.postings)),
+        }
+
+
+def fuse(vector_rows: np.ndarray, lexical_rows: np.ndarray,
+         similarities: np.ndarray, limit: int) -> np.ndarray:
+    """
+    Merge a vector ranking and lexical matches by weighted RRF.
+    
+    A row at rank r of a list gets weight / (RRF_K + r + 1) from it (1 for
+    the vector ranking, LEXICAL_WEIGHT for the lexical one). Lexical matches
+    are ranked by similarity. Ties in the fused order go to the higher
+    similarity.
+    
+    Args:
+        vector_rows: Rows in vector rank order
+        lexical_rows: LexicalIndex.lookup() output
+        similarities: Similarity of every row to the query (-inf = filtered out)
+        limit: Maximum rows to return
+    
+    Returns:
+        Rows in fused rank order
+    """
+    lexical_rows = lexical_rows[similarities[lexical_rows] != -np.inf]
+    if len(lexical_rows) == 0:
+        return vector_rows[:limit]
+    
+    lexical_rows = lexical_rows[np.argsort(-similarities[lexical_rows], kind="stable")[:limit]]
+    
+    rows = np.concatenate([vector_rows, lexical_rows])
+    contributions = np.concatenate([
+        1.0 / (RRF_K + 1 + np.arange(len(vector_rows))),
+        LEXICAL_WEIGHT / (RRF_K + 1 + np.arange(len(lexical_rows))),
+    ])
+    rows, inverse = np.unique(rows, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions)
+    
+    ranked = np.lexsort((-similarities[rows], -fused))[:limit]
+    return rows[ranked].astype(np.int32)
@@ -3,42 +3,91 @@ Yalie Search API - FastAPI Backend
 """
 
 import os
-from typing import Optional
+import hmac
+import ipaddress
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from fastapi import FastAPI, Query, Depends, HTTPException, Request
+from fastapi import APIRouter, FastAPI, Query, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from contextlib import asynccontextmanager
-import urllib.parse
-import requests
+from pydantic import BaseModel, Field
+import httpx
 
 from search import (
     initialize, 
-    search, 
-    find_similar,
-    get_person_by_id,
+    get_generation as get_index_generation,
+    search_hits, 
+    find_similar_hits,
+    get_person_json,
     get_filter_options,
     get_total_count,
-    get_cache_stats
+    get_cache_stats,
+    get_disk_cache_stats,
+    get_lexical_stats,
+    get_attribute_stats,
+    is_cached,
+    encode_query,
+    search_vector_hits,
+    range_search_hits,
+    CANDIDATE_POOL_SIZE,
+    RANGE_MAX_RESULTS,
+    reload_embeddings,
+    resolve_embeddings_path,
+    pin_queries,
+    warm_up
+)
+from shared_index import get_memory_stats
+from encoder import get_prompt_cache_stats, get_token_cache_stats, load_model
+from sharding import (
+    SHARD_COUNT,
+    SHARD_INDEX,
+    SHARD_TOKEN,
+    ShardUnavailable,
+    decode_vector,
+    is_coordinator,
+    is_shard_node,
+    start_coordinator,
+    close_coordinator,
+    get_coordinator
+)
+from cache_backends import get_stats as get_shared_cache_stats
+from responses import RawJSONResponse, json_response, render_object
+from pagination import encode_cursor, decode_cursor
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, render_metrics, timed, track_executor
+from profiling import ProfilingMiddleware, get_profiles, get_profiling_stats, dump_profiles
+from ratelimit import search_limit, similar_limit, admit_search
+from http_cache import (
+    HTTPCacheMiddleware,
+    CacheRule,
+    throttle,
+    time_bucket,
+    get_http_cache_stats
 )
 from auth import (
     get_current_user, 
+    get_admin_user,
     create_access_token, 
     get_cas_login_url, 
     get_cas_logout_url,
-    CAS_SERVER,
+    validate_cas_ticket,
+    start_cas_client,
+    close_cas_client,
     FRONTEND_URL,
-    BACKEND_URL
+    BACKEND_URL,
+    DEV_MODE
 )
 from moderation import is_query_allowed, is_query_allowed_async
 from analytics import (
     log_search,
     get_trending_searches,
     get_search_stats,
+    get_generation as get_analytics_generation,
     flush as flush_analytics
 )
 # LEADERBOARD IMPORTS - TEMPORARILY COMMENTED OUT
@@ -53,10 +102,27 @@ from analytics import (
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize search module on startup."""
+    import asyncio
+    
     print("Starting Yalie Search API...")
-    initialize()
+    if is_shard_node() and not SHARD_TOKEN:
+        raise RuntimeError("SHARD_TOKEN must be set on shard nodes")
+    if is_coordinator():
+        # Shards hold the embeddings; the coordinator only encodes queries
+        load_model()
+    else:
+        # Shard nodes load only their partition, not the model
+        initialize()
+    await start_cas_client()
+    await start_coordinator()
+    warmup_task = asyncio.create_task(_warm_up())
+    pin_task = asyncio.create_task(_pin_trending_loop())
     print("API ready!")
     yield
+    warmup_task.cancel()
+    pin_task.cancel()
+    await close_cas_client()
+    await close_coordinator()
     # Flush analytics on shutdown
     flush_analytics()
     print("Shutting down...")
@@ -67,7 +133,8 @@ app = FastAPI(
     # description="Find Yalies using AI-powered semantic search with CLIP embeddings",
     description="Find Yalies using semantic search",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=RawJSONResponse
 )
 
 # CORS for frontend
@@ -95,6 +162,49 @@ if FRONTEND_URL:
             if non_www_url not in allowed_origins:
                 allowed_origins.append(non_www_url)
 
+async def _admit_similar(request: Request):
+    """
+    Authenticate and rate-limit /api/similar before a cached response or 304
+    is served. Every request passes here, so this is where it's logged.
+    """
+    netid = await get_current_user(request)
+    await similar_limit.check(request, netid)
+    person_id = request.url.path.rsplit("/", 1)[-1]
+    print(f"Find similar to {person_id} by {netid}")
+
+
+_trending_generation = throttle(get_analytics_generation, 60)
+
+
+# ETags and rendered-response caching for read-mostly endpoints.
+# Added first (innermost) so compression and CORS still apply to cached responses.
+app.add_middleware(
+    HTTPCacheMiddleware,
+    rules=[
+        CacheRule(
+            "/api/filters",
+            generation=lambda: _data_generation(),
+            cache_control="public, max-age=3600"
+        ),
+        CacheRule(
+            "/api/trending",
+            # New searches show up within a minute; the hourly bucket catches
+            # old searches aging out of the period window
+            generation=lambda: (_trending_generation(), time_bucket(3600)),
+            cache_control="public, max-age=60"
+        ),
+        CacheRule(
+            "/api/similar/[^/]+",
+            generation=lambda: _data_generation(),
+            cache_control="private, max-age=300",
+            authenticate=_admit_similar
+        ),
+    ]
+)
+
+# gzip/brotli for larger responses (already-encoded cached responses pass through)
+app.add_middleware(CompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -103,6 +213,115 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Sampled request profiles and slow-query log (off unless configured)
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so request latency includes every other middleware
+app.add_middleware(MetricsMiddleware)
+
+# /metrics is closed outside DEV_MODE unless the scraper sends this bearer
+# token or connects from one of METRICS_ALLOW_IPS (comma-separated IPs/CIDRs)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_ALLOW_IPS = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in os.environ.get("METRICS_ALLOW_IPS", "").split(",") if entry.strip()
+]
+
+# Trending queries pre-searched at startup before /api/ready reports ready (0 = skip)
+WARMUP_QUERIES = int(os.environ.get("WARMUP_QUERIES", "50"))
+
+_warmup_status = {"done": False}
+
+
+async def _warm_up():
+    """Search this week's trending queries so they're cached before taking traffic."""
+    import asyncio
+    
+    try:
+        if WARMUP_QUERIES > 0 and not (is_coordinator() or is_shard_node()):
+            trending = get_trending_searches(period="week", limit=WARMUP_QUERIES, use_clustering=False)
+            queries = [item["query"] for item in trending]
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(
+                None,
+                track_executor("warmup", lambda: warm_up(queries))
+            )
+            _warmup_status.update(result)
+            print(f"Warmed {result['queries']} trending queries in {result['seconds']}s")
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+    finally:
+        _warmup_status["done"] = True
+
+
+# Trending queries per period (as shown by the TrendingSearches component)
+# kept precomputed in the pinned cache region, and how often to refresh (0 = off)
+PINNED_QUERIES = int(os.environ.get("PINNED_QUERIES", "20"))
+PIN_INTERVAL_SECONDS = float(os.environ.get("PIN_INTERVAL_SECONDS", "300"))
+PIN_FILTERS = tuple(
+    field.strip() for field in os.environ.get("PIN_FILTERS", "college,year").split(",")
+    if field.strip()
+)
+
+
+def _pin_trending() -> dict:
+    """Pin rankings for everything the trending panel can currently show."""
+    queries = []
+    for period in ("day", "week", "month"):
+        queries.extend(item["query"] for item in get_trending_searches(period=period, limit=PINNED_QUERIES))
+    return pin_queries(queries, PIN_FILTERS)
+
+
+async def _pin_trending_loop():
+    """Refresh the pinned trending results every PIN_INTERVAL_SECONDS."""
+    import asyncio
+    
+    # Sharded deployments search through the coordinator, which has no local rankings
+    if PIN_INTERVAL_SECONDS <= 0 or PINNED_QUERIES <= 0 or is_coordinator() or is_shard_node():
+        return
+    
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            result = await loop.run_in_executor(None, track_executor("pinning", _pin_trending))
+            print(f"Pinned {result['queries']} trending queries "
+                  f"({result['entries']} rankings) in {result['seconds']}s")
+        except Exception as e:
+            print(f"Pinning trending queries failed: {e}")
+        await asyncio.sleep(PIN_INTERVAL_SECONDS)
+
+
+def _data_generation():
+    """Changes whenever the searchable data does (local index or any shard)."""
+    coordinator = get_coordinator()
+    if coordinator is not None:
+        return coordinator.generation()
+    return get_index_generation()
+
+
+def _check_cursor_generation(page: dict):
+    """Refuse a cursor issued before the data was reloaded (its offsets are stale)."""
+    if page["generation"] != _data_generation():
+        raise HTTPException(status_code=410, detail="Results have changed, search again")
+
+
+def _shard_status() -> Optional[dict]:
+    coordinator = get_coordinator()
+    if coordinator is not None:
+        return {
+            "nodes": coordinator.nodes,
+            "generations": {str(shard): gen for shard, gen in sorted(coordinator.generations.items())}
+        }
+    if is_shard_node():
+        return {"index": SHARD_INDEX, "count": SHARD_COUNT}
+    return None
+
+
+def _require_local_index():
+    """Refuse endpoints that need the people data on a sharded coordinator."""
+    if is_coordinator():
+        raise HTTPException(status_code=501, detail="Not available on a sharded coordinator")
+
 
 #-------------------------------------------------------------------------#
 # Health & Info Endpoints
@@ -111,16 +330,83 @@ app.add_middleware(
 @app.get("/api/health")
 async def health():
     """Health check endpoint."""
+    import asyncio
+    
+    # Both caches may query SQLite or Redis for their sizes
+    loop = asyncio.get_event_loop()
+    disk_cache_stats = await loop.run_in_executor(None, track_executor("health", get_disk_cache_stats))
+    shared_cache_stats = await loop.run_in_executor(None, track_executor("health", get_shared_cache_stats))
     return {
         "status": "healthy", 
-        "total_people": get_total_count(),
-        "cache": get_cache_stats()
+        "total_people": get_total_count() if not is_coordinator() else None,
+        "shards": _shard_status(),
+        "cache": get_cache_stats(),
+        "encoder_cache": {
+            "prompts": get_prompt_cache_stats(),
+            "tokens": get_token_cache_stats()
+        },
+        "lexical_index": get_lexical_stats(),
+        "attributes": get_attribute_stats(),
+        "disk_cache": disk_cache_stats,
+        "shared_cache": shared_cache_stats,
+        "http_cache": get_http_cache_stats(),
+        "memory": get_memory_stats()
     }
 
 
+@app.get("/api/ready")
+async def ready():
+    """Readiness check: 503 until startup warm-up has finished."""
+    if not _warmup_status["done"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready", "warmup": _warmup_status}
+
+
+def _metrics_allowed(request: Request) -> bool:
+    if DEV_MODE:
+        return True
+    if METRICS_TOKEN and hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode()
+    ):
+        return True
+    if METRICS_ALLOW_IPS and request.client is not None:
+        try:
+            client = ipaddress.ip_address(request.client.host)
+        except ValueError:
+            return False
+        return any(client in network for network in METRICS_ALLOW_IPS)
+    return False
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """
+    Prometheus metrics in text exposition format.
+    Requires METRICS_TOKEN or a METRICS_ALLOW_IPS address (open in DEV_MODE).
+    """
+    if not _metrics_allowed(request):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    return PlainTextResponse(
+        render_metrics(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/api/filters")
 async def get_filters():
     """Get available filter options for college, year, and major."""
+    coordinator = get_coordinator()
+    if coordinator is not None:
+        try:
+            options, missing = await coordinator.filter_options()
+        except ShardUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        if missing:
+            # Don't let an incomplete list be cached for an hour
+            raise HTTPException(status_code=503, detail=f"Shards {missing} unavailable",
+                                headers={"Retry-After": "1"})
+        return options
     return get_filter_options()
 
 
@@ -139,30 +425,19 @@ async def login():
 @app.get("/api/auth/callback")
 async def auth_callback(ticket: str = Query(...)):
     """CAS callback endpoint - validates ticket and creates session."""
+    service_url = f"{BACKEND_URL}/api/auth/callback"
     try:
-        service_url = f"{BACKEND_URL}/api/auth/callback"
-        validate_url = (
-            f"{CAS_SERVER}/serviceValidate?"
-            f"ticket={ticket}&service={urllib.parse.quote(service_url)}"
-        )
-        
-        response = requests.get(validate_url, timeout=10)
-        response.raise_for_status()
-        
-        if "cas:authenticationSuccess" in response.text:
-            import re
-            match = re.search(r'<cas:user>(.*?)</cas:user>', response.text)
-            if match:
-                netid = match.group(1)
-                token = create_access_token(netid)
-                redirect_url = f"{FRONTEND_URL}?auth_token={token}"
-                return RedirectResponse(url=redirect_url)
-        
+        netid = await validate_cas_ticket(ticket, service_url)
+    except httpx.HTTPError as e:
+        print(f"Auth callback error: {e!r}")
+        raise HTTPException(status_code=502, detail="Authentication service unavailable")
+    
+    if not netid:
         raise HTTPException(status_code=401, detail="CAS authentication failed")
-        
-    except Exception as e:
-        print(f"Auth callback error: {e}")
-        raise HTTPException(status_code=500, detail="Authentication error")
+    
+    token = create_access_token(netid)
+    redirect_url = f"{FRONTEND_URL}?auth_token={token}"
+    return RedirectResponse(url=redirect_url)
 
 
 @app.get("/api/auth/logout")
@@ -187,27 +462,54 @@ async def get_user(netid: str = Depends(get_current_user)):
 
 @app.get("/api/search")
 async def search_endpoint(
-    q: str = Query(..., description="Search query"),
+    q: Optional[str] = Query(None, description="Search query"),
     k: int = Query(20, ge=1, le=50, description="Number of results"),
     college: Optional[str] = Query(None, description="Filter by college"),
     year: Optional[int] = Query(None, description="Filter by graduation year"),
     major: Optional[str] = Query(None, description="Filter by major"),
+    attributes: Optional[str] = Query(None, description="Comma-separated attributes people must have"),
     anonymous: bool = Query(False, description="Don't log this search"),
-    netid: str = Depends(get_current_user)
+    cursor: Optional[str] = Query(None, description="Cursor for the next page of results"),
+    facet_top: Optional[int] = Query(None, ge=1, le=CANDIDATE_POOL_SIZE,
+                                     description="Count facets over the top N candidates"),
+    facet_min_score: Optional[float] = Query(None, ge=-1, le=1,
+                                             description="Count facets over everyone scoring at least this"),
+    netid: str = Depends(search_limit)
 ):
     """
     Search for people matching the description.
-    Requires authentication.
+    Requires authentication. Rate limited per user; returns 429 (or 503 when
+    the server is overloaded) with Retry-After.
     
     - **q**: Text description (e.g., "person with glasses and dark hair")
     - **k**: Number of results to return (1-50, default 20)
     - **college**: Filter by college name (optional)
     - **year**: Filter by graduation year (optional)
     - **major**: Filter by major (optional)
+    - **attributes**: Comma-separated attributes from /api/filters (e.g.
+      "glasses,curly hair"); keeps people who rank high on all of them
     - **anonymous**: If true, search is not logged for analytics
+    - **cursor**: `next_cursor` from a previous response; fetches the next
+      page of the same search (q and filters are taken from the cursor)
+    - **facet_top**: Also return `facets`: how many of the top N candidates
+      fall in each college, year and major (optional, first page only)
+    - **facet_min_score**: Like facet_top, but counting everyone with at
+      least this similarity score (optional; use one or the other)
     """
     import asyncio
     
+    if cursor:
+        return await _next_page(cursor, k, netid)
+    
+    if not q:
+        raise HTTPException(status_code=400, detail="Missing search query")
+    if facet_top is not None and facet_min_score is not None:
+        raise HTTPException(status_code=400, detail="Use facet_top or facet_min_score, not both")
+    
+    attrs = _parse_attributes(attributes)
+    # A threshold count may have to rescore a cached query
+    admit_search(cached=is_cached(q, college, year, major, attrs) and facet_min_score is None)
+    
     print(f"Search by {netid}: {q}")
     
     # Run moderation and search in PARALLEL for better performance
@@ -215,15 +517,13 @@ async def search_endpoint(
     moderation_task = asyncio.create_task(is_query_allowed_async(q))
     
     # Run search in thread pool (CPU-bound operation)
-    loop = asyncio.get_event_loop()
-    search_task = loop.run_in_executor(
-        None,
-        lambda: search(q, k=k, college=college, year=year, major=major)
-    )
+    search_task = asyncio.ensure_future(_run_search(
+        q, k, college, year, major, attrs, facet_top=facet_top, facet_min_score=facet_min_score
+    ))
     
     # Wait for both to complete
     is_allowed, reason = await moderation_task
-    results = await search_task
+    hits = await search_task
     
     # Check moderation result - if blocked, discard search results
     if not is_allowed:
@@ -234,28 +534,301 @@ async def search_endpoint(
     
     # Log search for analytics (unless anonymous)
     if not anonymous:
-        log_search(q, user=netid, result_count=len(results))
+        log_search(q, user=netid, result_count=len(hits))
         # LEADERBOARD - TEMPORARILY COMMENTED OUT
-        # record_appearances(q, results)
+        # record_appearances(q, hits.to_dicts())
     
-    return {
+    return _search_response(q, college, year, major, attrs, hits)
+
+
+def _parse_attributes(attributes: Optional[str]) -> Tuple[str, ...]:
+    """Attribute filter from its comma-separated query parameter."""
+    if not attributes:
+        return ()
+    return tuple(sorted({name.strip() for name in attributes.split(",") if name.strip()}))
+
+
+async def _run_search(q: str, k: int, college: Optional[str], year: Optional[int],
+                      major: Optional[str], attrs: Tuple[str, ...] = (), offset: int = 0,
+                      facet_top: Optional[int] = None, facet_min_score: Optional[float] = None):
+    """
+    Rank one page of results, locally or (on a coordinator) across the shards,
+    with facet counts if facet_top or facet_min_score is given.
+    
+    Encoding and local scoring run in the thread pool. Raises 503 if no shard
+    answers in time.
+    """
+    import asyncio
+    
+    loop = asyncio.get_event_loop()
+    coordinator = get_coordinator()
+    if coordinator is None:
+        return await loop.run_in_executor(
+            None,
+            track_executor("search", lambda: search_hits(q, k=k, college=college, year=year,
+                                                         major=major, offset=offset,
+                                                         attribute_filter=attrs,
+                                                         facet_top=facet_top,
+                                                         facet_min_score=facet_min_score))
+        )
+    
+    query_norm = await loop.run_in_executor(None, track_executor("search", lambda: encode_query(q)))
+    try:
+        return await coordinator.search(query_norm, k, college, year, major, attrs,
+                                        offset=offset, pool_size=CANDIDATE_POOL_SIZE,
+                                        facet_top=facet_top, facet_min_score=facet_min_score)
+    except ShardUnavailable as e:
+        print(f"Sharded search failed: {e}")
+        raise HTTPException(status_code=503, detail="Search is temporarily unavailable",
+                            headers={"Retry-After": "1"})
+
+
+async def _next_page(cursor: str, k: int, netid: str):
+    """
+    Serve a later page of a search from its cursor.
+    
+    Cursors are only issued for queries that passed moderation, so this skips
+    moderation and analytics and just slices the cached candidate list.
+    """
+    try:
+        page = decode_cursor(cursor)
+    except (ValueError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    if page["min_score"] is not None:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    _check_cursor_generation(page)
+    
+    q, college, year, major = page["query"], page["college"], page["year"], page["major"]
+    attrs = page["attributes"]
+    admit_search(cached=is_cached(q, college, year, major, attrs))
+    print(f"Search page by {netid}: {q} (offset {page['offset']})")
+    
+    hits = await _run_search(q, k, college, year, major, attrs, offset=page["offset"])
+    
+    return _search_response(q, college, year, major, attrs, hits)
+
+
+def _search_fields(q: str, college: Optional[str], year: Optional[int],
+                   major: Optional[str], attrs: Tuple[str, ...], hits) -> dict:
+    """Response metadata for a page of search results."""
+    next_cursor = None
+    if hits.has_more:
+        next_cursor = encode_cursor(q, college, year, major, hits.offset + len(hits), attrs,
+                                    generation=_data_generation())
+    
+    fields = {
         "query": q,
-        "count": len(results),
+        "count": len(hits),
         "search_type": "text",
         "filters": {
             "college": college,
             "year": year,
-            "major": major
+            "major": major,
+            "attributes": list(attrs)
         },
-        "results": results
+        "offset": hits.offset,
+        "next_cursor": next_cursor
     }
+    if hits.facets is not None:
+        fields["facets"] = hits.facets
+    if getattr(hits, "partial", False):
+        # Some shards missed the deadline; results cover the rest
+        fields["partial"] = True
+        fields["missing_shards"] = hits.missing_shards
+    return fields
+
+
+def _search_response(q: str, college: Optional[str], year: Optional[int],
+                     major: Optional[str], attrs: Tuple[str, ...], hits):
+    with timed("serialization"):
+        return json_response(
+            _search_fields(q, college, year, major, attrs, hits),
+            raw={"results": hits.to_json()}
+        )
+
+
+def _stream_event(event: str, fields: dict, raw: Optional[dict], sse: bool) -> bytes:
+    """Encode one streamed event as an SSE message or an NDJSON line."""
+    if sse:
+        return b"event: " + event.encode() + b"\ndata: " + render_object(fields, raw) + b"\n\n"
+    return render_object(dict({"event": event}, **fields), raw) + b"\n"
+
+
+@app.get("/api/search/stream")
+async def search_stream_endpoint(
+    q: str = Query(..., description="Search query"),
+    k: int = Query(20, ge=1, le=50, description="Number of results"),
+    college: Optional[str] = Query(None, description="Filter by college"),
+    year: Optional[int] = Query(None, description="Filter by graduation year"),
+    major: Optional[str] = Query(None, description="Filter by major"),
+    attributes: Optional[str] = Query(None, description="Comma-separated attributes people must have"),
+    anonymous: bool = Query(False, description="Don't log this search"),
+    stream_format: str = Query("ndjson", alias="format", description="Stream format: ndjson or sse"),
+    netid: str = Depends(search_limit)
+):
+    """
+    Search with results streamed as soon as they are scored.
+    Requires authentication.
+    
+    Takes the same parameters as /api/search. The gain over /api/search is
+    not waiting for moderation: results are sent when scoring finishes, and
+    moderation's verdict follows. Events, in order:
+    
+    - **results**: the results up to k, sent as soon as scoring finishes
+      (moderation may still be running)
+    - **done**: search metadata (count, filters, next_cursor) once moderation
+      allowed the query - only now should the results be treated as final
+    - **blocked**: sent instead of done if moderation rejected the query;
+      clients must discard any results already shown
+    - **error**: the search failed
+    
+    With format=ndjson each event is one JSON line with an "event" field;
+    with format=sse events are Server-Sent Events.
+    """
+    import asyncio
+    
+    attrs = _parse_attributes(attributes)
+    admit_search(cached=is_cached(q, college, year, major, attrs))
+    
+    sse = stream_format == "sse"
+    print(f"Streaming search by {netid}: {q}")
+    
+    moderation_task = asyncio.create_task(is_query_allowed_async(q))
+    search_task = asyncio.ensure_future(_run_search(q, k, college, year, major, attrs))
+    
+    async def events():
+        try:
+            hits = await search_task
+        except Exception as e:
+            print(f"Streaming search error: {e}")
+            moderation_task.cancel()
+            yield _stream_event("error", {"detail": "Search failed"}, None, sse)
+            return
+        
+        # If moderation already answered (e.g. cached), don't leak blocked results
+        if len(hits) and not (moderation_task.done() and not moderation_task.result()[0]):
+            yield _stream_event("results", {"offset": hits.offset}, {"results": hits.to_json()}, sse)
+        
+        is_allowed, reason = await moderation_task
+        if not is_allowed:
+            yield _stream_event("blocked", {"detail": f"Query not allowed: {reason}"}, None, sse)
+            return
+        
+        if not anonymous:
+            log_search(q, user=netid, result_count=len(hits))
+        
+        yield _stream_event("done", _search_fields(q, college, year, major, attrs, hits), None, sse)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/search/range")
+async def search_range_endpoint(
+    q: Optional[str] = Query(None, description="Search query"),
+    min_score: Optional[float] = Query(None, ge=-1, le=1, description="Minimum similarity score"),
+    limit: int = Query(200, ge=1, le=RANGE_MAX_RESULTS, description="Most results per page"),
+    college: Optional[str] = Query(None, description="Filter by college"),
+    year: Optional[int] = Query(None, description="Filter by graduation year"),
+    major: Optional[str] = Query(None, description="Filter by major"),
+    attributes: Optional[str] = Query(None, description="Comma-separated attributes people must have"),
+    anonymous: bool = Query(False, description="Don't log this search"),
+    cursor: Optional[str] = Query(None, description="Cursor for the next page of results"),
+    netid: str = Depends(search_limit)
+):
+    """
+    Find everyone whose similarity to the description is at least min_score.
+    Requires authentication. Not available on a sharded coordinator.
+    
+    Unlike /api/search, results aren't capped at the top few hundred: pages
+    walk the whole directory in a fixed order (not by score), each stopping
+    as soon as it holds `limit` matches. Follow `next_cursor` until it is
+    null to get every match.
+    
+    - **q**: Text description
+    - **min_score**: Similarity threshold (-1 to 1)
+    - **limit**: Most results per page (default 200)
+    - **college**, **year**, **major**, **attributes**: Filters, as for /api/search
+    - **cursor**: `next_cursor` from a previous response (q, min_score and
+      filters are taken from the cursor)
+    """
+    import asyncio
+    
+    _require_local_index()
+    start = 0
+    if cursor:
+        try:
+            page = decode_cursor(cursor)
+        except (ValueError, KeyError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if page["min_score"] is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        _check_cursor_generation(page)
+        q, college, year, major = page["query"], page["college"], page["year"], page["major"]
+        attrs, min_score, start = page["attributes"], page["min_score"], page["offset"]
+    else:
+        if not q:
+            raise HTTPException(status_code=400, detail="Missing search query")
+        if min_score is None:
+            raise HTTPException(status_code=400, detail="Missing min_score")
+        attrs = _parse_attributes(attributes)
+    
+    admit_search(cached=False)
+    print(f"Range search by {netid}: {q} (min_score {min_score}, row {start})")
+    
+    loop = asyncio.get_event_loop()
+    search_task = asyncio.ensure_future(loop.run_in_executor(
+        None,
+        track_executor("search", lambda: range_search_hits(
+            q, min_score, limit=limit, start=start, college=college, year=year,
+            major=major, attribute_filter=attrs
+        ))
+    ))
+    
+    # Cursors are only issued for queries that passed moderation
+    if not cursor:
+        is_allowed, reason = await is_query_allowed_async(q)
+        if not is_allowed:
+            search_task.cancel()
+            raise HTTPException(status_code=400, detail=f"Query not allowed: {reason}")
+    hits, next_row = await search_task
+    
+    if not cursor and not anonymous:
+        log_search(q, user=netid, result_count=len(hits))
+    
+    next_cursor = None
+    if next_row is not None:
+        next_cursor = encode_cursor(q, college, year, major, next_row, attrs, min_score=min_score,
+                                    generation=_data_generation())
+    
+    with timed("serialization"):
+        return json_response(
+            {
+                "query": q,
+                "min_score": min_score,
+                "count": len(hits),
+                "search_type": "range",
+                "filters": {
+                    "college": college,
+                    "year": year,
+                    "major": major,
+                    "attributes": list(attrs)
+                },
+                "next_cursor": next_cursor
+            },
+            raw={"results": hits.to_json()}
+        )
 
 
 @app.get("/api/similar/{person_id}")
 async def similar_endpoint(
     person_id: str,
     k: int = Query(10, ge=1, le=50, description="Number of results"),
-    netid: str = Depends(get_current_user)
+    netid: str = Depends(similar_limit)
 ):
     """
     Find people similar to a specific person.
@@ -264,23 +837,100 @@ async def similar_endpoint(
     - **person_id**: The ID of the person to find similar faces to
     - **k**: Number of results to return (1-50, default 10)
     """
-    print(f"Find similar to {person_id} by {netid}")
+    _require_local_index()
     
     # Get person info
-    person = get_person_by_id(person_id)
+    person = get_person_json(person_id)
     if not person:
         raise HTTPException(status_code=404, detail="Person not found")
     
-    results = find_similar(person_id, k=k)
+    hits = find_similar_hits(person_id, k=k)
+    
+    with timed("serialization"):
+        return json_response(
+            {
+                "count": len(hits),
+                "search_type": "similar"
+            },
+            raw={"person": person, "results": hits.to_json()}
+        )
+
+
+#-------------------------------------------------------------------------#
+# Shard Endpoints (called by a coordinator, see sharding.py)
+#-------------------------------------------------------------------------#
+
+# Only mounted on shard nodes (see the end of this section)
+shard_router = APIRouter(prefix="/internal/shard", include_in_schema=False)
+
+
+class ShardSearchRequest(BaseModel):
+    vector: str
+    # A coordinator asks for offset + k, and offsets stop at the candidate pool
+    k: int = Field(10, ge=1, le=CANDIDATE_POOL_SIZE + 50)
+    college: Optional[str] = None
+    year: Optional[int] = None
+    major: Optional[str] = None
+    attributes: List[str] = []
+    facet_min_score: Optional[float] = Field(None, ge=-1, le=1)
+
+
+def _check_shard_token(request: Request):
+    if not SHARD_TOKEN or not hmac.compare_digest(
+        request.headers.get("X-Shard-Token", "").encode(), SHARD_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+
+@shard_router.post("/search")
+async def shard_search_endpoint(body: ShardSearchRequest, request: Request):
+    """Rank this node's people against an encoded query."""
+    import asyncio
+    
+    _check_shard_token(request)
+    _require_local_index()
+    try:
+        query_norm = decode_vector(body.vector)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid vector")
     
+    loop = asyncio.get_event_loop()
+    try:
+        hits = await loop.run_in_executor(
+            None,
+            track_executor("search", lambda: search_vector_hits(
+                query_norm, k=body.k, college=body.college, year=body.year, major=body.major,
+                attribute_filter=tuple(body.attributes), facet_min_score=body.facet_min_score
+            ))
+        )
+    except ValueError:
+        # Vector doesn't match the embedding dimension
+        raise HTTPException(status_code=400, detail="Invalid vector")
+    
+    fields = {"shard": SHARD_INDEX, "generation": get_index_generation(), "total": hits.total}
+    if hits.facets is not None:
+        fields["facets"] = hits.facets
+    with timed("serialization"):
+        return json_response(fields, raw={"results": hits.to_json()})
+
+
+@shard_router.get("/info")
+async def shard_info_endpoint(request: Request):
+    """This node's partition: size, generation and filter options."""
+    _check_shard_token(request)
+    _require_local_index()
     return {
-        "person": person,
-        "count": len(results),
-        "search_type": "similar",
-        "results": results
+        "shard": SHARD_INDEX,
+        "generation": get_index_generation(),
+        "total_people": get_total_count(),
+        "filter_options": get_filter_options()
     }
 
 
+if is_shard_node():
+    app.include_router(shard_router)
+
+
 #-------------------------------------------------------------------------#
 # Analytics/Trending Endpoints
 #-------------------------------------------------------------------------#
@@ -313,6 +963,79 @@ async def stats_endpoint(netid: str = Depends(get_current_user)):
     return get_search_stats()
 
 
+#-------------------------------------------------------------------------#
+# Admin Endpoints
+#-------------------------------------------------------------------------#
+
+@app.post("/api/admin/reload")
+async def reload_endpoint(
+    path: Optional[str] = Query(None, description="Embeddings file in EMBEDDINGS_DIR to load"),
+    netid: str = Depends(get_admin_user)
+):
+    """
+    Reload the embeddings file without restarting.
+    Requires admin access.
+    
+    The new index is built in a worker thread and swapped in atomically;
+    searches already running finish on the old data.
+    
+    - **path**: Name of a .json file in EMBEDDINGS_DIR (optional, defaults
+      to the current file)
+    """
+    import asyncio
+    
+    _require_local_index()
+    print(f"Embeddings reload requested by {netid}")
+    
+    if path is not None:
+        try:
+            path = resolve_embeddings_path(path)
+        except ValueError as e:
+            print(f"Embeddings reload refused: {e}")
+            raise HTTPException(status_code=400, detail="path must be a .json file in the embeddings directory")
+    
+    loop = asyncio.get_event_loop()
+    try:
+        result = await loop.run_in_executor(None, track_executor("reload", lambda: reload_embeddings(path)))
+    except (OSError, ValueError, KeyError) as e:
+        # Details stay in the server log; they can contain file contents
+        print(f"Embeddings reload failed: {e}")
+        raise HTTPException(status_code=400, detail="Reload failed, see the server log")
+    
+    return result
+
+
+@app.get("/api/admin/profiles")
+async def profiles_endpoint(
+    limit: int = Query(50, ge=1, le=1000, description="Number of profiles"),
+    slow_only: bool = Query(False, description="Only requests over SLOW_QUERY_MS"),
+    netid: str = Depends(get_admin_user)
+):
+    """
+    List recent request profiles, newest first.
+    Requires admin access.
+    
+    Each profile has the request path and search parameters, status, total
+    duration and milliseconds spent per stage.
+    """
+    return {
+        "profiling": get_profiling_stats(),
+        "profiles": get_profiles(limit=limit, slow_only=slow_only)
+    }
+
+
+@app.post("/api/admin/profiles/dump")
+async def dump_profiles_endpoint(netid: str = Depends(get_admin_user)):
+    """
+    Write the buffered profiles to persistent/profiles as JSON lines.
+    Requires admin access.
+    """
+    import asyncio
+    
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, dump_profiles)
+
+
 # LEADERBOARD ENDPOINTS - TEMPORARILY COMMENTED OUT
 # #-------------------------------------------------------------------------#
 # # Leaderboard Endpoints
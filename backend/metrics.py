@@ -0,0 +1,316 @@
+"""
+Metrics Module
+Lightweight counters, gauges and histograms exported in Prometheus text format.
+
+Recording a sample is a perf_counter() call, a bisect and a locked dict
+update, so timers can wrap every stage of every request. The shared metrics
+used across the backend (stage timings, cache hits, executor queue depth) are
+defined at the bottom of this module.
+"""
+
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from starlette.routing import Match
+
+#-------------------------------------------------------------------------#
+# Metric Types
+#-------------------------------------------------------------------------#
+
+_registry: List["_Metric"] = []
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow encodes
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...],
+                   extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down.
+    
+    A callback can be given instead of setting values, for gauges that read
+    state owned elsewhere (e.g. cache sizes).
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        if self._callback is not None:
+            lines.append(f"{self.name} {_format_value(self._callback())}")
+            return lines
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Time a block and observe its duration in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, counts in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_str = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Render every registered metric in Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+#-------------------------------------------------------------------------#
+# Shared Metrics
+#-------------------------------------------------------------------------#
+
+STAGE_SECONDS = Histogram(
+    "yaliesearch_stage_seconds",
+    "Time spent in each request stage",
+    labels=("stage",)
+)
+
+REQUEST_SECONDS = Histogram(
+    "yaliesearch_request_seconds",
+    "End-to-end HTTP request latency",
+    labels=("route", "method", "status")
+)
+
+CACHE_REQUESTS = Counter(
+    "yaliesearch_cache_requests_total",
+    "Cache lookups by cache and result (hit/miss)",
+    labels=("cache", "result")
+)
+
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "yaliesearch_executor_queue_depth",
+    "Blocking calls submitted to the thread pool but not yet started",
+    labels=("task",)
+)
+
+EXECUTOR_RUNNING = Gauge(
+    "yaliesearch_executor_running",
+    "Blocking calls currently running in the thread pool",
+    labels=("task",)
+)
+
+
+# Per-request list of (stage, seconds), set while a request is being profiled
+current_stages: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar(
+    "current_stages", default=None
+)
+
+
+@contextmanager
+def timed(stage: str):
+    """Context manager (or decorator) timing one request stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        stages = current_stages.get()
+        if stages is not None:
+            stages.append((stage, elapsed))
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def track_executor(task: str, fn: Callable) -> Callable:
+    """
+    Wrap a callable about to be submitted to a thread pool so its queueing
+    and running time show up in the executor gauges.
+    
+    The caller's context is carried into the worker thread (run_in_executor
+    doesn't do this), so stage timings reach the request's profile.
+    """
+    EXECUTOR_QUEUE_DEPTH.inc(task=task)
+    context = contextvars.copy_context()
+
+    def run():
+        EXECUTOR_QUEUE_DEPTH.dec(task=task)
+        EXECUTOR_RUNNING.inc(task=task)
+        try:
+            return context.run(fn)
+        finally:
+            EXECUTOR_RUNNING.dec(task=task)
+    
+    return run
+
+
+def executor_queue_depth() -> float:
+    """Total calls waiting for a thread pool worker, across all tasks."""
+    return sum(EXECUTOR_QUEUE_DEPTH._values.values())
+
+
+#-------------------------------------------------------------------------#
+# Request Timing Middleware
+#-------------------------------------------------------------------------#
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency by route template."""
+
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start = time.perf_counter()
+        status = {"code": 500}
+        
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                route=_route_label(scope),
+                method=scope["method"],
+                status=str(status["code"])
+            )
+
+
+def _route_label(scope) -> str:
+    """
+    Route template for a request (e.g. /api/similar/{person_id}).
+    
+    The router records the matched route in the scope. Responses served by
+    middleware (cached responses, 304s) never reach the router, so those are
+    matched here. Unknown paths share one label to keep label values bounded.
+    """
+    route = scope.get("route")
+    if route is None and "app" in scope:
+        for candidate in getattr(scope["app"], "routes", []):
+            if candidate.matches(scope)[0] == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", None) or "unmatched"
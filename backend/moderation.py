@@ -5,13 +5,22 @@ Uses GPT-4o-mini to classify search queries as appropriate or harmful
 
 import os
 import json
-from typing import Dict
+from typing import Dict, Optional
 from openai import OpenAI
 
+import cache_backends
+from canonical import canonicalize
+from metrics import timed, track_executor, record_cache
+
 # Configuration
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 DISABLE_MODERATION = os.environ.get("DISABLE_MODERATION", "false").lower() == "true"
 
+# Verdicts remembered per canonical query (0 = no cache); the size only
+# bounds the per-process cache, a shared backend has its own limit
+MODERATION_CACHE_SIZE = int(os.environ.get("MODERATION_CACHE_SIZE", "4096"))
+MODERATION_CACHE_TTL = float(os.environ.get("MODERATION_CACHE_TTL", "86400"))
+
 # Initialize OpenAI client
 client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
@@ -130,6 +139,63 @@ REMEMBER: Block ONLY genuinely harmful, derogatory, sexual, or dangerous content
 """
 
 
+#-------------------------------------------------------------------------#
+# Verdict Cache
+#-------------------------------------------------------------------------#
+
+def _verdict_cache() -> cache_backends.CacheBackend:
+    # Shared between workers when SHARED_CACHE_URL is set
+    return cache_backends.get_backend("moderation", max_entries=MODERATION_CACHE_SIZE)
+
+
+def _moderated_text(query: str) -> str:
+    """
+    The text sent to the model and used as the cache key: the canonical form,
+    which is also what gets encoded, so a verdict covers exactly the text it
+    was given for.
+    """
+    return canonicalize(query) or query
+
+
+def _get_verdict(text: str) -> Optional[Dict[str, str]]:
+    """Cached verdict for a moderated text."""
+    if MODERATION_CACHE_SIZE <= 0:
+        return None
+    
+    data = _verdict_cache().get(f"moderation:{text}")
+    record_cache("moderation", data is not None)
+    return json.loads(data) if data is not None else None
+
+
+def _set_verdict(text: str, verdict: Dict[str, str]):
+    """Remember a verdict from the model. Fail-open fallbacks are never cached."""
+    if MODERATION_CACHE_SIZE <= 0:
+        return
+    
+    _verdict_cache().set(
+        f"moderation:{text}",
+        json.dumps(verdict).encode(),
+        MODERATION_CACHE_TTL
+    )
+
+
+def clear_verdict_cache():
+    """Forget cached verdicts (with a shared backend, this clears all of it)."""
+    _verdict_cache().clear()
+
+
+def _parse_verdict(response) -> Dict[str, str]:
+    result = json.loads(response.choices[0].message.content)
+    return {
+        "decision": result.get("decision", "BLOCK"),
+        "reason": result.get("reason", "Content policy check")
+    }
+
+
+#-------------------------------------------------------------------------#
+# Moderation
+#-------------------------------------------------------------------------#
+
 def moderate_query(query: str) -> Dict[str, str]:
     """
     Check if a search query is appropriate (sync version).
@@ -149,23 +215,27 @@ def moderate_query(query: str) -> Dict[str, str]:
         print("WARNING: No OpenAI API key configured, moderation disabled")
         return {"decision": "ALLOW", "reason": "Moderation unavailable"}
     
+    text = _moderated_text(query)
+    cached = _get_verdict(text)
+    if cached is not None:
+        return cached
+    
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": MODERATION_PROMPT},
-                {"role": "user", "content": f'Query to moderate: "{query}"'}
-            ],
-            temperature=0,
-            max_tokens=100,
-            response_format={"type": "json_object"}
-        )
+        with timed("moderation"):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": MODERATION_PROMPT},
+                    {"role": "user", "content": f'Query to moderate: "{text}"'}
+                ],
+                temperature=0,
+                max_tokens=100,
+                response_format={"type": "json_object"}
+            )
         
-        result = json.loads(response.choices[0].message.content)
-        return {
-            "decision": result.get("decision", "BLOCK"),
-            "reason": result.get("reason", "Content policy check")
-        }
+        verdict = _parse_verdict(response)
+        _set_verdict(text, verdict)
+        return verdict
         
     except Exception as e:
         print(f"Moderation error: {e}")
@@ -194,28 +264,33 @@ async def moderate_query_async(query: str) -> Dict[str, str]:
         print("WARNING: No OpenAI API key configured, moderation disabled")
         return {"decision": "ALLOW", "reason": "Moderation unavailable"}
     
+    text = _moderated_text(query)
+    loop = asyncio.get_event_loop()
+    # The verdict cache may be SQLite or Redis, so it's read off the event loop too
+    cached = await loop.run_in_executor(None, track_executor("moderation", lambda: _get_verdict(text)))
+    if cached is not None:
+        return cached
+    
     try:
         # Run the blocking OpenAI call in a thread pool to not block the event loop
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": MODERATION_PROMPT},
-                    {"role": "user", "content": f'Query to moderate: "{query}"'}
-                ],
-                temperature=0,
-                max_tokens=100,
-                response_format={"type": "json_object"}
+        with timed("moderation"):
+            response = await loop.run_in_executor(
+                None,
+                track_executor("moderation", lambda: client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "system", "content": MODERATION_PROMPT},
+                        {"role": "user", "content": f'Query to moderate: "{text}"'}
+                    ],
+                    temperature=0,
+                    max_tokens=100,
+                    response_format={"type": "json_object"}
+                ))
             )
-        )
         
-        result = json.loads(response.choices[0].message.content)
-        return {
-            "decision": result.get("decision", "BLOCK"),
-            "reason": result.get("reason", "Content policy check")
-        }
+        verdict = _parse_verdict(response)
+        await loop.run_in_executor(None, track_executor("moderation", lambda: _set_verdict(text, verdict)))
+        return verdict
         
     except Exception as e:
         print(f"Moderation error: {e}")
@@ -0,0 +1,88 @@
+"""
+Pagination Module
+Opaque cursors for paging through search results.
+
+A cursor carries the query, filters and offset of the next page, signed with
+the server secret. The signature shows the query already passed moderation
+when the first page was served, so later pages skip moderation and only slice
+the cached candidate list.
+
+Cursors also carry the generation of the data they were issued for, so a
+page isn't served from a different directory after a reload.
+
+Range-search cursors also carry the score threshold, and their offset is the
+row the scan resumes from.
+"""
+
+import hmac
+import json
+import base64
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+
+from auth import JWT_SECRET
+
+SIGNATURE_BYTES = 16
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(JWT_SECRET.encode("utf-8"), payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def encode_cursor(query: str, college: Optional[str], year: Optional[int],
+                  major: Optional[str], offset: int, attributes: Tuple[str, ...] = (),
+                  min_score: Optional[float] = None, generation: Any = None) -> str:
+    """Create a signed cursor pointing at a page of a query's results."""
+    data = {"q": query, "c": college, "y": year, "m": major, "o": offset, "g": generation}
+    if attributes:
+        data["a"] = list(attributes)
+    if min_score is not None:
+        data["s"] = min_score
+    payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Verify and unpack a cursor.
+    
+    Returns:
+        Dict with query, college, year, major, attributes, offset,
+        min_score (None unless it is a range-search cursor) and generation
+    
+    Raises:
+        ValueError: If the cursor is malformed or its signature doesn't match
+    """
+    try:
+        payload_part, signature_part = cursor.split(".")
+        payload = _b64decode(payload_part)
+        signature = _b64decode(signature_part)
+    except (ValueError, UnicodeEncodeError):
+        raise ValueError("Malformed cursor")
+    
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise ValueError("Invalid cursor signature")
+    
+    data = json.loads(payload)
+    offset = data["o"]
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor offset")
+    
+    return {
+        "query": data["q"],
+        "college": data["c"],
+        "year": data["y"],
+        "major": data["m"],
+        "attributes": tuple(data.get("a", ())),
+        "offset": offset,
+        "min_score": data.get("s"),
+        "generation": data.get("g"),
+    }
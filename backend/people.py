@@ -0,0 +1,342 @@
+"""
+People Module
+Column-oriented store for person metadata.
+
+Each field is one column instead of one dict per person. Colleges and majors
+are stored as small integer codes into sorted string tables, so filters are
+vectorized comparisons and the same college name is held once rather than
+thousands of times.
+
+For the shared index, per-person strings and pre-serialized JSON are packed
+into flat byte buffers (PackedBytes) that workers memory-map instead of each
+holding its own copy.
+"""
+
+import sys
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+# Code used for a missing college/major, and the year used for a missing year
+MISSING_CODE = -1
+MISSING_YEAR = 0
+
+# Code for filter values not in the table - matches no row
+NO_MATCH_CODE = -2
+
+# Per-person string columns, in output order
+STRING_COLUMNS = ("first_name", "last_name", "image", "email")
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _encode(values: List[Optional[str]]) -> Tuple[np.ndarray, List[str]]:
+    """Dictionary-encode a string column into codes and a sorted table."""
+    table = sorted({v for v in values if v})
+    positions = {v: i for i, v in enumerate(table)}
+    codes = np.array(
+        [positions[v] if v else MISSING_CODE for v in values],
+        dtype=np.int16
+    )
+    return codes, table
+
+
+class PackedBytes:
+    """
+    Read-only sequence of byte strings stored in one buffer.
+    
+    Item i is data[offsets[i]:offsets[i + 1]], or None where missing is set.
+    The arrays can be memory-mapped, so every worker shares one copy.
+    """
+    
+    __slots__ = ("data", "offsets", "missing", "_view")
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray, missing: Optional[np.ndarray] = None):
+        self.data = data
+        self.offsets = offsets
+        self.missing = missing
+        self._view = memoryview(data)
+
+    @classmethod
+    def pack(cls, values: List[Optional[bytes]]) -> "PackedBytes":
+        lengths = np.array([len(v) if v is not None else 0 for v in values], dtype=np.int64)
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        data = np.frombuffer(b"".join(v for v in values if v is not None), dtype=np.uint8)
+        missing = np.array([v is None for v in values], dtype=bool)
+        return cls(data, offsets, missing if missing.any() else None)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Optional[bytes]:
+        if self.missing is not None and self.missing[i]:
+            return None
+        return bytes(self._view[int(self.offsets[i]):int(self.offsets[i + 1])])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def to_arrays(self, name: str) -> Dict[str, np.ndarray]:
+        arrays = {f"{name}_data": self.data, f"{name}_offsets": self.offsets}
+        if self.missing is not None:
+            arrays[f"{name}_missing"] = self.missing
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], name: str) -> "PackedBytes":
+        return cls(arrays[f"{name}_data"], arrays[f"{name}_offsets"], arrays.get(f"{name}_missing"))
+
+
+class PackedStrings(PackedBytes):
+    """PackedBytes holding UTF-8 text; items are str (or None)."""
+    
+    __slots__ = ()
+
+    @classmethod
+    def pack(cls, values: List[Optional[str]]) -> "PackedStrings":
+        packed = PackedBytes.pack([v.encode("utf-8") if v is not None else None for v in values])
+        return cls(packed.data, packed.offsets, packed.missing)
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        value = PackedBytes.__getitem__(self, i)
+        return value.decode("utf-8") if value is not None else None
+
+
+class PersonTable:
+    """Immutable columnar table of person metadata, indexed by matrix row."""
+    
+    __slots__ = (
+        "ids", "first_name", "last_name", "image", "email",
+        "college_codes", "colleges", "years", "major_codes", "majors",
+        "fragments", "_row_by_id", "_college_index", "_major_index",
+        "_year_values", "_year_codes"
+    )
+
+    def __init__(self, ids: List[Any], strings: Dict[str, Sequence[Optional[str]]],
+                 college_codes: np.ndarray, colleges: List[str], years: np.ndarray,
+                 major_codes: np.ndarray, majors: List[str],
+                 fragments: Optional[Sequence[bytes]] = None):
+        self.ids = ids
+        self.first_name = strings["first_name"]
+        self.last_name = strings["last_name"]
+        self.image = strings["image"]
+        self.email = strings["email"]
+        self.college_codes = college_codes
+        self.colleges = colleges
+        self.years = years
+        self.major_codes = major_codes
+        self.majors = majors
+        
+        self._college_index = {c: i for i, c in enumerate(colleges)}
+        self._major_index = {m: i for i, m in enumerate(majors)}
+        # Years coded like colleges and majors, for counting
+        self._year_values, year_codes = np.unique(years, return_inverse=True)
+        self._year_codes = year_codes.astype(np.int16)
+        
+        self._row_by_id = {}
+        for row, person_id in enumerate(ids):
+            if person_id:
+                self._row_by_id[person_id] = row
+        
+        self.fragments = self._serialize_rows() if fragments is None else fragments
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "PersonTable":
+        """Build a table from parsed directory records (list of dicts)."""
+        ids = [r.get("id") or r.get("netid") for r in records]
+        strings = {
+            "first_name": [_intern(r.get("first_name", "")) for r in records],
+            "last_name": [_intern(r.get("last_name", "")) for r in records],
+            "image": [r.get("image") for r in records],
+            "email": [r.get("email") for r in records],
+        }
+        college_codes, colleges = _encode([r.get("college") for r in records])
+        major_codes, majors = _encode([r.get("major") for r in records])
+        years = np.array(
+            [r.get("year") or MISSING_YEAR for r in records],
+            dtype=np.int32
+        )
+        return cls(ids, strings, college_codes, colleges, years, major_codes, majors)
+
+    #---------------------------------------------------------------------#
+    # Serialization (for the shared index)
+    #---------------------------------------------------------------------#
+
+    def to_columns(self) -> Tuple[Dict[str, np.ndarray], Dict[str, List]]:
+        """
+        Split into numeric arrays and JSON-serializable tables.
+        
+        The per-person string columns and the JSON fragments go into the
+        arrays as packed buffers, so they can be memory-mapped too; only the
+        ids and the college/major tables stay in JSON.
+        """
+        arrays = {
+            "college_codes": self.college_codes,
+            "years": self.years,
+            "major_codes": self.major_codes,
+        }
+        for column in STRING_COLUMNS:
+            arrays.update(PackedStrings.pack(list(getattr(self, column))).to_arrays(column))
+        arrays.update(PackedBytes.pack(list(self.fragments)).to_arrays("fragments"))
+        strings = {
+            "ids": self.ids,
+            "colleges": self.colleges,
+            "majors": self.majors,
+        }
+        return arrays, strings
+
+    @classmethod
+    def from_columns(cls, arrays: Dict[str, np.ndarray],
+                     strings: Dict[str, List]) -> "PersonTable":
+        """Rebuild a table from to_columns() output, reusing the (mapped) buffers."""
+        string_columns = {
+            column: PackedStrings.from_arrays(arrays, column)
+            for column in STRING_COLUMNS
+        }
+        return cls(
+            strings["ids"],
+            string_columns,
+            arrays["college_codes"],
+            [sys.intern(c) for c in strings["colleges"]],
+            arrays["years"],
+            arrays["major_codes"],
+            [sys.intern(m) for m in strings["majors"]],
+            fragments=PackedBytes.from_arrays(arrays, "fragments"),
+        )
+
+    #---------------------------------------------------------------------#
+    # Lookups
+    #---------------------------------------------------------------------#
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_of(self, person_id: Any) -> Optional[int]:
+        """Find a person's row by ID (IDs may be ints passed as strings)."""
+        row = self._row_by_id.get(person_id)
+        if row is None and isinstance(person_id, str):
+            try:
+                row = self._row_by_id.get(int(person_id))
+            except ValueError:
+                pass
+        return row
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """Materialize one person as a result dict."""
+        return self.rows([i])[0]
+
+    def rows(self, indices: List[int]) -> List[Dict[str, Any]]:
+        """
+        Materialize several people as result dicts.
+        
+        Gathers the coded columns for all rows at once, which is much cheaper
+        than indexing numpy arrays one element at a time.
+        """
+        colleges = self.colleges + [None]
+        majors = self.majors + [None]
+        college_codes = self.college_codes[indices].tolist()
+        major_codes = self.major_codes[indices].tolist()
+        years = self.years[indices].tolist()
+        return [
+            {
+                "id": self.ids[i],
+                "first_name": self.first_name[i],
+                "last_name": self.last_name[i],
+                "image": self.image[i],
+                # MISSING_CODE (-1) picks the trailing None
+                "college": colleges[c],
+                "year": y or None,
+                "major": majors[m],
+                "email": self.email[i],
+            }
+            for i, c, y, m in zip(indices, college_codes, years, major_codes)
+        ]
+
+    #---------------------------------------------------------------------#
+    # Pre-serialized JSON
+    #---------------------------------------------------------------------#
+    
+    def _serialize_rows(self) -> List[bytes]:
+        """
+        Serialize every person's static fields once.
+        
+        Each fragment is a JSON object with its closing brace left off, so a
+        result is just fragment + score + "}".
+        """
+        rows = self.rows(list(range(len(self.ids))))
+        return [
+            json.dumps(row, ensure_ascii=False, separators=(",", ":"))[:-1].encode("utf-8")
+            for row in rows
+        ]
+    
+    def person_json(self, i: int) -> bytes:
+        """JSON object for one person (no score)."""
+        return self.fragments[i] + b"}"
+    
+    def results_json(self, indices: List[int], scores: List[float]) -> bytes:
+        """JSON array of result objects, spliced from the fragments."""
+        fragments = self.fragments
+        return b"[" + b",".join([
+            b"%s,\"score\":%s}" % (fragments[i], repr(score).encode())
+            for i, score in zip(indices, scores)
+        ]) + b"]"
+    
+    def filter_mask(self, college: Optional[str] = None, year: Optional[int] = None,
+                    major: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        Boolean mask of rows matching all given filters.
+        
+        Returns None when no filter is set. Unknown values match nobody.
+        """
+        if not (college or year or major):
+            return None
+        
+        mask = np.ones(len(self.ids), dtype=bool)
+        if college:
+            mask &= self.college_codes == self._college_index.get(college, NO_MATCH_CODE)
+        if year:
+            mask &= self.years == year
+        if major:
+            mask &= self.major_codes == self._major_index.get(major, NO_MATCH_CODE)
+        return mask
+
+    def facet_counts(self, rows: np.ndarray) -> Dict[str, Dict[str, int]]:
+        """
+        How many of the given rows fall in each college, year and major.
+        
+        One bincount per coded column. Missing values aren't counted; each
+        facet is ordered by count, largest first. Years are string keys, as
+        they are JSON object keys.
+        """
+        colleges = np.bincount(self.college_codes[rows] + 1, minlength=len(self.colleges) + 1)[1:]
+        majors = np.bincount(self.major_codes[rows] + 1, minlength=len(self.majors) + 1)[1:]
+        years = np.bincount(self._year_codes[rows], minlength=len(self._year_values))
+        
+        def ordered(labels, counts) -> Dict[str, int]:
+            nonzero = np.flatnonzero(counts)
+            nonzero = nonzero[np.argsort(-counts[nonzero], kind="stable")]
+            return {str(labels[i]): int(counts[i]) for i in nonzero}
+        
+        year_counts = ordered(self._year_values.tolist(), years)
+        year_counts.pop(str(MISSING_YEAR), None)
+        return {
+            "colleges": ordered(self.colleges, colleges),
+            "years": year_counts,
+            "majors": ordered(self.majors, majors),
+        }
+
+    def filter_options(self) -> Dict[str, List]:
+        """Distinct colleges, years and majors for the filter dropdowns."""
+        years = np.unique(self.years[self.years != MISSING_YEAR])
+        return {
+            "colleges": list(self.colleges),
+            "years": [int(y) for y in years[::-1]],
+            "majors": list(self.majors),
+        }
@@ -0,0 +1,170 @@
+"""
+Request Profiling
+Opt-in per-request profiles and a slow-query log.
+
+A fraction of requests (PROFILE_SAMPLE_RATE) and every request slower than
+SLOW_QUERY_MS are recorded with their stage timings (auth, moderation,
+encoder, scoring, ...) and search parameters into a bounded in-memory ring
+buffer. Profiles can be listed from an admin endpoint and dumped to disk.
+
+With both settings at 0 (the default) requests pass straight through. When
+enabled, unrecorded requests only pay for a random() call and a few list
+appends per stage, so low sample rates are safe in production.
+"""
+
+import os
+import json
+import time
+import random
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List
+from starlette.datastructures import QueryParams
+
+from metrics import current_stages
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "0"))
+PROFILE_BUFFER_SIZE = int(os.environ.get("PROFILE_BUFFER_SIZE", "200"))
+
+PERSISTENT_DIR = Path(__file__).parent / "persistent"
+PROFILES_DIR = PERSISTENT_DIR / "profiles"
+
+# Request parameters worth keeping; query text is truncated
+RECORDED_PARAMS = ("q", "k", "college", "year", "major", "cursor", "format")
+MAX_PARAM_LENGTH = 200
+
+# Not worth profiling, and would crowd out real requests
+SKIPPED_PATHS = ("/metrics", "/api/health", "/api/admin/profiles")
+
+
+#-------------------------------------------------------------------------#
+# Ring Buffer
+#-------------------------------------------------------------------------#
+
+_profiles: deque = deque(maxlen=PROFILE_BUFFER_SIZE)
+_profiles_lock = threading.Lock()
+_recorded = {"sampled": 0, "slow": 0}
+
+
+def is_enabled() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 or SLOW_QUERY_MS > 0
+
+
+def _record(profile: Dict[str, Any]):
+    with _profiles_lock:
+        _profiles.append(profile)
+        _recorded[profile["reason"]] += 1
+
+
+def get_profiles(limit: int = 50, slow_only: bool = False) -> List[Dict[str, Any]]:
+    """Most recent profiles first."""
+    with _profiles_lock:
+        profiles = list(_profiles)
+    if slow_only:
+        profiles = [p for p in profiles if p["reason"] == "slow"]
+    return profiles[::-1][:limit]
+
+
+def get_profiling_stats() -> Dict[str, Any]:
+    return {
+        "enabled": is_enabled(),
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "buffer_size": PROFILE_BUFFER_SIZE,
+        "buffered": len(_profiles),
+        "recorded": dict(_recorded),
+    }
+
+
+def dump_profiles() -> Dict[str, Any]:
+    """
+    Write the buffered profiles to a JSON lines file under persistent/profiles.
+    
+    Returns:
+        Dict with the file path and number of profiles written
+    """
+    with _profiles_lock:
+        profiles = list(_profiles)
+    
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    path = PROFILES_DIR / time.strftime("profiles-%Y%m%d-%H%M%S.jsonl")
+    with open(path, "w") as f:
+        for profile in profiles:
+            f.write(json.dumps(profile) + "\n")
+    
+    return {"path": str(path), "count": len(profiles)}
+
+
+#-------------------------------------------------------------------------#
+# Middleware
+#-------------------------------------------------------------------------#
+
+def _summarize_stages(stages: list) -> Dict[str, float]:
+    """Total milliseconds per stage (a stage can run more than once)."""
+    totals: Dict[str, float] = {}
+    for stage, seconds in stages:
+        totals[stage] = totals.get(stage, 0.0) + seconds * 1000
+    return {stage: round(ms, 3) for stage, ms in totals.items()}
+
+
+def _recorded_params(query_string: bytes) -> Dict[str, str]:
+    params = QueryParams(query_string.decode("latin-1"))
+    return {
+        name: params[name][:MAX_PARAM_LENGTH]
+        for name in RECORDED_PARAMS if name in params
+    }
+
+
+class ProfilingMiddleware:
+    """ASGI middleware recording sampled and slow requests into the ring buffer."""
+
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not is_enabled() or
+                scope["path"].startswith(SKIPPED_PATHS)):
+            await self.app(scope, receive, send)
+            return
+        
+        sampled = random.random() < PROFILE_SAMPLE_RATE
+        if not sampled and SLOW_QUERY_MS <= 0:
+            await self.app(scope, receive, send)
+            return
+        
+        # Stage timings from this request (including its executor work) land here
+        stages: list = []
+        token = current_stages.set(stages)
+        status = {"code": 500}
+        
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+        
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            current_stages.reset(token)
+            duration_ms = (time.perf_counter() - start) * 1000
+            
+            slow = SLOW_QUERY_MS > 0 and duration_ms >= SLOW_QUERY_MS
+            if sampled or slow:
+                _record({
+                    "timestamp": started_at,
+                    "reason": "slow" if slow else "sampled",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "params": _recorded_params(scope.get("query_string", b"")),
+                    "status": status["code"],
+                    "duration_ms": round(duration_ms, 3),
+                    "stages_ms": _summarize_stages(stages),
+                })
@@ -0,0 +1,331 @@
+"""
+Rate Limiting Module
+Per-user token buckets and global admission control for expensive endpoints.
+
+Each authenticated netid gets a token bucket per limit (e.g. searches), so
+one scripted client can't monopolize the encoder. Buckets live in process
+memory by default, so each worker enforces its own limit. RATE_LIMIT_URL
+(or a sqlite:// SHARED_CACHE_URL) keeps them in a SQLite file instead, so
+the limit holds across the workers on one host; several hosts still limit
+separately.
+
+Admission control sheds load when the thread pool backs up: once more than
+MAX_ENCODER_QUEUE searches are waiting for a worker, new uncached searches
+get a 503 with Retry-After instead of queueing behind them.
+"""
+
+import os
+import math
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+from fastapi import Depends, HTTPException, Request
+
+from auth import get_current_user
+from cache_backends import SHARED_CACHE_URL
+from metrics import Counter, EXECUTOR_QUEUE_DEPTH, track_executor
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+# Sustained searches per user per minute, and how many can be made at once (0 = no limit)
+SEARCH_RATE_PER_MINUTE = float(os.environ.get("SEARCH_RATE_PER_MINUTE", "60"))
+SEARCH_BURST = int(os.environ.get("SEARCH_BURST", "20"))
+
+# Find-similar needs no encoding, so it gets a looser limit
+SIMILAR_RATE_PER_MINUTE = float(os.environ.get("SIMILAR_RATE_PER_MINUTE", "240"))
+SIMILAR_BURST = int(os.environ.get("SIMILAR_BURST", "60"))
+
+# Searches waiting for a thread pool worker before new ones are refused (0 = off)
+MAX_ENCODER_QUEUE = int(os.environ.get("MAX_ENCODER_QUEUE", "32"))
+OVERLOAD_RETRY_AFTER = int(os.environ.get("OVERLOAD_RETRY_AFTER", "2"))
+
+# Buckets kept by the in-memory backend; the least recently used are dropped
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "10000"))
+
+# Bucket store: memory:// (per worker) or sqlite:////path/limits.db (per host).
+# Unset = follow SHARED_CACHE_URL when that is a sqlite:// URL.
+RATE_LIMIT_URL = os.environ.get("RATE_LIMIT_URL")
+
+# Buckets idle this long are deleted from the sqlite store (they'd be full anyway)
+RATE_LIMIT_IDLE_SECONDS = 3600
+
+REJECTED = Counter(
+    "yaliesearch_rejected_requests_total",
+    "Requests refused by rate limiting (rate_limit) or admission control (overload)",
+    labels=("limit", "reason")
+)
+
+
+#-------------------------------------------------------------------------#
+# Backends
+#-------------------------------------------------------------------------#
+
+class RateLimitBackend(ABC):
+    """
+    Storage for token buckets.
+    
+    A shared backend (SQLiteBackend) lets several workers enforce one limit
+    per user. `blocking` is True when take() does I/O, so callers on the
+    event loop run it in the thread pool.
+    """
+    
+    blocking = False
+
+    @abstractmethod
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        """
+        Take `cost` tokens from a bucket refilling at `rate` per second.
+        
+        Returns:
+            0 if the tokens were taken, otherwise seconds until they would be
+        """
+
+    @abstractmethod
+    def clear(self):
+        """Reset every bucket."""
+
+
+def refill(tokens: float, updated: float, now: float, rate: float, burst: int) -> float:
+    """Tokens in a bucket after refilling from `updated` to `now`."""
+    return min(float(burst), tokens + max(0.0, now - updated) * rate)
+
+
+def _charge(tokens: float, rate: float, cost: float) -> Tuple[float, float]:
+    """(tokens left, seconds to wait) after trying to take `cost` tokens."""
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBackend(RateLimitBackend):
+    """Per-process buckets in a bounded LRU."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = float(burst) if bucket is None else refill(bucket[0], bucket[1], now, rate, burst)
+            tokens, wait = _charge(tokens, rate, cost)
+            
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                # Dropping a bucket only resets that user to a full burst
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBackend(RateLimitBackend):
+    """
+    Buckets in a SQLite file shared by the workers on one host.
+    
+    Each take() is one short write transaction. If the database fails the
+    request is let through, like a cache outage.
+    """
+    
+    blocking = True
+    
+    # Takes between deletions of idle buckets
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get a thread-local connection (autocommit; transactions are explicit)."""
+        if getattr(self._local, "connection", None) is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = conn
+        return self._local.connection
+
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        # Wall clock, since the buckets are shared between processes
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = float(burst) if row is None else refill(row[0], row[1], now, rate, burst)
+                tokens, wait = _charge(tokens, rate, cost)
+                conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                             (key, tokens, now))
+                
+                self._takes += 1
+                if self._takes >= self.PRUNE_EVERY:
+                    self._takes = 0
+                    conn.execute("DELETE FROM buckets WHERE updated < ?", (now - RATE_LIMIT_IDLE_SECONDS,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print(f"Rate limit store failed, allowing request: {e}")
+            return 0.0
+        return wait
+
+    def clear(self):
+        self._connection().execute("DELETE FROM buckets")
+
+
+def from_url(url: str) -> RateLimitBackend:
+    """Build a bucket store from a memory:// or sqlite:/// URL."""
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryBackend()
+    if scheme == "sqlite":
+        # sqlite:///relative/path or sqlite:////absolute/path
+        return SQLiteBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported rate limit backend URL: {url}")
+
+
+def _configured_url() -> str:
+    if RATE_LIMIT_URL:
+        return RATE_LIMIT_URL
+    if urlparse(SHARED_CACHE_URL).scheme == "sqlite":
+        # Same host-local file as the shared cache, separate table
+        return SHARED_CACHE_URL
+    return "memory://"
+
+
+_backend: Optional[RateLimitBackend] = None
+_backend_lock = threading.Lock()
+
+
+def set_backend(backend: Optional[RateLimitBackend]):
+    """Use a different bucket store (None to go back to the configured one)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def get_backend() -> RateLimitBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = from_url(_configured_url())
+            print(f"Rate limit backend: {type(_backend).__name__}")
+        return _backend
+
+
+#-------------------------------------------------------------------------#
+# Dependencies
+#-------------------------------------------------------------------------#
+
+def _retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+class RateLimit:
+    """
+    FastAPI dependency enforcing a per-user token bucket.
+    
+    Use in place of Depends(get_current_user); it authenticates the request,
+    charges the user's bucket and returns the netid. Raises 429 with
+    Retry-After when the bucket is empty.
+    
+    A request is charged at most once per limit: the HTTP cache middleware
+    calls check() before serving a cached response, and the route's
+    dependency then reuses that result.
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: int):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = burst
+    
+    async def __call__(self, request: Request, netid: str = Depends(get_current_user)) -> str:
+        return await self.check(request, netid)
+    
+    async def check(self, request: Request, netid: str) -> str:
+        """Charge netid's bucket for this request (once) and raise 429 if it was empty."""
+        import asyncio
+        
+        if self.rate <= 0:
+            return netid
+        
+        # Shared with the route through the ASGI scope
+        waits = getattr(request.state, "rate_limit_waits", None)
+        if waits is None:
+            waits = request.state.rate_limit_waits = {}
+        
+        wait = waits.get(self.name)
+        if wait is None:
+            backend = get_backend()
+            key = f"{self.name}:{netid}"
+            if backend.blocking:
+                # A write transaction that can wait on other workers' locks
+                loop = asyncio.get_event_loop()
+                wait = await loop.run_in_executor(
+                    None, track_executor("ratelimit", lambda: backend.take(key, self.rate, self.burst))
+                )
+            else:
+                wait = backend.take(key, self.rate, self.burst)
+            waits[self.name] = wait
+            if wait > 0:
+                REJECTED.inc(limit=self.name, reason="rate_limit")
+        
+        if wait > 0:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, slow down",
+                headers=_retry_after(wait)
+            )
+        return netid
+
+
+search_limit = RateLimit("search", SEARCH_RATE_PER_MINUTE, SEARCH_BURST)
+similar_limit = RateLimit("similar", SIMILAR_RATE_PER_MINUTE, SIMILAR_BURST)
+
+
+def encoder_queue_depth() -> float:
+    """Searches submitted to the thread pool and still waiting for a worker."""
+    return EXECUTOR_QUEUE_DEPTH.value(task="search")
+
+
+def admit_search(cached: bool = False):
+    """
+    Refuse a new search with 503 if the encoder queue is over its limit.
+    
+    Cached searches cost almost nothing and are always admitted.
+    """
+    if cached or MAX_ENCODER_QUEUE <= 0:
+        return
+    
+    if encoder_queue_depth() >= MAX_ENCODER_QUEUE:
+        REJECTED.inc(limit="search", reason="overload")
+        raise HTTPException(
+            status_code=503,
+            detail="Search is overloaded, try again shortly",
+            headers=_retry_after(OVERLOAD_RETRY_AFTER)
+        )
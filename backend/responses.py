@@ -0,0 +1,64 @@
+"""
+Response Helpers
+Builds JSON response bodies from pre-serialized fragments.
+
+Search results are spliced in as raw bytes (see PersonTable.results_json), so
+only the small envelope around them is serialized per request. orjson is used
+for the envelope when installed; the standard json module otherwise.
+"""
+
+import json
+from typing import Any, Dict, Optional
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """Serialize a value to compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class RawJSONResponse(Response):
+    """JSON response whose content is already-encoded bytes."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def render_object(fields: Dict[str, Any], raw: Optional[Dict[str, bytes]] = None) -> bytes:
+    """
+    Serialize a JSON object, splicing in members that are already JSON bytes.
+    
+    Args:
+        fields: Members to serialize normally
+        raw: Members whose values are pre-serialized JSON, appended in order
+    
+    Returns:
+        The JSON object as bytes
+    """
+    body = dumps(fields)
+    if not raw:
+        return body
+    
+    parts = [body[:-1]]
+    separator = b"," if fields else b""
+    for key, value in raw.items():
+        parts.append(separator + dumps(key) + b":" + value)
+        separator = b","
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+def json_response(fields: Dict[str, Any], raw: Optional[Dict[str, bytes]] = None,
+                  status_code: int = 200) -> RawJSONResponse:
+    """Build a RawJSONResponse from normal and pre-serialized members."""
+    return RawJSONResponse(render_object(fields, raw), status_code=status_code)
@@ -4,15 +4,29 @@ Adapted from yalie_search_cli/testing_results.py
 """
 
 import os
+import re
 import json
 import hashlib
 import time
-from typing import Optional, List, Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Callable, Tuple
 import numpy as np
-import torch
-from transformers import AutoTokenizer, CLIPTextModelWithProjection
 from pathlib import Path
 
+import encoder
+import lexical
+import attributes
+import disk_cache
+import cache_backends
+import shared_index
+import sharding
+from canonical import canonicalize
+from people import PersonTable
+from lexical import LexicalIndex
+from attributes import AttributeTable
+from metrics import timed, record_cache
+
 #-------------------------------------------------------------------------#
 # Configuration
 #-------------------------------------------------------------------------#
@@ -31,126 +45,850 @@ if not EMBEDDINGS_PATH:
     else:
         EMBEDDINGS_PATH = str(default_paths[0])
 
+# The only directory /api/admin/reload may load embeddings files from
+EMBEDDINGS_DIR = os.environ.get("EMBEDDINGS_DIR") or os.path.dirname(os.path.abspath(EMBEDDINGS_PATH))
+
 CACHE_TTL_SECONDS = 300
 CACHE_MAX_SIZE = 100
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
 
-#-------------------------------------------------------------------------#
-# Device Setup
-#-------------------------------------------------------------------------#
+# Number of ranked candidates kept per query/filter combination. Any page
+# within this many results is served from the cache by slicing.
+CANDIDATE_POOL_SIZE = int(os.environ.get("CANDIDATE_POOL_SIZE", "500"))
+
+# Range search: rows scored per block, and most matches one page returns
+RANGE_BLOCK_ROWS = int(os.environ.get("RANGE_BLOCK_ROWS", "8192"))
+RANGE_MAX_RESULTS = int(os.environ.get("RANGE_MAX_RESULTS", "1000"))
 
-if torch.backends.mps.is_available():
-    device = "mps"
-elif torch.cuda.is_available():
-    device = "cuda"
-else:
-    device = "cpu"
+# Poll EMBEDDINGS_PATH for changes and hot-reload when it is replaced (0 = off)
+EMBEDDINGS_WATCH_INTERVAL = float(os.environ.get("EMBEDDINGS_WATCH_INTERVAL", "0"))
 
-print(f"Search module using device: {device}")
+# How long rankings stay in the shared cache backend (see cache_backends)
+SHARED_RESULTS_TTL = float(os.environ.get("SHARED_RESULTS_TTL", "86400"))
+
+# Weight of a "- prompt" term when none is given
+DEFAULT_NEGATIVE_WEIGHT = 0.5
 
 #-------------------------------------------------------------------------#
-# Cached Model and Embeddings
+# Cached Embeddings
 #-------------------------------------------------------------------------#
 
-_model = None
-_tokenizer = None
-_yalies = None
-_yalies_by_id = None
-_embeddings_normalized = None
 _initialized = False
 
-_filter_options = {
-    "colleges": [],
-    "years": [],
-    "majors": []
-}
+# LRU of ranked candidate lists, bounded by entry count and total bytes
+_search_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_bytes = 0
+
+# Pinned region: rankings for trending queries, replaced wholesale by
+# pin_queries(). Untouched by LRU eviction and the TTL.
+_pinned: Dict[str, Dict[str, Any]] = {}
+
+
+class _SearchIndex:
+    """
+    Immutable snapshot of the loaded directory.
+    
+    Searches take a reference to the current snapshot once and use it for
+    their whole lifetime, so a reload can swap in a new snapshot without
+    disturbing requests that are already running.
+    """
+
+    def __init__(self, people, embeddings_normalized, filter_options,
+                 generation, source_path, fingerprint=None, attribute_table=None):
+        self.people = people
+        self.embeddings_normalized = embeddings_normalized
+        self.filter_options = filter_options
+        # Name/major index for hybrid search (None when LEXICAL_SEARCH is off)
+        self.lexical = LexicalIndex(people) if lexical.LEXICAL_SEARCH else None
+        # Precomputed attribute score columns (None unless built for this data)
+        self.attributes: Optional[AttributeTable] = attribute_table
+        if attribute_table is not None:
+            self.filter_options = dict(filter_options, attributes=list(attribute_table.names))
+        self.generation = generation
+        self.source_path = source_path
+        # Content hash of the source file; None for in-memory indexes
+        self.fingerprint = fingerprint
+
 
-_search_cache: Dict[str, Dict[str, Any]] = {}
+_index: Optional[_SearchIndex] = None
+_reload_lock = threading.Lock()
+_watcher_thread: Optional[threading.Thread] = None
+
+
+def _parse_embeddings(path: str) -> tuple:
+    """
+    Parse an embeddings file into a normalized matrix and metadata columns.
+    
+    Each record's embedding list is copied into the matrix and dropped as we
+    go, and the records themselves are discarded once the columns are built.
+    """
+    print(f"Loading embeddings from {path}...")
+    with open(path, 'r') as f:
+        yalies = json.load(f)
+    
+    if sharding.is_shard_node():
+        yalies = [y for y in yalies if sharding.owns(y.get('id') or y.get('netid'))]
+        print(f"Shard {sharding.SHARD_INDEX}/{sharding.SHARD_COUNT}: keeping {len(yalies)} people")
+    
+    dim = len(yalies[0]['embedding']) if yalies else 0
+    embeddings = np.empty((len(yalies), dim), dtype=np.float32)
+    for idx, yalie in enumerate(yalies):
+        embeddings[idx] = yalie.pop('embedding')
+    
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= norms
+    
+    people = PersonTable.from_records(yalies)
+    return embeddings, people
+
+
+def _build_index(path: str, generation: int) -> _SearchIndex:
+    """Load an embeddings file and build the matrix, metadata and filter options."""
+    if shared_index.is_enabled():
+        def build():
+            embeddings, people = _parse_embeddings(path)
+            return (embeddings,) + people.to_columns()
+        
+        embeddings_normalized, arrays, strings, fingerprint = shared_index.load_or_publish(
+            path, build, tag=sharding.shard_tag()
+        )
+        people = PersonTable.from_columns(arrays, strings)
+    else:
+        embeddings_normalized, people = _parse_embeddings(path)
+        # Only needed to key results in the disk and shared caches, and to
+        # check attribute scores were built for this data
+        persisted = (disk_cache.is_enabled() or cache_backends.get_shared_backend() is not None
+                     or os.path.exists(attributes.ATTRIBUTE_SCORES_PATH))
+        fingerprint = shared_index.fingerprint_file(path) + sharding.shard_tag() if persisted else None
+    
+    return _SearchIndex(
+        people=people,
+        embeddings_normalized=embeddings_normalized,
+        filter_options=people.filter_options(),
+        generation=generation,
+        source_path=path,
+        fingerprint=fingerprint,
+        attribute_table=attributes.load(fingerprint, encoder.model_id(), len(people))
+    )
+
+
+def _get_index() -> _SearchIndex:
+    """Get the current index snapshot, initializing on first use."""
+    if not _initialized:
+        initialize()
+    return _index
 
 
 def initialize():
-    """Initialize model and embeddings."""
-    global _model, _tokenizer, _yalies, _yalies_by_id
-    global _embeddings_normalized, _initialized, _filter_options
+    """
+    Initialize model and embeddings.
+    
+    Shard nodes only load their partition: the coordinator encodes queries
+    and sends them the vectors.
+    """
+    global _index, _initialized
     
     if _initialized:
         return
     
     print("Initializing search module...")
     
-    print("Loading CLIP text model...")
-    _model = CLIPTextModelWithProjection.from_pretrained(
-        "openai/clip-vit-large-patch14"
-    )
+    if not sharding.is_shard_node():
+        encoder.load_model()
+    
+    _index = _build_index(EMBEDDINGS_PATH, generation=1)
+    
+    print(f"Loaded {len(_index.people)} embeddings!")
+    _initialized = True
     
-    if device in ("mps", "cuda"):
-        _model = _model.half()
+    if EMBEDDINGS_WATCH_INTERVAL > 0:
+        start_watcher(EMBEDDINGS_WATCH_INTERVAL)
+
+
+def set_text_encoder(text_encoder: Optional[Callable[[str], np.ndarray]]):
+    """
+    Replace the CLIP text encoder with a function mapping a text to a vector.
     
-    _model = _model.to(device)
-    _model.eval()
+    Used by the benchmarks and load tests to run without downloading CLIP.
+    When set before initialize(), the model is never loaded. Pass None to go
+    back to CLIP.
+    """
+    encoder.set_text_encoder(text_encoder)
+    clear_cache()
+
+
+def load_index(embeddings: np.ndarray, people: PersonTable, source_path: str = "<memory>",
+               attribute_vocabulary: Optional[List[str]] = None):
+    """
+    Swap in an index built in memory instead of loaded from an embeddings file.
     
-    _tokenizer = AutoTokenizer.from_pretrained("openai/clip-vit-large-patch14")
-    print("Model loaded!")
+    Used by the benchmarks for synthetic directories too large to go through
+    JSON. Rows of `embeddings` are normalized in place. Marks the module as
+    initialized, so pair it with set_text_encoder() unless the model is loaded.
+    Attribute columns are built for `attribute_vocabulary` if given.
+    """
+    global _index, _initialized
     
-    print(f"Loading embeddings from {EMBEDDINGS_PATH}...")
-    with open(EMBEDDINGS_PATH, 'r') as f:
-        _yalies = json.load(f)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
     
-    embeddings = np.array([y['embedding'] for y in _yalies], dtype=np.float32)
-    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-    _embeddings_normalized = embeddings / norms
-    
-    _yalies_by_id = {}
-    for idx, yalie in enumerate(_yalies):
-        yalie_id = yalie.get("id") or yalie.get("netid")
-        if yalie_id:
-            _yalies_by_id[yalie_id] = idx
-    
-    colleges = set()
-    years = set()
-    majors = set()
-    
-    for yalie in _yalies:
-        if yalie.get("college"):
-            colleges.add(yalie["college"])
-        if yalie.get("year"):
-            years.add(yalie["year"])
-        if yalie.get("major"):
-            majors.add(yalie["major"])
-    
-    _filter_options["colleges"] = sorted(list(colleges))
-    _filter_options["years"] = sorted(list(years), reverse=True)
-    _filter_options["majors"] = sorted(list(majors))
-    
-    print(f"Loaded {len(_yalies)} embeddings!")
-    _initialized = True
+    attribute_table = None
+    if attribute_vocabulary:
+        attribute_table = attributes.build(embeddings, attribute_vocabulary, encoder.encode_texts,
+                                           model=encoder.model_id())
+    
+    with _reload_lock:
+        _index = _SearchIndex(
+            people=people,
+            embeddings_normalized=embeddings,
+            filter_options=people.filter_options(),
+            generation=_index.generation + 1 if _index is not None else 1,
+            source_path=source_path,
+            attribute_table=attribute_table
+        )
+        _initialized = True
+        clear_cache()
+
+
+#-------------------------------------------------------------------------#
+# Hot Reload
+#-------------------------------------------------------------------------#
+
+def resolve_embeddings_path(name: str) -> str:
+    """
+    Full path of an embeddings file given by name or path inside EMBEDDINGS_DIR.
+    
+    Raises:
+        ValueError: If the file is not a .json file inside EMBEDDINGS_DIR
+    """
+    base = os.path.realpath(EMBEDDINGS_DIR)
+    path = os.path.realpath(os.path.join(base, name))
+    if os.path.dirname(path) != base or not path.endswith(".json"):
+        raise ValueError(f"Not an embeddings file in {base}: {name}")
+    return path
+
+
+def reload_embeddings(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Rebuild the index from an embeddings file and swap it in atomically.
+    
+    The new matrix, lookups and filter options are built off to the side while
+    searches keep using the old snapshot. The model is not reloaded. Cached
+    results from older generations are dropped.
+    
+    Args:
+        path: Embeddings file to load (defaults to the currently loaded file)
+    
+    Returns:
+        Dict with the new generation, people count and build time
+    """
+    global _index
+    
+    if not _initialized:
+        initialize()
+    
+    with _reload_lock:
+        source_path = path or _index.source_path
+        start = time.time()
+        new_index = _build_index(source_path, generation=_index.generation + 1)
+        
+        # Single reference assignment - in-flight searches keep the old snapshot
+        old_index, _index = _index, new_index
+        clear_cache()
+        _drop_stale_results(old_index, new_index)
+        
+        elapsed = time.time() - start
+        print(f"Reloaded {len(new_index.people)} embeddings "
+              f"(generation {new_index.generation}) in {elapsed:.2f}s")
+        
+        return {
+            "generation": new_index.generation,
+            "total_people": len(new_index.people),
+            "source_path": source_path,
+            "seconds": round(elapsed, 3)
+        }
+
+
+def _file_signature(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _watch_embeddings(interval: float):
+    """Poll the embeddings file and reload once a new version has settled."""
+    last_signature = _file_signature(_index.source_path)
+    
+    while True:
+        time.sleep(interval)
+        path = _index.source_path
+        signature = _file_signature(path)
+        if signature is None or signature == last_signature:
+            continue
+        
+        # Wait one more interval so we don't load a half-written file
+        time.sleep(interval)
+        if _file_signature(path) != signature:
+            continue
+        
+        print(f"Embeddings file changed, reloading {path}...")
+        try:
+            reload_embeddings(path)
+            last_signature = signature
+        except Exception as e:
+            print(f"Embeddings reload failed: {e}")
+            last_signature = signature
+
+
+def start_watcher(interval: float = 30.0):
+    """Start the background file watcher (no-op if already running)."""
+    global _watcher_thread
+    
+    if _watcher_thread is not None and _watcher_thread.is_alive():
+        return
+    
+    _watcher_thread = threading.Thread(
+        target=_watch_embeddings,
+        args=(interval,),
+        name="embeddings-watcher",
+        daemon=True
+    )
+    _watcher_thread.start()
+    print(f"Watching {_index.source_path} for changes every {interval}s")
+
+
+def get_generation() -> int:
+    """Get the generation number of the currently loaded embeddings."""
+    return _get_index().generation
 
 
-def _get_cache_key(query: str, k: int, college: Optional[str], 
-                   year: Optional[int], major: Optional[str]) -> str:
-    key_str = f"{query.lower().strip()}|{k}|{college or ''}|{year or ''}|{major or ''}"
+#-------------------------------------------------------------------------#
+# Search
+#-------------------------------------------------------------------------#
+
+def _get_cache_key(query: str, college: Optional[str], 
+                   year: Optional[int], major: Optional[str],
+                   attribute_filter: Tuple[str, ...] = ()) -> str:
+    key_str = f"{canonicalize(query)}|{college or ''}|{year or ''}|{major or ''}"
+    if attribute_filter:
+        key_str += "|" + ",".join(attributes.normalize_names(attribute_filter))
     return hashlib.md5(key_str.encode()).hexdigest()
 
 
-def _get_from_cache(cache_key: str) -> Optional[List[Dict[str, Any]]]:
-    if cache_key in _search_cache:
-        cached = _search_cache[cache_key]
-        if time.time() - cached["timestamp"] < CACHE_TTL_SECONDS:
-            return cached["results"]
-        else:
-            del _search_cache[cache_key]
-    return None
+def _get_from_cache(cache_key: str, generation: int) -> Tuple[Optional["_Candidates"], str]:
+    """Cached candidates (or None) and the tier that answered, for the hit metrics."""
+    pinned = _pinned.get(cache_key)
+    if pinned is not None and pinned["generation"] == generation:
+        return pinned["candidates"], "pinned"
+    
+    with _cache_lock:
+        cached = _search_cache.get(cache_key)
+        if cached is None:
+            return None, "search"
+        if (cached["generation"] == generation and
+                time.time() - cached["timestamp"] < CACHE_TTL_SECONDS):
+            _search_cache.move_to_end(cache_key)
+            return cached["candidates"], "search"
+        _evict(cache_key)
+    return None, "search"
 
 
-def _set_cache(cache_key: str, results: List[Dict[str, Any]]):
-    if len(_search_cache) >= CACHE_MAX_SIZE:
-        oldest_key = min(_search_cache.keys(), 
-                         key=lambda k: _search_cache[k]["timestamp"])
-        del _search_cache[oldest_key]
+def _evict(cache_key: str):
+    """Remove one entry (caller holds _cache_lock)."""
+    global _cache_bytes
+    entry = _search_cache.pop(cache_key, None)
+    if entry is not None:
+        _cache_bytes -= entry["candidates"].nbytes
+
+
+def _set_cache(cache_key: str, candidates: "_Candidates", generation: int):
+    global _cache_bytes
     
-    _search_cache[cache_key] = {
-        "results": results,
-        "timestamp": time.time()
-    }
+    # Don't let a search that started before a reload repopulate the cache
+    if _index is not None and generation != _index.generation:
+        return
+    
+    with _cache_lock:
+        _evict(cache_key)
+        while _search_cache and (
+                len(_search_cache) >= CACHE_MAX_SIZE or
+                _cache_bytes + candidates.nbytes > CACHE_MAX_BYTES):
+            _evict(next(iter(_search_cache)))
+        
+        _search_cache[cache_key] = {
+            "candidates": candidates,
+            "generation": generation,
+            "timestamp": time.time()
+        }
+        _cache_bytes += candidates.nbytes
+
+
+def _results_namespace(index: _SearchIndex) -> Optional[str]:
+    """
+    Disk/shared cache namespace for rankings against this index, or None to
+    skip those tiers.
+    
+    Rankings depend on the data, the model, the pool size, how lexical
+    matches are fused in and the attribute thresholds, so all of them are
+    part of it.
+    """
+    model = encoder.model_id()
+    if index.fingerprint is None or model is None:
+        return None
+    namespace = f"{index.fingerprint}:{model}:{CANDIDATE_POOL_SIZE}:{lexical.fusion_tag()}"
+    if index.attributes is not None:
+        namespace += f":attrs{index.attributes.tag}"
+    return namespace
+
+
+def _drop_stale_results(old_index: _SearchIndex, new_index: _SearchIndex):
+    """
+    Delete the disk-cached rankings this process made against the data it
+    just replaced.
+    
+    Only the old index's own namespace is dropped: other workers, shards and
+    configurations share the file with their own namespaces, and anything
+    else stale ages out through the LRU prune.
+    """
+    old_namespace = _results_namespace(old_index)
+    if old_namespace is not None and old_namespace != _results_namespace(new_index):
+        deleted = disk_cache.drop_namespace(old_namespace)
+        if deleted:
+            print(f"Dropped {deleted} stale disk-cached rankings")
+
+
+class _Candidates:
+    """Ranked row numbers and scores for one query/filter combination."""
+    
+    __slots__ = ("indices", "scores")
+
+    def __init__(self, indices: np.ndarray, scores: np.ndarray):
+        self.indices = indices
+        self.scores = scores
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indices.nbytes + self.scores.nbytes
+
+    def to_bytes(self) -> bytes:
+        return self.indices.astype(np.int32).tobytes() + self.scores.astype(np.float32).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "_Candidates":
+        n = len(data) // 8
+        return cls(np.frombuffer(data, dtype=np.int32, count=n),
+                   np.frombuffer(data, dtype=np.float32, offset=n * 4))
+
+
+def _load_persisted(namespace: str, cache_key: str) -> Optional[_Candidates]:
+    """Ranking from the shared cache backend, then the disk cache."""
+    shared = cache_backends.get_shared_backend()
+    if shared is not None:
+        data = shared.get(f"results:{namespace}:{cache_key}")
+        record_cache("shared_results", data is not None)
+        if data is not None:
+            return _Candidates.from_bytes(data)
+    
+    stored = disk_cache.get_results(namespace, cache_key)
+    if stored is None:
+        return None
+    candidates = _Candidates(*stored)
+    if shared is not None:
+        shared.set(f"results:{namespace}:{cache_key}", candidates.to_bytes(), SHARED_RESULTS_TTL)
+    return candidates
+
+
+def _persist(namespace: str, cache_key: str, candidates: _Candidates):
+    """Write a fresh ranking to the shared cache backend and the disk cache."""
+    shared = cache_backends.get_shared_backend()
+    if shared is not None:
+        shared.set(f"results:{namespace}:{cache_key}", candidates.to_bytes(), SHARED_RESULTS_TTL)
+    disk_cache.set_results(namespace, cache_key, candidates.indices, candidates.scores)
+
+
+def _top_candidates(similarities: np.ndarray, n: int) -> _Candidates:
+    """Select and sort the n best scores, skipping filtered-out (-inf) rows."""
+    n = min(n, len(similarities))
+    if n <= 0:
+        return _Candidates(np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+    
+    if n < len(similarities):
+        top = np.argpartition(-similarities, n - 1)[:n]
+    else:
+        top = np.arange(len(similarities))
+    top = top[np.argsort(-similarities[top], kind="stable")]
+    top = top[similarities[top] != -np.inf]
+    
+    return _Candidates(top.astype(np.int32), similarities[top].astype(np.float32))
+
+
+class SearchHits:
+    """
+    Ranked results from one search, tied to the index snapshot they came from.
+    
+    Holds only row numbers and scores; rows are rendered on demand either as
+    dicts or straight to JSON from the pre-serialized person fragments.
+    total is how many ranked candidates exist, for pagination. facets holds
+    facet counts when they were asked for.
+    """
+    
+    __slots__ = ("index", "indices", "scores", "offset", "total", "facets")
+
+    def __init__(self, index: _SearchIndex, indices: List[int], scores: List[float],
+                 offset: int = 0, total: Optional[int] = None,
+                 facets: Optional[Dict[str, Any]] = None):
+        self.index = index
+        self.indices = indices
+        self.scores = scores
+        self.offset = offset
+        self.total = len(indices) if total is None else total
+        self.facets = facets
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    @property
+    def has_more(self) -> bool:
+        return self.offset + len(self.indices) < self.total
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Materialize result rows from the metadata columns."""
+        results = self.index.people.rows(self.indices)
+        for row, score in zip(results, self.scores):
+            row["score"] = score
+        return results
+
+    def to_json(self) -> bytes:
+        """Render results as a JSON array."""
+        return self.index.people.results_json(self.indices, self.scores)
+
+
+def _rank(index: _SearchIndex, query: str, similarities: np.ndarray) -> _Candidates:
+    """
+    Candidate pool for a query: the best similarities, fused with people
+    whose names or major contain every word of the query.
+    
+    Fused pools are in fused order, not score order; scores stay the
+    similarities so clients can keep interpreting them. Queries combining
+    several prompts are vector-only.
+    """
+    with timed("topk"):
+        candidates = _top_candidates(similarities, CANDIDATE_POOL_SIZE)
+    
+    if index.lexical is None or len(parse_prompts(canonicalize(query) or query)) > 1:
+        return candidates
+    
+    with timed("lexical"):
+        rows = index.lexical.lookup(query)
+        if len(rows) == 0:
+            return candidates
+        fused = lexical.fuse(candidates.indices, rows, similarities, CANDIDATE_POOL_SIZE)
+    
+    return _Candidates(fused, similarities[fused].astype(np.float32))
+
+
+def _make_hits(index: _SearchIndex, indices: np.ndarray,
+               similarities: np.ndarray) -> SearchHits:
+    return SearchHits(index, indices.tolist(), similarities[indices].tolist())
+
+
+#-------------------------------------------------------------------------#
+# Query Prompts
+#-------------------------------------------------------------------------#
+
+# " + " / " - " between prompts (a leading "-" negates the first prompt)
+_PROMPT_SEPARATOR = re.compile(r"(?:^|\s+)([+-])\s+|^-(?=\S)")
+# Optional weight at the end of a prompt: "glasses *2", "beard*0.3"
+_PROMPT_WEIGHT = re.compile(r"\s*\*\s*(\d+(?:\.\d*)?|\.\d+)$")
+
+
+def parse_prompts(query: str) -> List[Tuple[str, float]]:
+    """
+    Split a query into weighted prompts.
+    
+    "curly hair + glasses*2 - beard" becomes
+    [("curly hair", 1.0), ("glasses", 2.0), ("beard", -0.5)]. Operators only
+    count when surrounded by spaces, so "x-ray" or "t-shirt" stay one prompt,
+    and a plain query is a single prompt with weight 1.
+    
+    Returns:
+        List of (text, weight) pairs; negative weights subtract
+    """
+    prompts = []
+    sign = 1.0
+    position = 0
+    for match in _PROMPT_SEPARATOR.finditer(query):
+        prompts.append((query[position:match.start()], sign))
+        sign = -1.0 if (match.group(1) or "-") == "-" else 1.0
+        position = match.end()
+    prompts.append((query[position:], sign))
+    
+    weighted = []
+    for text, sign in prompts:
+        weight = DEFAULT_NEGATIVE_WEIGHT if sign < 0 else 1.0
+        match = _PROMPT_WEIGHT.search(text)
+        if match:
+            weight = float(match.group(1))
+            text = text[:match.start()]
+        text = text.strip()
+        if text and weight > 0:
+            weighted.append((text, sign * weight))
+    
+    return weighted or [(query.strip(), 1.0)]
+
+
+def encode_query(query: str, index: Optional[_SearchIndex] = None) -> np.ndarray:
+    """
+    Encode a (possibly multi-prompt) query into one normalized vector.
+    
+    All prompts are encoded in a single batch (cached ones are reused), and
+    combined as a weighted sum, so scoring is one dot product however many
+    prompts there are. The query is canonicalized first, so every spelling
+    that shares a cache key also shares an embedding.
+    
+    index is the snapshot the vector will be scored against; prompts in its
+    attribute vocabulary reuse the stored embeddings. Without one, every
+    prompt goes through the encoder.
+    """
+    prompts = parse_prompts(canonicalize(query) or query)
+    
+    # Attribute-vocabulary prompts already have stored embeddings
+    table = index.attributes if index is not None else None
+    texts = [text for text, _ in prompts if table is None or text not in table]
+    encoded = dict(zip(texts, encoder.encode_texts(texts))) if texts else {}
+    vectors = np.array([
+        encoded[text] if text in encoded else table.vector(text) for text, _ in prompts
+    ], dtype=np.float32)
+    if len(prompts) == 1 and prompts[0][1] > 0:
+        return vectors[0]
+    
+    weights = np.array([weight for _, weight in prompts], dtype=np.float32)
+    combined = weights @ vectors
+    norm = np.linalg.norm(combined)
+    return combined / norm if norm > 0 else combined
+
+
+def _block_scorer(index: _SearchIndex, query: str) -> Callable[[int, int], np.ndarray]:
+    """
+    Function returning the similarity of rows start..stop to a query.
+    
+    Queries made only of attribute-vocabulary prompts are read from the
+    precomputed score columns; anything else is encoded and scored against
+    the embedding matrix.
+    """
+    table = index.attributes
+    if table is not None:
+        prompts = parse_prompts(canonicalize(query) or query)
+        from_columns = all(text in table for text, _ in prompts)
+        record_cache("attributes", from_columns)
+        if from_columns:
+            with timed("scoring"):
+                similarities = table.similarities(prompts)
+            return lambda start, stop: similarities[start:stop]
+    
+    query_norm = encode_query(query, index)
+    return lambda start, stop: np.dot(index.embeddings_normalized[start:stop], query_norm)
+
+
+def _similarities(index: _SearchIndex, query: str) -> np.ndarray:
+    """Similarity of every person to a query."""
+    score = _block_scorer(index, query)
+    with timed("scoring"):
+        return score(0, len(index.people))
+
+
+def _filter_mask(index: _SearchIndex, college: Optional[str], year: Optional[int],
+                 major: Optional[str], attribute_filter: Tuple[str, ...] = ()) -> Optional[np.ndarray]:
+    """Rows passing the metadata and attribute filters, or None when unfiltered."""
+    mask = index.people.filter_mask(college, year, major)
+    if not attribute_filter:
+        return mask
+    
+    names = attributes.normalize_names(attribute_filter)
+    if index.attributes is None:
+        # Like unknown filter values, attributes without a table match nobody
+        attribute_mask = np.zeros(len(index.people), dtype=bool)
+    else:
+        attribute_mask = index.attributes.mask(names)
+    return attribute_mask if mask is None else mask & attribute_mask
+
+
+def _get_candidates(
+    index: _SearchIndex,
+    query: str,
+    college: Optional[str],
+    year: Optional[int],
+    major: Optional[str],
+    use_cache: bool,
+    attribute_filter: Tuple[str, ...] = ()
+) -> Tuple[_Candidates, Optional[np.ndarray]]:
+    """
+    Get the ranked candidate pool for a query, encoding it on a cache miss.
+    
+    Returns:
+        (candidates, the filtered similarities of every row if they were
+        computed, i.e. on a cache miss, else None)
+    """
+    cache_key = _get_cache_key(query, college, year, major, attribute_filter)
+    namespace = _results_namespace(index) if use_cache else None
+    if use_cache:
+        cached, tier = _get_from_cache(cache_key, index.generation)
+        record_cache(tier, cached is not None)
+        if cached is not None:
+            return cached, None
+        
+        candidates = _load_persisted(namespace, cache_key) if namespace else None
+        if candidates is not None:
+            _set_cache(cache_key, candidates, index.generation)
+            return candidates, None
+    
+    similarities = _filtered_similarities(index, query, college, year, major, attribute_filter)
+    candidates = _rank(index, query, similarities)
+    
+    if use_cache:
+        _set_cache(cache_key, candidates, index.generation)
+        if namespace:
+            _persist(namespace, cache_key, candidates)
+    
+    return candidates, similarities
+
+
+def _filtered_similarities(index: _SearchIndex, query: str, college: Optional[str],
+                           year: Optional[int], major: Optional[str],
+                           attribute_filter: Tuple[str, ...] = ()) -> np.ndarray:
+    """Similarity of every row to a query, -inf for rows the filters exclude."""
+    similarities = _similarities(index, query)
+    
+    with timed("scoring"):
+        filter_mask = _filter_mask(index, college, year, major, attribute_filter)
+        if filter_mask is not None:
+            similarities = np.where(filter_mask, similarities, -np.inf)
+    return similarities
+
+
+def _facets(index: _SearchIndex, rows: np.ndarray, basis: Dict[str, Any]) -> Dict[str, Any]:
+    with timed("facets"):
+        return dict(basis, count=int(len(rows)), **index.people.facet_counts(rows))
+
+
+def _pool_facets(index: _SearchIndex, candidates: _Candidates,
+                 similarities: Optional[np.ndarray], facet_top: Optional[int],
+                 facet_min_score: Optional[float], rescore: Callable[[], np.ndarray]) -> Dict[str, Any]:
+    """
+    Facet counts for a search: over its top facet_top candidates, or over
+    everyone scoring at least facet_min_score.
+    
+    A threshold count uses the similarities from the scoring pass when there
+    was one. After a cache hit, the pool itself is enough if it holds every
+    matching row (fewer matches than the pool size); otherwise the query is
+    rescored.
+    """
+    if facet_min_score is None:
+        return _facets(index, candidates.indices[:facet_top], {"top": facet_top})
+    
+    basis = {"min_score": facet_min_score}
+    if similarities is None and len(candidates) < CANDIDATE_POOL_SIZE:
+        return _facets(index, candidates.indices[candidates.scores >= facet_min_score], basis)
+    if similarities is None:
+        similarities = rescore()
+    return _facets(index, np.flatnonzero(similarities >= facet_min_score), basis)
+
+
+def search_hits(
+    query: str, 
+    k: int = 10,
+    college: Optional[str] = None,
+    year: Optional[int] = None,
+    major: Optional[str] = None,
+    use_cache: bool = True,
+    offset: int = 0,
+    attribute_filter: Tuple[str, ...] = (),
+    facet_top: Optional[int] = None,
+    facet_min_score: Optional[float] = None
+) -> SearchHits:
+    """
+    Search for similar faces given a text query.
+    
+    Returns results offset..offset+k of the ranked candidate pool. Later pages
+    of the same query are served from the cached pool without re-encoding.
+    attribute_filter keeps only people who have every listed attribute (see
+    attributes.py).
+    
+    With facet_top or facet_min_score, hits.facets counts colleges, years and
+    majors among the top facet_top candidates or among everyone (passing the
+    filters) scoring at least facet_min_score.
+    """
+    index = _get_index()
+    candidates, similarities = _get_candidates(index, query, college, year, major, use_cache,
+                                               attribute_filter)
+    
+    facets = None
+    if facet_top is not None or facet_min_score is not None:
+        facets = _pool_facets(
+            index, candidates, similarities, facet_top, facet_min_score,
+            lambda: _filtered_similarities(index, query, college, year, major, attribute_filter)
+        )
+    
+    page = slice(offset, offset + k)
+    return SearchHits(
+        index,
+        candidates.indices[page].tolist(),
+        candidates.scores[page].tolist(),
+        offset=offset,
+        total=len(candidates),
+        facets=facets
+    )
+
+
+def search_vector_hits(
+    query_norm: np.ndarray,
+    k: int = 10,
+    college: Optional[str] = None,
+    year: Optional[int] = None,
+    major: Optional[str] = None,
+    attribute_filter: Tuple[str, ...] = (),
+    facet_min_score: Optional[float] = None
+) -> SearchHits:
+    """
+    Rank the loaded people against an already-encoded query (shard nodes).
+    
+    Not cached: the coordinator caches the query embedding, and scoring one
+    partition is cheap. total is the number of people passing the filters,
+    capped at CANDIDATE_POOL_SIZE. Threshold facet counts add up across
+    shards, so they are computed here; top-N facets are counted by the
+    coordinator from the merged ranking.
+    """
+    index = _get_index()
+    
+    with timed("scoring"):
+        similarities = np.dot(index.embeddings_normalized, query_norm)
+        filter_mask = _filter_mask(index, college, year, major, attribute_filter)
+        if filter_mask is not None:
+            similarities = np.where(filter_mask, similarities, -np.inf)
+            matching = int(filter_mask.sum())
+        else:
+            matching = len(similarities)
+    
+    with timed("topk"):
+        candidates = _top_candidates(similarities, k)
+    
+    facets = None
+    if facet_min_score is not None:
+        facets = _facets(index, np.flatnonzero(similarities >= facet_min_score),
+                         {"min_score": facet_min_score})
+    
+    return SearchHits(
+        index,
+        candidates.indices.tolist(),
+        candidates.scores.tolist(),
+        total=min(matching, CANDIDATE_POOL_SIZE),
+        facets=facets
+    )
 
 
 def search(
@@ -161,168 +899,273 @@ def search(
     major: Optional[str] = None,
     use_cache: bool = True
 ) -> List[Dict[str, Any]]:
-    """Search for top-k similar faces given a text query."""
-    if not _initialized:
-        initialize()
+    """Search for top-k similar faces given a text query, as result dicts."""
+    return search_hits(query, k, college, year, major, use_cache).to_dicts()
+
+
+def range_search_hits(
+    query: str,
+    min_score: float,
+    limit: int = RANGE_MAX_RESULTS,
+    start: int = 0,
+    college: Optional[str] = None,
+    year: Optional[int] = None,
+    major: Optional[str] = None,
+    attribute_filter: Tuple[str, ...] = ()
+) -> Tuple[SearchHits, Optional[int]]:
+    """
+    Find people scoring at least min_score, in directory order.
     
-    cache_key = _get_cache_key(query, k, college, year, major)
-    if use_cache:
-        cached_results = _get_from_cache(cache_key)
-        if cached_results is not None:
-            return cached_results
-    
-    inputs = _tokenizer(query, padding=True, return_tensors="pt")
-    inputs = {key: val.to(device) for key, val in inputs.items()}
-    
-    with torch.inference_mode():
-        outputs = _model(**inputs)
-    
-    query_vector = outputs.text_embeds.float().cpu().squeeze().numpy()
-    query_norm = query_vector / np.linalg.norm(query_vector)
-    
-    similarities = np.dot(_embeddings_normalized, query_norm)
-    
-    if college or year or major:
-        filter_mask = np.ones(len(_yalies), dtype=bool)
-        for idx, yalie in enumerate(_yalies):
-            if college and yalie.get("college") != college:
-                filter_mask[idx] = False
-            if year and yalie.get("year") != year:
-                filter_mask[idx] = False
-            if major and yalie.get("major") != major:
-                filter_mask[idx] = False
-        
-        filtered_similarities = np.where(filter_mask, similarities, -np.inf)
-        top_indices = np.argsort(filtered_similarities)[::-1][:k]
-    else:
-        top_indices = np.argsort(similarities)[::-1][:k]
+    Scans the embedding matrix from row `start` in blocks of RANGE_BLOCK_ROWS
+    and stops as soon as `limit` matches are found, so a page costs only the
+    blocks it needed. Not cached: every page is one bounded pass.
     
-    results = []
-    for idx in top_indices:
-        if similarities[idx] == -np.inf:
-            continue
-        
-        yalie = _yalies[idx]
-        results.append({
-            "id": yalie.get("id") or yalie.get("netid"),
-            "first_name": yalie.get("first_name", ""),
-            "last_name": yalie.get("last_name", ""),
-            "image": yalie.get("image"),
-            "college": yalie.get("college"),
-            "year": yalie.get("year"),
-            "major": yalie.get("major"),
-            "email": yalie.get("email"),
-            "score": float(similarities[idx])
-        })
+    Returns:
+        (hits, row to resume the scan from for the next page, or None once
+        the scan reached the end)
+    """
+    index = _get_index()
+    rows = len(index.people)
+    score = _block_scorer(index, query)
+    filter_mask = _filter_mask(index, college, year, major, attribute_filter)
     
-    if use_cache:
-        _set_cache(cache_key, results)
+    indices: List[np.ndarray] = []
+    scores: List[np.ndarray] = []
+    found = 0
+    next_row: Optional[int] = None
+    with timed("scoring"):
+        for block_start in range(start, rows, RANGE_BLOCK_ROWS):
+            block_stop = min(block_start + RANGE_BLOCK_ROWS, rows)
+            similarities = score(block_start, block_stop)
+            matches = similarities >= min_score
+            if filter_mask is not None:
+                matches &= filter_mask[block_start:block_stop]
+            
+            matched = np.flatnonzero(matches)[:limit - found]
+            indices.append(matched + block_start)
+            scores.append(similarities[matched])
+            found += len(matched)
+            if found == limit:
+                next_row = block_start + int(matched[-1]) + 1
+                break
+    
+    if next_row is not None and next_row >= rows:
+        next_row = None
     
-    return results
+    indices_all = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+    scores_all = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+    hits = SearchHits(index, indices_all.tolist(), scores_all.tolist(), offset=start)
+    return hits, next_row
 
 
-def find_similar(person_id: str, k: int = 10) -> List[Dict[str, Any]]:
+def find_similar_hits(person_id: str, k: int = 10) -> SearchHits:
     """Find people with similar faces to a given person."""
-    if not _initialized:
-        initialize()
+    index = _get_index()
     
-    # Try to find the person by ID (could be int or string)
-    lookup_id = person_id
-    if person_id not in _yalies_by_id:
-        # Try converting to int (IDs from yalies API are integers)
-        try:
-            lookup_id = int(person_id)
-        except ValueError:
-            pass
+    # Look up by ID (could be int or string)
+    person_idx = index.people.row_of(person_id)
+    if person_idx is None:
+        return SearchHits(index, [], [])
     
-    if lookup_id not in _yalies_by_id:
-        return []
+    person_embedding = index.embeddings_normalized[person_idx]
     
-    person_idx = _yalies_by_id[lookup_id]
-    person_embedding = _embeddings_normalized[person_idx]
+    with timed("scoring"):
+        similarities = np.dot(index.embeddings_normalized, person_embedding)
     
-    similarities = np.dot(_embeddings_normalized, person_embedding)
-    top_indices = np.argsort(similarities)[::-1][:k+1]
+    with timed("topk"):
+        top_indices = np.argsort(similarities)[::-1][:k+1]
+        top_indices = top_indices[top_indices != person_idx][:k]
     
-    results = []
-    for idx in top_indices:
-        if idx == person_idx:
-            continue
-        
-        yalie = _yalies[idx]
-        results.append({
-            "id": yalie.get("id") or yalie.get("netid"),
-            "first_name": yalie.get("first_name", ""),
-            "last_name": yalie.get("last_name", ""),
-            "image": yalie.get("image"),
-            "college": yalie.get("college"),
-            "year": yalie.get("year"),
-            "major": yalie.get("major"),
-            "email": yalie.get("email"),
-            "score": float(similarities[idx])
-        })
-        
-        if len(results) >= k:
-            break
-    
-    return results
+    return _make_hits(index, top_indices, similarities)
+
+
+def find_similar(person_id: str, k: int = 10) -> List[Dict[str, Any]]:
+    """Find people with similar faces to a given person, as result dicts."""
+    return find_similar_hits(person_id, k).to_dicts()
 
 
 def get_person_by_id(person_id: str) -> Optional[Dict[str, Any]]:
     """Get a person's info by their ID."""
-    if not _initialized:
-        initialize()
-    
-    # Try to find the person by ID (could be int or string)
-    lookup_id = person_id
-    if person_id not in _yalies_by_id:
-        try:
-            lookup_id = int(person_id)
-        except ValueError:
-            pass
+    index = _get_index()
     
-    if lookup_id not in _yalies_by_id:
+    # Look up by ID (could be int or string)
+    idx = index.people.row_of(person_id)
+    if idx is None:
         return None
     
-    idx = _yalies_by_id[lookup_id]
-    yalie = _yalies[idx]
+    return index.people.row(idx)
+
+
+def get_person_json(person_id: str) -> Optional[bytes]:
+    """Get a person's info by their ID as pre-serialized JSON."""
+    index = _get_index()
     
-    return {
-        "id": yalie.get("id") or yalie.get("netid"),
-        "first_name": yalie.get("first_name", ""),
-        "last_name": yalie.get("last_name", ""),
-        "image": yalie.get("image"),
-        "college": yalie.get("college"),
-        "year": yalie.get("year"),
-        "major": yalie.get("major"),
-        "email": yalie.get("email"),
-    }
+    idx = index.people.row_of(person_id)
+    if idx is None:
+        return None
+    
+    return index.people.person_json(idx)
 
 
 def get_filter_options() -> Dict[str, List]:
     """Get available filter options."""
-    if not _initialized:
-        initialize()
-    return _filter_options
+    return _get_index().filter_options
 
 
 def get_total_count():
     """Get total number of people in the database."""
-    if not _initialized:
-        initialize()
-    return len(_yalies)
+    return len(_get_index().people)
 
 
 def get_cache_stats() -> Dict[str, Any]:
     """Get cache statistics."""
     return {
         "size": len(_search_cache),
+        "pinned": len(_pinned),
         "max_size": CACHE_MAX_SIZE,
-        "ttl_seconds": CACHE_TTL_SECONDS
+        "bytes": _cache_bytes,
+        "max_bytes": CACHE_MAX_BYTES,
+        "candidate_pool_size": CANDIDATE_POOL_SIZE,
+        "ttl_seconds": CACHE_TTL_SECONDS,
+        "generation": _index.generation if _index is not None else 0
     }
 
 
+def is_cached(query: str, college: Optional[str] = None,
+              year: Optional[int] = None, major: Optional[str] = None,
+              attribute_filter: Tuple[str, ...] = ()) -> bool:
+    """Whether a search can be served from the cache without encoding."""
+    index = _index
+    if index is None:
+        return False
+    
+    cache_key = _get_cache_key(query, college, year, major, attribute_filter)
+    pinned = _pinned.get(cache_key)
+    if pinned is not None and pinned["generation"] == index.generation:
+        return True
+    
+    with _cache_lock:
+        cached = _search_cache.get(cache_key)
+        return (cached is not None and
+                cached["generation"] == index.generation and
+                time.time() - cached["timestamp"] < CACHE_TTL_SECONDS)
+
+
+def get_disk_cache_stats() -> Dict[str, Any]:
+    return disk_cache.get_stats()
+
+
+def get_attribute_stats() -> Dict[str, Any]:
+    """Size and build of the attribute score table, or loaded=False."""
+    index = _index
+    if index is None or index.attributes is None:
+        return {"loaded": False}
+    return dict({"loaded": True}, **index.attributes.stats())
+
+
+def get_lexical_stats() -> Dict[str, Any]:
+    """Size of the name/major index, or enabled=False."""
+    index = _index
+    if index is None or index.lexical is None:
+        return {"enabled": False}
+    return dict({"enabled": True}, **index.lexical.stats())
+
+
 def clear_cache():
-    """Clear the search cache."""
-    global _search_cache
-    _search_cache = {}
+    """Clear the search cache, including pinned results."""
+    global _cache_bytes, _pinned
+    with _cache_lock:
+        _search_cache.clear()
+        _cache_bytes = 0
+        _pinned = {}
+
+
+#-------------------------------------------------------------------------#
+# Warm-up
+#-------------------------------------------------------------------------#
+
+def warm_up(queries: List[str]) -> Dict[str, Any]:
+    """
+    Fill the caches with unfiltered results for the given queries.
+    
+    Queries with rankings in the disk cache are only loaded from it; the rest
+    are encoded and ranked. Failures are logged and skipped.
+    
+    Returns:
+        Dict with the number of queries warmed, failures and seconds taken
+    """
+    index = _get_index()
+    start = time.time()
+    warmed = failed = 0
+    
+    for query in dict.fromkeys(queries):
+        if not canonicalize(query):
+            continue
+        try:
+            _get_candidates(index, query, None, None, None, use_cache=True)
+            warmed += 1
+        except Exception as e:
+            print(f"Warm-up failed for {query!r}: {e}")
+            failed += 1
+    
+    return {"queries": warmed, "failed": failed, "seconds": round(time.time() - start, 3)}
+
+
+def pin_queries(queries: List[str], filter_fields: Tuple[str, ...] = ("college", "year")) -> Dict[str, Any]:
+    """
+    Precompute rankings for queries and make them the pinned cache region.
+    
+    Each query is encoded and scored once; its ranking is then cut for no
+    filter and for every single value of each field in `filter_fields`.
+    Any k up to CANDIDATE_POOL_SIZE is served by slicing, so k isn't part
+    of the key. The previous pinned region is replaced in one step.
+    
+    Args:
+        queries: Queries to pin, most important first
+        filter_fields: Filters to precompute ("college", "year", "major")
+    
+    Returns:
+        Dict with the number of queries and entries pinned and seconds taken
+    """
+    global _pinned
+    
+    index = _get_index()
+    start = time.time()
+    
+    options = {"college": "colleges", "year": "years", "major": "majors"}
+    filter_sets = [{}] + [
+        {field: value}
+        for field in filter_fields
+        for value in index.filter_options[options[field]]
+    ]
+    
+    pinned = {}
+    pinned_queries = 0
+    for query in dict.fromkeys(canonicalize(query) for query in queries):
+        if not query:
+            continue
+        try:
+            similarities = _similarities(index, query)
+        except Exception as e:
+            print(f"Pinning failed for {query!r}: {e}")
+            continue
+        
+        for filters in filter_sets:
+            college, year, major = filters.get("college"), filters.get("year"), filters.get("major")
+            filter_mask = index.people.filter_mask(college, year, major)
+            scores = similarities if filter_mask is None else np.where(filter_mask, similarities, -np.inf)
+            pinned[_get_cache_key(query, college, year, major)] = {
+                "candidates": _rank(index, query, scores),
+                "generation": index.generation
+            }
+        pinned_queries += 1
+    
+    # Don't pin rankings from an index that was replaced while we worked
+    if index is _index:
+        _pinned = pinned
+    
+    return {
+        "queries": pinned_queries,
+        "entries": len(pinned),
+        "seconds": round(time.time() - start, 3)
+    }
@@ -0,0 +1,314 @@
+"""
+Sharding Module
+Scatter-gather search across nodes that each hold a partition of the people.
+
+A shard node is a normal backend started with SHARD_COUNT > 1: it loads only
+the people whose id hashes to its SHARD_INDEX and answers
+POST /internal/shard/search with its own ranked rows for a query vector.
+
+A coordinator is a backend started with SHARD_NODES set. It loads the text
+encoder but no embeddings, encodes each query once, sends the vector to every
+shard, and merges the per-shard rankings by score. Filters are applied on the
+shards. Shards that fail or miss SHARD_TIMEOUT_MS are left out and the
+response is marked partial.
+
+Try it locally with tools/run_shards.py.
+"""
+
+import os
+import heapq
+import json
+import zlib
+import base64
+import asyncio
+import collections
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import httpx
+
+from metrics import Counter, timed
+from responses import dumps
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+# Shard node: which partition of the people this process loads
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "1"))
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX", "0"))
+
+# Coordinator: comma-separated shard base URLs, e.g. http://10.0.0.5:8000
+SHARD_NODES = [url.strip().rstrip("/") for url in os.environ.get("SHARD_NODES", "").split(",") if url.strip()]
+
+# Per-request deadline for the whole fan-out
+SHARD_TIMEOUT_MS = float(os.environ.get("SHARD_TIMEOUT_MS", "500"))
+
+# Shared secret the coordinator sends and shard nodes require (shard nodes
+# refuse to start without it)
+SHARD_TOKEN = os.environ.get("SHARD_TOKEN")
+
+SHARD_FAILURES = Counter(
+    "yaliesearch_shard_failures_total",
+    "Shard requests that failed or missed the deadline",
+    labels=("shard", "reason")
+)
+
+
+def is_shard_node() -> bool:
+    return SHARD_COUNT > 1
+
+
+def is_coordinator() -> bool:
+    return bool(SHARD_NODES)
+
+
+def shard_of(person_id: Any, count: int = SHARD_COUNT) -> int:
+    """Partition a person belongs to (stable across processes and restarts)."""
+    return zlib.crc32(str(person_id).encode()) % count
+
+
+def owns(person_id: Any) -> bool:
+    """Whether this node's partition includes a person."""
+    return SHARD_COUNT <= 1 or shard_of(person_id) == SHARD_INDEX
+
+
+def shard_tag() -> str:
+    """Suffix keeping this partition's shared index and cache keys separate."""
+    return f"-shard{SHARD_INDEX}of{SHARD_COUNT}" if is_shard_node() else ""
+
+
+def encode_vector(vector: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+
+
+def decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+
+#-------------------------------------------------------------------------#
+# Coordinator
+#-------------------------------------------------------------------------#
+
+class ShardUnavailable(Exception):
+    """No shard answered in time."""
+
+
+class ShardedHits:
+    """
+    Merged page of results from the shards, with the same interface main.py
+    uses on search.SearchHits.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], offset: int, total: int,
+                 missing_shards: List[int], facets: Optional[Dict[str, Any]] = None):
+        self.rows = rows
+        self.offset = offset
+        self.total = total
+        self.missing_shards = missing_shards
+        self.facets = facets
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def has_more(self) -> bool:
+        return self.offset + len(self.rows) < self.total
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.missing_shards)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return self.rows
+
+    def to_json(self) -> bytes:
+        return dumps(self.rows)
+
+
+def _ordered(counts: Dict[str, int]) -> Dict[str, int]:
+    return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+
+def _count_facets(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """Facet counts of merged result rows, in PersonTable.facet_counts' format."""
+    colleges, years, majors = collections.Counter(), collections.Counter(), collections.Counter()
+    for row in rows:
+        if row.get("college"):
+            colleges[row["college"]] += 1
+        if row.get("year"):
+            years[str(row["year"])] += 1
+        if row.get("major"):
+            majors[row["major"]] += 1
+    return {"colleges": _ordered(colleges), "years": _ordered(years), "majors": _ordered(majors)}
+
+
+def _sum_facets(facets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Add up the shards' threshold facet counts."""
+    merged: Dict[str, Any] = {"count": sum(f["count"] for f in facets)}
+    for name in ("colleges", "years", "majors"):
+        total = collections.Counter()
+        for f in facets:
+            total.update(f[name])
+        merged[name] = _ordered(total)
+    return merged
+
+
+class ShardCoordinator:
+    """Fans queries out to the shard nodes over one pooled HTTP client."""
+
+    def __init__(self, nodes: List[str], timeout_ms: float = SHARD_TIMEOUT_MS,
+                 token: Optional[str] = SHARD_TOKEN,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.nodes = nodes
+        self.timeout = timeout_ms / 1000
+        self.client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(self.timeout),
+            headers={"X-Shard-Token": token} if token else None,
+            limits=httpx.Limits(max_keepalive_connections=8 * len(nodes))
+        )
+        # Last generation reported by each shard
+        self.generations: Dict[int, int] = {}
+    
+    async def close(self):
+        await self.client.aclose()
+    
+    async def _call(self, shard: int, path: str, payload: Optional[dict]) -> dict:
+        url = self.nodes[shard] + path
+        if payload is None:
+            response = await self.client.get(url)
+        else:
+            response = await self.client.post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
+    
+    async def _gather(self, path: str, payload: Optional[dict] = None) -> Tuple[Dict[int, dict], List[int]]:
+        """
+        Call every shard, waiting at most the timeout.
+        
+        Returns:
+            (shard -> response body for those that answered, missing shards)
+        """
+        tasks = {
+            asyncio.ensure_future(self._call(shard, path, payload)): shard
+            for shard in range(len(self.nodes))
+        }
+        done, pending = await asyncio.wait(tasks, timeout=self.timeout)
+        for task in pending:
+            task.cancel()
+            SHARD_FAILURES.inc(shard=str(tasks[task]), reason="timeout")
+        
+        answers, missing = {}, [tasks[task] for task in pending]
+        for task in done:
+            shard = tasks[task]
+            if task.exception() is not None:
+                print(f"Shard {shard} failed: {task.exception()!r}")
+                SHARD_FAILURES.inc(shard=str(shard), reason="error")
+                missing.append(shard)
+            else:
+                answers[shard] = task.result()
+                self.generations[shard] = answers[shard].get("generation", 0)
+        
+        if not answers:
+            raise ShardUnavailable(f"No shard answered within {self.timeout * 1000:.0f}ms")
+        return answers, sorted(missing)
+    
+    async def search(self, query_norm: np.ndarray, k: int, college: Optional[str] = None,
+                     year: Optional[int] = None, major: Optional[str] = None,
+                     attributes: Tuple[str, ...] = (), offset: int = 0,
+                     pool_size: int = 500, facet_top: Optional[int] = None,
+                     facet_min_score: Optional[float] = None) -> ShardedHits:
+        """
+        Rank results offset..offset+k across all shards.
+        
+        Each shard returns its own top offset+k, which is enough to fill the
+        page exactly. total is capped at pool_size like a local search.
+        
+        Facets over the top facet_top are counted from the merged ranking
+        (each shard then returns its top facet_top too); threshold facets are
+        counted by each shard and added up.
+        """
+        fetch = max(offset + k, facet_top or 0)
+        with timed("shards"):
+            answers, missing = await self._gather("/internal/shard/search", {
+                "vector": encode_vector(query_norm),
+                "k": fetch,
+                "college": college,
+                "year": year,
+                "major": major,
+                "attributes": list(attributes),
+                "facet_min_score": facet_min_score,
+            })
+        
+        with timed("merge"):
+            ranked = heapq.merge(
+                *(answer["results"] for answer in answers.values()),
+                key=lambda row: row["score"],
+                reverse=True
+            )
+            merged = [row for _, row in zip(range(fetch), ranked)]
+            rows = merged[offset:offset + k]
+        
+        facets = None
+        if facet_top is not None:
+            top = merged[:facet_top]
+            facets = dict({"top": facet_top, "count": len(top)}, **_count_facets(top))
+        elif facet_min_score is not None:
+            facets = dict({"min_score": facet_min_score},
+                          **_sum_facets([answer["facets"] for answer in answers.values()]))
+        
+        total = min(sum(answer["total"] for answer in answers.values()), pool_size)
+        return ShardedHits(rows, offset, total, missing, facets)
+    
+    async def filter_options(self) -> Tuple[Dict[str, List], List[int]]:
+        """Union of the shards' filter options."""
+        answers, missing = await self._gather("/internal/shard/info")
+        colleges, years, majors, attributes = set(), set(), set(), set()
+        for answer in answers.values():
+            options = answer["filter_options"]
+            colleges.update(options["colleges"])
+            years.update(options["years"])
+            majors.update(options["majors"])
+            attributes.update(options.get("attributes", ()))
+        
+        merged = {
+            "colleges": sorted(colleges),
+            "years": sorted(years, reverse=True),
+            "majors": sorted(majors),
+        }
+        if attributes:
+            merged["attributes"] = sorted(attributes)
+        return merged, missing
+
+    def generation(self) -> str:
+        """Changes whenever any shard reloads its data."""
+        return json.dumps(sorted(self.generations.items()))
+
+
+_coordinator: Optional[ShardCoordinator] = None
+
+
+async def start_coordinator(transport: Optional[httpx.AsyncBaseTransport] = None):
+    """
+    Open the shard client if SHARD_NODES is set (called from the app lifespan).
+    
+    `transport` lets tests route requests to in-process shard apps.
+    """
+    global _coordinator
+    
+    await close_coordinator()
+    if is_coordinator():
+        _coordinator = ShardCoordinator(SHARD_NODES, transport=transport)
+        print(f"Coordinating {len(SHARD_NODES)} shards")
+
+
+async def close_coordinator():
+    global _coordinator
+    
+    if _coordinator is not None:
+        await _coordinator.close()
+        _coordinator = None
+
+
+def get_coordinator() -> Optional[ShardCoordinator]:
+    return _coordinator
@@ -0,0 +1,202 @@
+"""
+Shared Index Module
+Publishes the normalized embedding matrix and person metadata columns to
+memory-mapped files so several uvicorn workers can attach to one copy instead
+of each parsing the embeddings JSON and holding its own matrix.
+
+Besides the matrix, the numeric columns, the per-person strings and their
+pre-serialized JSON fragments are mapped (see people.PackedBytes). Each worker
+still builds its own id lookup, lexical index and college/major tables.
+
+The first worker to start takes a file lock, builds the index and writes it out;
+every other worker maps the same files read-only. Pages live in the OS page
+cache and are shared between processes. Point SHARED_INDEX_DIR at /dev/shm to
+keep them in RAM.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from typing import Any, Callable, Dict, List, Tuple
+from pathlib import Path
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows - single worker only
+    fcntl = None
+
+#-------------------------------------------------------------------------#
+# Configuration
+#-------------------------------------------------------------------------#
+
+# Shared mode is enabled by setting this to a writable directory
+SHARED_INDEX_DIR = os.environ.get("SHARED_INDEX_DIR")
+
+MATRIX_FILE = "embeddings.npy"
+STRINGS_FILE = "strings.json"
+COMPLETE_MARKER = "COMPLETE"
+LOCK_FILE = ".lock"
+
+# Written to the marker; an index published with another layout is rebuilt
+LAYOUT_VERSION = "2"
+
+
+def is_enabled() -> bool:
+    """Whether shared-memory serving is turned on."""
+    return bool(SHARED_INDEX_DIR)
+
+
+#-------------------------------------------------------------------------#
+# Fingerprinting
+#-------------------------------------------------------------------------#
+
+def fingerprint_file(path: str) -> str:
+    """
+    Content hash of an embeddings file.
+    
+    Used to name the published index so workers only attach to data built
+    from the exact same source file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+#-------------------------------------------------------------------------#
+# Publish / Attach
+#-------------------------------------------------------------------------#
+
+def _publish(target: Path, embeddings_normalized: np.ndarray,
+             arrays: Dict[str, np.ndarray], strings: Dict[str, List]):
+    """Write the matrix and metadata columns to a temp dir and move it into place."""
+    tmp = target.with_name(target.name + f".tmp-{os.getpid()}")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    
+    np.save(tmp / MATRIX_FILE, np.ascontiguousarray(embeddings_normalized, dtype=np.float32))
+    for name, array in arrays.items():
+        np.save(tmp / f"{name}.npy", np.ascontiguousarray(array))
+    with open(tmp / STRINGS_FILE, 'w') as f:
+        json.dump(strings, f)
+    (tmp / COMPLETE_MARKER).write_text(LAYOUT_VERSION)
+    
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(tmp, target)
+
+
+def _is_complete(target: Path) -> bool:
+    """Whether target holds a fully written index in the current layout."""
+    try:
+        return (target / COMPLETE_MARKER).read_text() == LAYOUT_VERSION
+    except OSError:
+        return False
+
+
+def _remove_stale(root: Path, keep: str, tag: str = ""):
+    """
+    Remove previously published versions with the same tag.
+    
+    Workers still attached to an old version keep their mappings - unlinked
+    files stay readable until the last mapping is closed.
+    """
+    for entry in root.iterdir():
+        # Names are a 16-character content hash followed by the tag
+        if entry.is_dir() and entry.name != keep and entry.name[16:] == tag:
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _attach(target: Path) -> Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, List]]:
+    """Map a published index read-only (zero-copy for the numeric arrays)."""
+    embeddings_normalized = np.load(target / MATRIX_FILE, mmap_mode='r')
+    arrays = {
+        entry.stem: np.load(entry, mmap_mode='r')
+        for entry in target.glob("*.npy")
+        if entry.name != MATRIX_FILE
+    }
+    with open(target / STRINGS_FILE, 'r') as f:
+        strings = json.load(f)
+    return embeddings_normalized, arrays, strings
+
+
+def load_or_publish(
+    source_path: str,
+    build: Callable[[], Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, List]]],
+    tag: str = ""
+) -> Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, List], str]:
+    """
+    Attach to the shared index for a source file, publishing it first if needed.
+    
+    Args:
+        source_path: Embeddings JSON the index is built from
+        build: Callback returning (normalized matrix, numeric columns,
+            string columns); only called by the one worker that publishes
+        tag: Appended to the fingerprint when the same file is built into
+            different indexes (e.g. one per shard)
+    
+    Returns:
+        Tuple of (memory-mapped matrix, memory-mapped numeric columns,
+        string columns, fingerprint)
+    """
+    root = Path(SHARED_INDEX_DIR)
+    root.mkdir(parents=True, exist_ok=True)
+    
+    fingerprint = fingerprint_file(source_path) + tag
+    target = root / fingerprint
+    
+    with open(root / LOCK_FILE, 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not _is_complete(target):
+                print(f"Publishing shared index {fingerprint} to {root}...")
+                embeddings_normalized, arrays, strings = build()
+                _publish(target, embeddings_normalized, arrays, strings)
+                _remove_stale(root, keep=fingerprint, tag=tag)
+            else:
+                print(f"Attaching to shared index {fingerprint} in {root}")
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    embeddings_normalized, arrays, strings = _attach(target)
+    return embeddings_normalized, arrays, strings, fingerprint
+
+
+#-------------------------------------------------------------------------#
+# Memory Reporting
+#-------------------------------------------------------------------------#
+
+def get_memory_stats() -> Dict[str, Any]:
+    """
+    Memory usage of this worker process in MB.
+    
+    rss counts shared pages in every process that maps them, so pss (RSS with
+    shared pages split between their users) is the number to sum across
+    workers. Only available on Linux; other platforms report max_rss.
+    """
+    stats: Dict[str, Any] = {"pid": os.getpid()}
+    
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile", "RssShmem"):
+                    stats[key.lower().replace("vm", "")] = round(int(value.split()[0]) / 1024, 1)
+        with open("/proc/self/smaps_rollup", 'r') as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    stats["pss"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, KB on Linux
+        divisor = 1024 * 1024 if os.uname().sysname == "Darwin" else 1024
+        stats["max_rss"] = round(max_rss / divisor, 1)
+    
+    return stats
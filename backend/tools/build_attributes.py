@@ -0,0 +1,70 @@
+"""
+Build Attribute Scores
+Offline job that encodes the attribute vocabulary and stores every person's
+similarity to each attribute (see attributes.py).
+
+Loads the model and the embeddings exactly as the server would (same
+EMBEDDINGS_PATH, and on a shard node the same SHARD_COUNT/SHARD_INDEX), so
+the table matches what the server loads. Rerun it whenever the embeddings
+file or the vocabulary changes; servers pick the new table up on their next
+start or reload.
+
+Usage (from backend/):
+    python tools/build_attributes.py [--vocabulary attributes.json]
+        [--percentile 80] [--out persistent/attributes.npz]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attributes
+import encoder
+import search
+import sharding
+import shared_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--vocabulary", default=attributes.ATTRIBUTE_VOCABULARY_PATH,
+                        help="JSON list of attribute prompts (default: built-in vocabulary)")
+    parser.add_argument("--percentile", type=float, default=attributes.ATTRIBUTE_PERCENTILE,
+                        help="Column percentile a person must reach to have an attribute")
+    parser.add_argument("--out", default=attributes.ATTRIBUTE_SCORES_PATH)
+    args = parser.parse_args()
+    
+    attributes.ATTRIBUTE_VOCABULARY_PATH = args.vocabulary
+    vocabulary = attributes.load_vocabulary()
+    
+    start = time.time()
+    encoder.load_model()
+    index = search._build_index(search.EMBEDDINGS_PATH, generation=1)
+    # Same fingerprint the server computes for this file and shard
+    fingerprint = index.fingerprint or shared_index.fingerprint_file(search.EMBEDDINGS_PATH) + sharding.shard_tag()
+    
+    table = attributes.build(
+        index.embeddings_normalized,
+        vocabulary,
+        encoder.encode_texts,
+        percentile=args.percentile,
+        fingerprint=fingerprint,
+        model=encoder.model_id()
+    )
+    attributes.save(table, args.out)
+    
+    print(json.dumps({
+        "path": args.out,
+        "people": len(index.people),
+        "attributes": len(table),
+        "bytes": os.path.getsize(args.out),
+        "seconds": round(time.time() - start, 2),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Canonicalization Report
+Replays a recorded query log through LRU caches keyed by different query
+normalizations and reports the hit rate of each.
+
+Accepted logs:
+    - search_analytics.json (queries are stored lowercased, so "raw" and
+      "lower_strip" coincide)
+    - profile dumps (*.jsonl from /api/admin/profiles/dump), using params.q
+    - plain text, one query per line
+
+Usage (from backend/):
+    python tools/canonical_report.py queries.txt [--sizes 64,256,1024]
+
+Prints one JSON object with, per cache size, the hit rate of each key and the
+number of distinct keys in the log.
+"""
+
+import os
+import sys
+import json
+import argparse
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import canonical
+from canonical import canonicalize
+
+
+def _with_synonyms(query: str) -> str:
+    words = canonicalize(query, synonyms=False).split()
+    return " ".join(canonical.DEFAULT_SYNONYMS.get(word, word) for word in words)
+
+
+KEYS: Dict[str, Callable[[str], str]] = {
+    "raw": lambda query: query,
+    "lower_strip": lambda query: query.lower().strip(),
+    "canonical": lambda query: canonicalize(query, synonyms=False),
+    "canonical_synonyms": _with_synonyms,
+}
+
+
+def load_queries(path: str) -> List[str]:
+    """Queries from an analytics file, a profile dump or a text file, in order."""
+    with open(path) as f:
+        text = f.read()
+    
+    if path.endswith(".json"):
+        searches = json.loads(text).get("searches", [])
+        return [entry["query"] for entry in searches if entry.get("query")]
+    
+    if path.endswith(".jsonl"):
+        queries = []
+        for line in text.splitlines():
+            if line.strip():
+                query = json.loads(line).get("params", {}).get("q")
+                if query:
+                    queries.append(query)
+        return queries
+    
+    return [line for line in text.splitlines() if line.strip()]
+
+
+def hit_rate(keys: List[str], size: int) -> float:
+    """Hit rate of an LRU of `size` entries over a key stream."""
+    cache: "OrderedDict[str, None]" = OrderedDict()
+    hits = 0
+    for key in keys:
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+        else:
+            cache[key] = None
+            if len(cache) > size:
+                cache.popitem(last=False)
+    return hits / len(keys) if keys else 0.0
+
+
+def report(queries: List[str], sizes: List[int]) -> dict:
+    streams = {name: [key(query) for query in queries] for name, key in KEYS.items()}
+    return {
+        "queries": len(queries),
+        "distinct": {name: len(set(keys)) for name, keys in streams.items()},
+        "hit_rate": {
+            str(size): {name: round(hit_rate(keys, size), 4) for name, keys in streams.items()}
+            for size in sizes
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("log", help="Query log to replay")
+    parser.add_argument("--sizes", default="64,256,1024,4096",
+                        help="Comma-separated cache sizes")
+    args = parser.parse_args()
+    
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(json.dumps(report(load_queries(args.log), sizes), indent=2))
+
+
+if __name__ == "__main__":
+    main()
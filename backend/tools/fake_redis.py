@@ -0,0 +1,140 @@
+"""
+Fake Redis Server
+In-memory server speaking enough of the Redis protocol for the redis cache
+backend: PING, AUTH, SELECT, GET, SET (with EX/PX), DEL, EXISTS, SCAN, DBSIZE
+and FLUSHDB. Expiry is lazy, databases are ignored and nothing is persisted.
+
+Usage (from backend/):
+    python tools/fake_redis.py [--port 6390]
+    SHARED_CACHE_URL=redis://localhost:6390/0 uvicorn main:app --workers 4
+
+In tests, start() runs it on a background thread; connect to server.port.
+"""
+
+import time
+import fnmatch
+import argparse
+import threading
+import socketserver
+from typing import Dict, Optional, Tuple
+
+
+class _Store:
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] < time.time():
+            del self.data[key]
+            return None
+        return entry[0]
+
+
+def _encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return b"-ERR %s\r\n" % str(reply).encode()
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(_encode(item) for item in reply)
+
+
+def _execute(store: _Store, args: list):
+    command = args[0].upper()
+    with store.lock:
+        if command in (b"PING", b"AUTH", b"SELECT"):
+            return "PONG" if command == b"PING" else "OK"
+        if command == b"GET":
+            return store.get(args[1])
+        if command == b"SET":
+            expires = None
+            options = [arg.upper() for arg in args[3:]]
+            if b"EX" in options:
+                expires = time.time() + float(args[3 + options.index(b"EX") + 1])
+            if b"PX" in options:
+                expires = time.time() + float(args[3 + options.index(b"PX") + 1]) / 1000
+            store.data[args[1]] = (args[2], expires)
+            return "OK"
+        if command == b"DEL":
+            return sum(store.data.pop(key, None) is not None for key in args[1:])
+        if command == b"EXISTS":
+            return sum(store.get(key) is not None for key in args[1:])
+        if command == b"SCAN":
+            # Single pass: everything matching, cursor back to 0
+            pattern = b"*"
+            if b"MATCH" in [arg.upper() for arg in args]:
+                pattern = args[[arg.upper() for arg in args].index(b"MATCH") + 1]
+            keys = [key for key in list(store.data) if store.get(key) is not None
+                    and fnmatch.fnmatchcase(key.decode(), pattern.decode())]
+            return [b"0", keys]
+        if command == b"DBSIZE":
+            return len(store.data)
+        if command == b"FLUSHDB":
+            store.data.clear()
+            return "OK"
+    return ValueError(f"unknown command '{command.decode()}'")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if not line.startswith(b"*"):
+                self.wfile.write(_encode(ValueError("inline commands not supported")))
+                continue
+            
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            try:
+                reply = _execute(self.server.store, args)
+            except (IndexError, ValueError) as e:
+                reply = e
+            self.wfile.write(_encode(reply))
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+def start(port: int = 0) -> FakeRedisServer:
+    """Run a fake server on a daemon thread. Use server.port and server.shutdown()."""
+    server = FakeRedisServer(port=port)
+    threading.Thread(target=server.serve_forever, name="fake-redis", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    
+    server = FakeRedisServer(args.host, args.port)
+    print(f"Fake Redis listening on {args.host}:{server.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Fusion Check
+Checks that lexical fusion leaves visual queries alone: ranks each query with
+and without the name/major matches fused in and reports every query whose
+top k changes.
+
+Usage (from backend/):
+    python tools/fusion_check.py [--k 20] [--queries queries.txt]
+    python tools/fusion_check.py --synthetic 10000 --dim 64
+
+Uses EMBEDDINGS_PATH and CLIP unless --synthetic is given. The synthetic
+directory includes namesakes of common descriptive words (Hatch, Baldwin,
+Beardsley, Glass, ...), so prefix or typo matching would show up here.
+Prints one JSON object and exits with status 1 if any top k changed.
+"""
+
+import os
+import sys
+import json
+import argparse
+import contextlib
+from typing import List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+# Must be set before the app modules read their configuration
+os.environ["LEXICAL_SEARCH"] = "true"
+os.environ.setdefault("DISK_CACHE_ENABLED", "false")
+
+VISUAL_QUERIES = [
+    "hat", "bald", "beard", "glasses", "curly hair", "red hair", "blonde",
+    "smiling", "freckles", "earrings", "tall", "long hair", "serious",
+]
+
+# Last names close to the queries above (prefix or typo distance)
+NAMESAKES = ["Hatch", "Baldwin", "Beardsley", "Glass", "Curley", "Redd", "Blondell",
+             "Smiley", "Freckleton", "Earring", "Talley", "Longhair", "Serio"]
+
+
+def install_synthetic(n: int, dim: int):
+    """Load a synthetic directory in which every tenth person has a namesake surname."""
+    import search
+    from people import PersonTable
+    from synthetic import StubEncoder, make_embeddings
+    from bench_serialization import make_people
+    
+    records = make_people(n).rows(list(range(n)))
+    for i, record in enumerate(records[::10]):
+        record["last_name"] = NAMESAKES[i % len(NAMESAKES)]
+    search.set_text_encoder(StubEncoder(dim))
+    search.load_index(make_embeddings(n, dim), PersonTable.from_records(records),
+                      source_path=f"<synthetic {n} with namesakes>")
+
+
+def check(queries: List[str], k: int) -> dict:
+    import search
+    
+    index = search._get_index()
+    fused = {query: search.search_hits(query, k=k, use_cache=False).indices for query in queries}
+    
+    # The same snapshot without its lexical index ranks by the vectors alone
+    lexical_index, index.lexical = index.lexical, None
+    try:
+        vector = {query: search.search_hits(query, k=k, use_cache=False).indices for query in queries}
+    finally:
+        index.lexical = lexical_index
+    
+    return {
+        "people": len(index.people),
+        "k": k,
+        "queries": len(queries),
+        "changed": [query for query in queries if fused[query] != vector[query]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--queries", help="Text file with one query per line (default: built-in visual queries)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use a synthetic directory of this many people")
+    parser.add_argument("--dim", type=int, default=64, help="Embedding dimension of the synthetic directory")
+    args = parser.parse_args()
+    
+    queries = VISUAL_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    
+    # Keep stdout machine-readable; module logging goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.synthetic:
+            install_synthetic(args.synthetic, args.dim)
+        else:
+            import search
+            search.initialize()
+        result = check(queries, args.k)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["changed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Local Shard Runner
+Starts a sharded deployment on one machine: SHARD_COUNT shard nodes, each
+loading its partition of the embeddings file, plus a coordinator fanning
+searches out to them. Every process is a normal uvicorn server running
+main:app; only the environment differs.
+
+Usage (from backend/):
+    python tools/run_shards.py --shards 4 [--embeddings yalie_embedding.json]
+    python tools/run_shards.py --shards 4 --synthetic 100000 --stub-encoder
+
+The coordinator listens on --port (default 8000) and shard i on
+--port + 1 + i. --synthetic writes a synthetic embeddings file first, and
+--stub-encoder swaps CLIP for the benchmarks' stub encoder in every process
+(its dimension must match the embeddings). Ctrl-C stops everything.
+"""
+
+import os
+import sys
+import time
+import argparse
+import secrets
+import tempfile
+import subprocess
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+
+def _serve(port: int, stub_dim: int):
+    """Run main:app in this process (the entry point of each child)."""
+    import uvicorn
+    
+    if stub_dim:
+        from synthetic import StubEncoder
+        import search
+        search.set_text_encoder(StubEncoder(stub_dim))
+    
+    from main import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _spawn(port: int, env: Dict[str, str], stub_dim: int) -> subprocess.Popen:
+    command = [sys.executable, os.path.abspath(__file__), "--serve", str(port),
+               "--stub-dim", str(stub_dim)]
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env={**os.environ, **env})
+
+
+def start(shards: int, port: int, embeddings: str, stub_dim: int = 0,
+          timeout_ms: float = 500) -> List[subprocess.Popen]:
+    """
+    Start the shard nodes and the coordinator.
+    
+    Returns:
+        The processes, coordinator last
+    """
+    # Shards share the embeddings file and a fresh shard token, but not the
+    # disk cache or warm-up
+    common = {"EMBEDDINGS_PATH": embeddings, "WARMUP_QUERIES": "0", "PINNED_QUERIES": "0",
+              "SHARD_TOKEN": os.environ.get("SHARD_TOKEN") or secrets.token_hex(16)}
+    processes = []
+    nodes = []
+    for i in range(shards):
+        shard_port = port + 1 + i
+        processes.append(_spawn(shard_port, {
+            **common,
+            "SHARD_COUNT": str(shards),
+            "SHARD_INDEX": str(i),
+            "DISK_CACHE_PATH": os.path.join(tempfile.gettempdir(), f"yaliesearch_shard{i}.db"),
+        }, stub_dim))
+        nodes.append(f"http://127.0.0.1:{shard_port}")
+    
+    processes.append(_spawn(port, {
+        **common,
+        "SHARD_NODES": ",".join(nodes),
+        "SHARD_TIMEOUT_MS": str(timeout_ms),
+    }, stub_dim))
+    return processes
+
+
+def stop(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--embeddings", default=os.environ.get("EMBEDDINGS_PATH"),
+                        help="Embeddings file every shard loads its partition of")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Generate a synthetic embeddings file with this many people")
+    parser.add_argument("--dim", type=int, default=768, help="Synthetic embedding dimension")
+    parser.add_argument("--stub-encoder", action="store_true", help="Use the stub text encoder")
+    parser.add_argument("--timeout-ms", type=float, default=500)
+    # Internal: run one server process
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--stub-dim", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.serve:
+        _serve(args.serve, args.stub_dim)
+        return
+    
+    embeddings = args.embeddings
+    if args.synthetic:
+        from synthetic import write_embeddings_file
+        embeddings = os.path.join(tempfile.gettempdir(), f"yaliesearch_synthetic_{args.synthetic}.json")
+        if not os.path.exists(embeddings):
+            print(f"Writing {args.synthetic} synthetic people to {embeddings}...")
+            write_embeddings_file(embeddings, args.synthetic, args.dim)
+    if not embeddings:
+        parser.error("no embeddings file (pass --embeddings, --synthetic or set EMBEDDINGS_PATH)")
+    
+    processes = start(args.shards, args.port, os.path.abspath(embeddings),
+                      args.dim if args.stub_encoder else 0, args.timeout_ms)
+    print(f"Coordinator on http://127.0.0.1:{args.port}, "
+          f"shards on ports {args.port + 1}-{args.port + args.shards}")
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+        print("A server exited; stopping the rest")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Stub CAS Server
+Minimal stand-in for Yale CAS for local login testing and login-burst load
+tests.
+
+/login redirects straight back to the service with a ticket for the netid
+given as ?netid= (default "abc123"). /serviceValidate answers with the same
+CAS 2.0/3.0 XML as the real server; tickets are single-use and must be
+validated for the service they were issued to. Tickets of the form
+ST-load-<netid>-<anything> are always accepted so load tests can skip the
+login redirect.
+
+Usage (from backend/):
+    python tools/stub_cas.py [--port 8900] [--delay-ms 50]
+    CAS_SERVER=http://localhost:8900/cas uvicorn main:app
+
+In tests, create_app() can be mounted in-process with httpx.ASGITransport
+and passed to auth.start_cas_client().
+"""
+
+import asyncio
+import secrets
+import argparse
+from xml.sax.saxutils import escape
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, RedirectResponse, Response
+from starlette.routing import Route
+
+SUCCESS_XML = """<cas:serviceResponse xmlns:cas="http://www.yale.edu/tp/cas">
+    <cas:authenticationSuccess>
+        <cas:user>{netid}</cas:user>
+    </cas:authenticationSuccess>
+</cas:serviceResponse>"""
+
+FAILURE_XML = """<cas:serviceResponse xmlns:cas="http://www.yale.edu/tp/cas">
+    <cas:authenticationFailure code="{code}">{message}</cas:authenticationFailure>
+</cas:serviceResponse>"""
+
+
+def create_app(delay_ms: float = 0.0) -> Starlette:
+    """Build the stub CAS app. `delay_ms` simulates a slow CAS on validation."""
+    # ticket -> (netid, service)
+    tickets = {}
+    
+    async def login(request: Request):
+        service = request.query_params.get("service")
+        if not service:
+            return PlainTextResponse("Missing service", status_code=400)
+        netid = request.query_params.get("netid", "abc123")
+        ticket = f"ST-{secrets.token_hex(8)}"
+        tickets[ticket] = (netid, service)
+        separator = "&" if "?" in service else "?"
+        return RedirectResponse(f"{service}{separator}ticket={ticket}")
+    
+    async def service_validate(request: Request):
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        
+        ticket = request.query_params.get("ticket", "")
+        service = request.query_params.get("service", "")
+        
+        if ticket.startswith("ST-load-"):
+            netid = ticket[len("ST-load-"):].split("-")[0]
+            issued = (netid, service)
+        else:
+            issued = tickets.pop(ticket, None)
+        
+        if issued is None:
+            body = FAILURE_XML.format(code="INVALID_TICKET", message=f"Ticket {escape(ticket)} not recognized")
+        elif issued[1] != service:
+            body = FAILURE_XML.format(code="INVALID_SERVICE", message="Ticket was issued for another service")
+        else:
+            body = SUCCESS_XML.format(netid=escape(issued[0]))
+        return Response(body, media_type="application/xml")
+    
+    async def logout(request: Request):
+        service = request.query_params.get("service")
+        if service:
+            return RedirectResponse(service)
+        return PlainTextResponse("Logged out")
+    
+    return Starlette(routes=[
+        Route("/cas/login", login),
+        Route("/cas/serviceValidate", service_validate),
+        Route("/cas/p3/serviceValidate", service_validate),
+        Route("/cas/logout", logout),
+    ])
+
+
+def main():
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--delay-ms", type=float, default=0.0,
+                        help="Simulated validation latency")
+    args = parser.parse_args()
+    
+    uvicorn.run(create_app(args.delay_ms), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()